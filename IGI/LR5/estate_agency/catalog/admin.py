@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import PropertyService, Property, Transaction, ServiceType, PropertyInquiry
+from .models import PropertyService, Property, Transaction, ServiceType, PropertyInquiry, GeocodedAddress
 
 
 class PropertyInline(admin.TabularInline):
@@ -27,8 +27,15 @@ class PropertyServiceAdmin(admin.ModelAdmin):
 
 @admin.register(Property)
 class PropertyAdmin(admin.ModelAdmin):
-    list_display = ["location", "price", "property_type", "transaction"]
-    list_filter = ["property_type", "property_type__service_type"]
+    list_display = ["location", "price", "property_type", "is_available"]
+    list_filter = ["is_available", "property_type", "property_type__service_type"]
+
+
+@admin.register(GeocodedAddress)
+class GeocodedAddressAdmin(admin.ModelAdmin):
+    list_display = ["address", "longitude", "latitude", "found", "updated_at"]
+    list_filter = ["found"]
+    search_fields = ["address"]
 
 
 @admin.register(PropertyInquiry)
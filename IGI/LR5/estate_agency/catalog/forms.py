@@ -1,4 +1,7 @@
+from datetime import timedelta
+
 from django import forms
+from django.utils import timezone
 import logging
 
 from .models import PropertyInquiry, PropertyType
@@ -29,3 +32,31 @@ class PropertyForm(forms.ModelForm):
                 'placeholder': 'Опишите тип недвижимости...'
             }),
         }
+
+class StatisticsPeriodForm(forms.Form):
+    PERIODS = [
+        ('', 'По умолчанию'),
+        ('7', 'Последние 7 дней'),
+        ('30', 'Последние 30 дней'),
+        ('365', 'Последний год'),
+    ]
+
+    period = forms.ChoiceField(choices=PERIODS, required=False, label='Период')
+    start = forms.DateField(required=False, label='С', widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(required=False, label='По', widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError('Начало периода позже его конца')
+        return cleaned_data
+
+    def get_range(self):
+        """(start, end) dates of the chosen period, (None, None) for the default one"""
+        if not self.is_valid():
+            return None, None
+        if self.cleaned_data['period']:
+            end = timezone.localdate()
+            return end - timedelta(days=int(self.cleaned_data['period']) - 1), end
+        return self.cleaned_data['start'], self.cleaned_data['end']
@@ -0,0 +1,164 @@
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from catalog.models import Property, PropertyInquiry, PropertyService, ServiceType
+from catalog.utils.assignment import STRATEGIES, invalidate_strategies
+from users.models import Client, CustomUser, Employee
+
+SPECIALIZATIONS = ['Аренда', 'Продажа', 'Коммерческая', 'Загородная']
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает стратегии назначения заявок агентам: пропускная способность и равномерность'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strategies', nargs='+', choices=sorted(STRATEGIES), default=sorted(STRATEGIES))
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--inquiries', type=int, default=400)
+        parser.add_argument('--agents', type=int, default=10)
+        parser.add_argument('--duplicates', type=float, default=0.2, help='Доля повторных отправок')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Worker threads need committed rows, so the data is removed afterwards
+        # instead of being rolled back
+        prefix = f'benchmark_{int(time.time())}_'
+        try:
+            agents, submissions = self.create_rows(prefix, options)
+            for strategy in options['strategies']:
+                PropertyInquiry.objects.filter(buyer__user__username__startswith=prefix).delete()
+                Employee.objects.filter(pk__in=agents).update(active_inquiry_count=0)
+                invalidate_strategies()
+                self.run(strategy, agents, submissions, options)
+        finally:
+            CustomUser.objects.filter(username__startswith=prefix).delete()
+            Property.objects.filter(location__startswith=prefix).delete()
+            PropertyService.objects.filter(title__startswith=prefix).delete()
+            ServiceType.objects.filter(title__startswith=prefix).delete()
+            invalidate_strategies()
+
+    def create_rows(self, prefix, options):
+        rng = random.Random(options['seed'])
+        service_type = ServiceType.objects.create(title=f'{prefix}type')
+        services = PropertyService.objects.bulk_create([
+            PropertyService(title=title, service_type=service_type, service_fee=Decimal(100))
+            for title in SPECIALIZATIONS + [f'{prefix}unmatched']
+        ])
+
+        # bulk_create skips the profile signals, profiles are created explicitly
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'{prefix}agent{i}', is_staff=True)
+            for i in range(options['agents'])
+        ])
+        employees = Employee.objects.bulk_create([
+            Employee(
+                user=user,
+                specialization=SPECIALIZATIONS[i % len(SPECIALIZATIONS)],
+                performance_rating=Decimal(rng.randint(10, 50)) / 10,
+            )
+            for i, user in enumerate(users)
+        ])
+        agents = {employee.pk: employee for employee in employees}
+
+        unique = int(options['inquiries'] * (1 - options['duplicates']))
+        buyers = CustomUser.objects.bulk_create([
+            CustomUser(username=f'{prefix}buyer{i}') for i in range(unique)
+        ])
+        Client.objects.bulk_create([Client(user=user) for user in buyers])
+        properties = Property.objects.bulk_create([
+            Property(
+                price=Decimal(100000),
+                square_meters=Decimal(50),
+                property_type=rng.choice(services),
+                details='Benchmark property',
+                location=f'{prefix}street {i}',
+            )
+            for i in range(max(1, unique // 10))
+        ])
+
+        pairs = [
+            (client_id, rng.choice(properties))
+            for client_id in Client.objects.filter(
+                user__username__startswith=prefix
+            ).values_list('pk', flat=True)
+        ]
+        submissions = pairs + [
+            rng.choice(pairs) for _ in range(options['inquiries'] - len(pairs))
+        ]
+        rng.shuffle(submissions)
+        return agents, submissions
+
+    def submit(self, strategy, submissions, results):
+        close_old_connections()
+        try:
+            for buyer_id, prop in submissions:
+                started = time.perf_counter()
+                try:
+                    inquiry = PropertyInquiry.objects.create_with_agent_assignment(
+                        strategy=strategy,
+                        buyer_id=buyer_id,
+                        property=prop,
+                        inquiry_text='Benchmark inquiry',
+                    )
+                    results.append((time.perf_counter() - started, prop, inquiry))
+                except Exception as e:
+                    results.append((time.perf_counter() - started, prop, repr(e)))
+        finally:
+            connection.close()
+
+    def run(self, strategy, agents, submissions, options):
+        threads_count = options['threads']
+        chunks = [submissions[i::threads_count] for i in range(threads_count)]
+        results = []
+        threads = [
+            threading.Thread(target=self.submit, args=(strategy, chunk, results))
+            for chunk in chunks
+        ]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        errors = [inquiry for _, _, inquiry in results if isinstance(inquiry, str)]
+        inquiries = {
+            inquiry.pk: (inquiry.agent_id, prop)
+            for _, prop, inquiry in results if not isinstance(inquiry, str)
+        }
+        load = Counter(agent_id for agent_id, _ in inquiries.values())
+        counts = [load[agent_id] for agent_id in agents]
+        # Inquiries on a specialised service that went to a matching agent
+        specialised = [
+            (agents[agent_id], prop) for agent_id, prop in inquiries.values()
+            if prop.property_type.title in SPECIALIZATIONS
+        ]
+        matched = sum(
+            agent.specialization == prop.property_type.title for agent, prop in specialised
+        )
+        # Correlation of load with rating shows how much the weighting took effect
+        ratings = [float(agents[agent_id].performance_rating) for agent_id in agents]
+        latencies = sorted(latency for latency, _, _ in results)
+
+        for error, count in Counter(errors).most_common(5):
+            self.stderr.write(f'{count} x {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{strategy}: {len(results) / elapsed:.0f} inquiries/s, '
+            f'p50 {1000 * latencies[len(latencies) // 2]:.1f} ms, '
+            f'p99 {1000 * latencies[int(len(latencies) * 0.99)]:.1f} ms, '
+            f'{len(inquiries)} inquiries, {len(errors)} errors'
+        ))
+        self.stdout.write(
+            f'  load per agent: min {min(counts)}, max {max(counts)}, '
+            f'stdev {statistics.pstdev(counts):.2f}, '
+            f'rating correlation {statistics.correlation(ratings, counts) if len(set(counts)) > 1 else 0:.2f}, '
+            f'specialisation match {100 * matched / max(len(specialised), 1):.0f}%'
+        )
@@ -0,0 +1,54 @@
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from catalog.utils.metrics import metrics
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает задержку попадания в кэш: LocMem, общий кэш и двухуровневый кэш'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reads', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        backends = [
+            ('locmem', LocMemCache('benchmark', {})),
+            ('shared', caches['shared']),
+            ('two-tier', caches['default']),
+        ]
+        values = {
+            'version_stamp': time.time_ns(),
+            'metric': {'total_properties': 1000, 'avg_price': 123456.78},
+            'page_data': [
+                {'id': i, 'location': f'Benchmark street {i}', 'price': 100000 + i} for i in range(50)
+            ],
+        }
+        reads = options['reads']
+
+        for name, value in values.items():
+            for backend_name, backend in backends:
+                key = f'benchmark:cache:{name}'
+                backend.set(key, value, 300)
+                backend.get(key)
+
+                started = time.perf_counter()
+                for _ in range(reads):
+                    backend.get(key)
+                elapsed = time.perf_counter() - started
+                backend.delete(key)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name}, {backend_name}: {elapsed / reads * 1e6:.2f} µs per hit'
+                ))
+
+        # The registry reads its tag versions from the shared tier on every call
+        metrics.get('total_properties')
+        started = time.perf_counter()
+        for _ in range(reads // 100):
+            metrics.get('total_properties')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'metrics.get: {elapsed / (reads // 100) * 1e6:.2f} µs per hit'
+        ))
@@ -0,0 +1,126 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.models import Property, PropertyService, ServiceType
+from catalog.utils.columnar import PropertyColumnIndex
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает ORM и колоночный индекс на запросах списка недвижимости'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=9)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            # Everything is generated inside a transaction that is rolled back
+            with transaction.atomic():
+                services = self.create_rows(rows, options['seed'])
+                self.run(rows, services, options)
+                transaction.set_rollback(True)
+
+    def create_rows(self, rows, seed):
+        rng = random.Random(seed)
+        service_types = ServiceType.objects.bulk_create(
+            [ServiceType(title=f'Benchmark type {i}') for i in range(5)]
+        )
+        services = PropertyService.objects.bulk_create([
+            PropertyService(
+                title=f'Benchmark service {i}',
+                service_type=service_types[i % len(service_types)],
+                service_fee=Decimal(100),
+            )
+            for i in range(20)
+        ])
+
+        started = time.perf_counter()
+        batch = []
+        for i in range(rows):
+            batch.append(Property(
+                price=Decimal(rng.randint(10000, 1000000)),
+                square_meters=Decimal(rng.randint(2000, 30000)) / 100,
+                property_type=rng.choice(services),
+                details='Benchmark property',
+                location=f'Benchmark street {i}',
+            ))
+            if len(batch) == 10000:
+                Property.objects.bulk_create(batch)
+                batch = []
+        Property.objects.bulk_create(batch)
+        self.stdout.write(f'{rows} rows: generated in {time.perf_counter() - started:.1f}s')
+        return services
+
+    def make_queries(self, services, count, seed):
+        rng = random.Random(seed)
+        queries = []
+        for _ in range(count):
+            service = rng.choice(services)
+            min_price = rng.randint(10000, 900000)
+            queries.append({
+                'min_price': Decimal(min_price),
+                'max_price': Decimal(min_price + rng.randint(10000, 300000)),
+                'service_type_id': service.service_type_id,
+                'ordering': rng.choice(PropertyColumnIndex.orderings),
+                'page': rng.randint(0, 20),
+            })
+        return queries
+
+    def orm_page(self, query, page_size):
+        queryset = Property.objects.available().filter(
+            price__gte=query['min_price'],
+            price__lte=query['max_price'],
+            property_type__service_type_id=query['service_type_id'],
+        )
+        ordering = query['ordering']
+        tie_breaker = '-pk' if ordering.startswith('-') else 'pk'
+        start = query['page'] * page_size
+        total = queryset.count()
+        page = list(queryset.order_by(ordering, tie_breaker)[start:start + page_size])
+        return total, [prop.pk for prop in page]
+
+    def index_page(self, index, query, page_size):
+        result = index.query(
+            min_price=query['min_price'],
+            max_price=query['max_price'],
+            service_type_id=query['service_type_id'],
+            ordering=query['ordering'],
+        )
+        start = query['page'] * page_size
+        return result.count(), [prop.pk for prop in result[start:start + page_size]]
+
+    def run(self, rows, services, options):
+        page_size = options['page_size']
+        queries = self.make_queries(services, options['queries'], options['seed'])
+
+        index = PropertyColumnIndex()
+        started = time.perf_counter()
+        index.load()
+        load_time = time.perf_counter() - started
+
+        timings = {'orm': [], 'index': []}
+        for query in queries:
+            started = time.perf_counter()
+            expected = self.orm_page(query, page_size)
+            timings['orm'].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            actual = self.index_page(index, query, page_size)
+            timings['index'].append(time.perf_counter() - started)
+
+            if actual != expected:
+                self.stderr.write(f'Mismatch for {query}: {actual} != {expected}')
+
+        orm_ms = 1000 * sum(timings['orm']) / len(queries)
+        index_ms = 1000 * sum(timings['index']) / len(queries)
+        self.stdout.write(self.style.SUCCESS(
+            f'{rows} rows: index load {load_time:.2f}s, '
+            f'ORM {orm_ms:.2f} ms/query, index {index_ms:.2f} ms/query '
+            f'({orm_ms / index_ms:.1f}x)'
+        ))
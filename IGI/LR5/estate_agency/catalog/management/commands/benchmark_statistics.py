@@ -0,0 +1,142 @@
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.models import Property, PropertyService, ServiceType, Transaction
+from catalog.utils.sketch import RELATIVE_ACCURACY
+from catalog.utils.snapshot import StatisticsSnapshot
+from catalog.utils.vector_stats import VectorStatistics
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время и память расчёта статистики продаж: модели и pandas, NumPy и скетчи'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--skip-models', action='store_true', help='Не запускать построчный расчёт')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            # Everything is generated inside a transaction that is rolled back
+            with transaction.atomic():
+                self.create_rows(rows, options['seed'])
+                self.run(rows, options)
+                transaction.set_rollback(True)
+
+    def create_rows(self, rows, seed):
+        rng = random.Random(seed)
+        services = PropertyService.objects.bulk_create([
+            PropertyService(
+                title=f'Benchmark service {i}',
+                service_type=ServiceType.objects.create(title=f'Benchmark type {i}'),
+                service_fee=Decimal(rng.randint(50, 500)),
+            )
+            for i in range(20)
+        ])
+
+        started = time.perf_counter()
+        for offset in range(0, rows, 10000):
+            properties = Property.objects.bulk_create([
+                Property(
+                    price=Decimal(rng.randint(10000, 1000000)),
+                    square_meters=Decimal(50),
+                    property_type=rng.choice(services),
+                    details='Benchmark property',
+                    location=f'Benchmark street {offset + i}',
+                )
+                for i in range(min(10000, rows - offset))
+            ])
+            # The base manager skips the snapshot and listing side effects
+            Transaction._base_manager.bulk_create([
+                Transaction(
+                    property=prop,
+                    service_fee=prop.property_type.service_fee,
+                    total_amount=prop.price + prop.property_type.service_fee,
+                )
+                for prop in properties
+            ])
+        self.stdout.write(f'{rows} rows: generated in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        StatisticsSnapshot.rebuild()
+        self.stdout.write(f'{rows} rows: snapshot and sketches rebuilt in {time.perf_counter() - started:.1f}s')
+
+    def model_stats(self, options):
+        transactions = Transaction.objects.all()
+        result = {}
+        for name, values in (
+            ('total_amount', [float(t.total_amount) for t in transactions]),
+            ('service_fee', [float(t.service_fee) for t in transactions]),
+        ):
+            series = pd.Series(values)
+            result[name] = (
+                series.mean(),
+                series.median(),
+                series.mode().get(0),
+                *series.quantile([q / 100 for q in (5, 25, 75, 95)]),
+            )
+        return result
+
+    def vector_stats(self, options):
+        columns = VectorStatistics.load_columns(
+            Transaction.objects.all(), ('total_amount', 'service_fee'), chunk_size=options['chunk_size']
+        )
+        result = {}
+        for name, values in columns.items():
+            stats = VectorStatistics.describe(values, percentiles=(5, 25, 75, 95))
+            result[name] = (stats['mean'], stats['median'], stats['mode'], *stats['percentiles'].values())
+        return result
+
+    def sketch_stats(self, options):
+        result = {}
+        for name in ('total_amount', 'service_fee'):
+            stats = StatisticsSnapshot.get_distribution(name).describe(percentiles=(5, 25, 75, 95))
+            result[name] = (stats['mean'], stats['median'], stats['mode'], *stats['percentiles'].values())
+        return result
+
+    def measure(self, method, options):
+        started = time.perf_counter()
+        result = method(options)
+        elapsed = time.perf_counter() - started
+
+        # Memory is traced in a second run, tracing slows allocation down
+        tracemalloc.start()
+        method(options)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, elapsed, peak / 1024 / 1024
+
+    def run(self, rows, options):
+        methods = [('numpy', self.vector_stats), ('sketch', self.sketch_stats)]
+        if not options['skip_models']:
+            methods.insert(0, ('models', self.model_stats))
+
+        results = {}
+        for name, method in methods:
+            result, elapsed, peak = self.measure(method, options)
+            results[name] = result
+            self.stdout.write(self.style.SUCCESS(
+                f'{rows} rows, {name}: {elapsed:.2f}s, peak {peak:.1f} MiB'
+            ))
+
+        if 'models' in results:
+            for column, expected in results['models'].items():
+                actual = results['numpy'][column]
+                if any(abs(a - e) > 1e-6 * max(1.0, abs(e)) for a, e in zip(actual, expected)):
+                    self.stderr.write(f'Mismatch for {column}: {actual} != {expected}')
+
+        # The histogram mode is the fullest bin, not the most frequent value
+        for column, expected in results['numpy'].items():
+            actual = results['sketch'][column]
+            if any(
+                abs(a - e) > RELATIVE_ACCURACY * abs(e)
+                for i, (a, e) in enumerate(zip(actual, expected)) if i != 2
+            ):
+                self.stderr.write(f'Sketch out of accuracy for {column}: {actual} != {expected}')
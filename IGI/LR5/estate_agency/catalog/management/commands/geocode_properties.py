@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from catalog.models import Property
+from catalog.utils.geocoding import geocode_property
+
+
+class Command(BaseCommand):
+    help = 'Заполняет координаты объектов недвижимости через Mapbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Обновить и уже геокодированные объекты')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=settings.MAPBOX_GEOCODE_WORKERS)
+
+    def geocode_batch(self, property_ids):
+        close_old_connections()
+        try:
+            return sum(geocode_property(property_id) for property_id in property_ids)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        queryset = Property.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(latitude__isnull=True)
+        property_ids = list(queryset.order_by('id').values_list('id', flat=True))
+
+        batch_size = options['batch_size']
+        batches = [
+            property_ids[i:i + batch_size]
+            for i in range(0, len(property_ids), batch_size)
+        ]
+
+        if options['workers'] > 0:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                geocoded = sum(executor.map(self.geocode_batch, batches))
+        else:
+            geocoded = sum(
+                sum(geocode_property(property_id) for property_id in batch)
+                for batch in batches
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Геокодировано объектов: {geocoded} из {len(property_ids)}'
+        ))
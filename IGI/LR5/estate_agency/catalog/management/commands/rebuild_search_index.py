@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.utils.search import PropertySearchIndex
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс каталога недвижимости'
+
+    def handle(self, *args, **kwargs):
+        if not PropertySearchIndex.is_enabled():
+            raise CommandError('Полнотекстовый индекс поддерживается только для SQLite')
+
+        PropertySearchIndex.rebuild()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс успешно перестроен'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from catalog.utils.snapshot import StatisticsSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает снимок статистики продаж и заявок'
+
+    def handle(self, *args, **kwargs):
+        counts = StatisticsSnapshot.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            'Статистика пересчитана: ' + ', '.join(f'{name} {count}' for name, count in counts.items())
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from catalog.models import PropertyInquiry
+from users.models import Employee
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает количество активных заявок у сотрудников'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            employees = Employee.objects.select_for_update().annotate(
+                actual=Count(
+                    'propertyinquiry',
+                    filter=Q(propertyinquiry__state__in=PropertyInquiry.ACTIVE_STATES),
+                )
+            )
+            drifted = [
+                employee for employee in employees
+                if employee.active_inquiry_count != employee.actual
+            ]
+            for employee in drifted:
+                self.stdout.write(
+                    f'{employee}: {employee.active_inquiry_count} -> {employee.actual}'
+                )
+                if not options['dry_run']:
+                    Employee.objects.filter(pk=employee.pk).update(
+                        active_inquiry_count=employee.actual
+                    )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено сотрудников: {0 if options["dry_run"] else len(drifted)}'
+            f' (расхождений: {len(drifted)})'
+        ))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:30
+
+from django.db import migrations, models
+
+
+def mark_sold_properties(apps, schema_editor):
+    Property = apps.get_model('catalog', 'Property')
+    Property.objects.filter(transaction__isnull=False).update(is_available=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='is_available',
+            field=models.BooleanField(db_index=True, default=True, editable=False, help_text='Cleared while the property has a transaction'),
+        ),
+        migrations.RunPython(mark_sold_properties, migrations.RunPython.noop),
+    ]
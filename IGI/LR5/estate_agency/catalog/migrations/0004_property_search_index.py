@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# A copy of the SQL in catalog.utils.search, so later changes there leave this migration as it was
+CREATE_SEARCH_TABLE_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS catalog_property_fts USING fts5(
+        location, details, service,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+DROP_SEARCH_TABLE_SQL = "DROP TABLE IF EXISTS catalog_property_fts"
+INDEX_SQL = """
+    INSERT INTO catalog_property_fts (rowid, location, details, service)
+    SELECT p.id, p.location, p.details,
+           COALESCE(s.title, '') || ' ' || COALESCE(t.title, '')
+    FROM catalog_property p
+    LEFT JOIN catalog_propertyservice s ON s.id = p.property_type_id
+    LEFT JOIN catalog_servicetype t ON t.id = s.service_type_id
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SEARCH_TABLE_SQL)
+    schema_editor.execute(INDEX_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(DROP_SEARCH_TABLE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_property_is_available'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_property_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['is_available', 'price', 'id'], name='catalog_pro_is_avai_e67b41_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['is_available', 'square_meters', 'id'], name='catalog_pro_is_avai_df6c57_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_property_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaticMapTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('longitude', models.FloatField()),
+                ('latitude', models.FloatField()),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('width', models.PositiveSmallIntegerField()),
+                ('height', models.PositiveSmallIntegerField()),
+                ('digest', models.CharField(db_index=True, help_text='SHA-256 of the image', max_length=64)),
+                ('size', models.PositiveIntegerField(help_text='Image size in bytes')),
+                ('last_used', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'unique_together': {('longitude', 'latitude', 'zoom', 'width', 'height')},
+            },
+        ),
+    ]
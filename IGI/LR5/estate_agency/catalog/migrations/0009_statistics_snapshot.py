@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:53
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+
+def fill_statistics(apps, schema_editor):
+    Transaction = apps.get_model('catalog', 'Transaction')
+    PropertyInquiry = apps.get_model('catalog', 'PropertyInquiry')
+    PropertyService = apps.get_model('catalog', 'PropertyService')
+
+    Transaction.objects.update(service_fee=Subquery(
+        PropertyService.objects.filter(property__transaction=OuterRef('pk')).values('service_fee')[:1]
+    ))
+    Transaction.objects.filter(service_fee__isnull=True).update(service_fee=0)
+
+    counters = {
+        'ServiceStatistics': defaultdict(lambda: defaultdict(int)),
+        'EmployeeStatistics': defaultdict(lambda: defaultdict(int)),
+        'DailyStatistics': defaultdict(lambda: defaultdict(int)),
+    }
+
+    def add(service_id, agent_id, day, **values):
+        keys = {'DailyStatistics': (('day', day),)}
+        if service_id:
+            keys['ServiceStatistics'] = (('service_id', service_id),)
+        if agent_id:
+            keys['EmployeeStatistics'] = (('employee_id', agent_id), ('day', day))
+        for model_name, key in keys.items():
+            for field, value in values.items():
+                counters[model_name][key][field] += value
+
+    for service_id, agent_id, day, fee, total in Transaction.objects.values_list(
+        'property__property_type_id', 'agent_id', 'transaction_date', 'service_fee', 'total_amount'
+    ):
+        add(service_id, agent_id, day, sold_count=1, fee_total=fee, total_amount=total)
+    for service_id, agent_id, created_at in PropertyInquiry.objects.values_list(
+        'property__property_type_id', 'agent_id', 'created_at'
+    ):
+        add(service_id, agent_id, timezone.localdate(created_at), inquiry_count=1)
+
+    for model_name, rows in counters.items():
+        model = apps.get_model('catalog', model_name)
+        model.objects.bulk_create([model(**dict(key), **values) for key, values in rows.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_staticmaptile'),
+        ('users', '0002_employee_active_inquiry_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sold_count', models.PositiveIntegerField(default=0)),
+                ('fee_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('inquiry_count', models.PositiveIntegerField(default=0)),
+                ('day', models.DateField(unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Statistics',
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='service_fee',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='ServiceStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sold_count', models.PositiveIntegerField(default=0)),
+                ('fee_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('inquiry_count', models.PositiveIntegerField(default=0)),
+                ('service', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='catalog.propertyservice')),
+            ],
+            options={
+                'verbose_name_plural': 'Service Statistics',
+            },
+        ),
+        migrations.CreateModel(
+            name='EmployeeStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sold_count', models.PositiveIntegerField(default=0)),
+                ('fee_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('inquiry_count', models.PositiveIntegerField(default=0)),
+                ('day', models.DateField()),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.employee')),
+            ],
+            options={
+                'verbose_name_plural': 'Employee Statistics',
+                'indexes': [models.Index(fields=['day', 'employee'], name='catalog_emp_day_e388d0_idx')],
+                'unique_together': {('employee', 'day')},
+            },
+        ),
+        migrations.RunPython(fill_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:15
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_rollups(apps, schema_editor):
+    Transaction = apps.get_model('catalog', 'Transaction')
+    PropertyInquiry = apps.get_model('catalog', 'PropertyInquiry')
+    DailyRollup = apps.get_model('catalog', 'DailyRollup')
+
+    rows = defaultdict(lambda: defaultdict(int))
+    for service_id, agent_id, day, fee, total in Transaction.objects.values_list(
+        'property__property_type_id', 'agent_id', 'transaction_date', 'service_fee', 'total_amount'
+    ):
+        row = rows[(agent_id, service_id, day)]
+        row['sold_count'] += 1
+        row['fee_total'] += fee
+        row['total_amount'] += total
+    for service_id, agent_id, created_at in PropertyInquiry.objects.values_list(
+        'property__property_type_id', 'agent_id', 'created_at'
+    ):
+        rows[(agent_id, service_id, timezone.localdate(created_at))]['inquiry_count'] += 1
+
+    DailyRollup.objects.bulk_create([
+        DailyRollup(employee_id=agent_id, service_id=service_id, day=day, **values)
+        for (agent_id, service_id, day), values in rows.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_statistics_snapshot'),
+        ('users', '0002_employee_active_inquiry_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sold_count', models.PositiveIntegerField(default=0)),
+                ('fee_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('inquiry_count', models.PositiveIntegerField(default=0)),
+                ('day', models.DateField()),
+                ('employee', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='users.employee')),
+                ('service', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.propertyservice')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Rollups',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dailyrollup',
+            index=models.Index(fields=['day', 'employee'], name='catalog_dai_day_ea5053_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyrollup',
+            index=models.Index(fields=['day', 'service'], name='catalog_dai_day_d3c373_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyrollup',
+            unique_together={('employee', 'service', 'day')},
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='EmployeeStatistics',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_daily_rollup'),
+        ('users', '0002_employee_active_inquiry_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='propertyinquiry',
+            index=models.Index(fields=['state', 'created_at'], name='catalog_pro_state_4644c4_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:18
+
+import django.db.models.deletion
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_bins(apps, schema_editor):
+    Property = apps.get_model('catalog', 'Property')
+    Transaction = apps.get_model('catalog', 'Transaction')
+    DistributionBin = apps.get_model('catalog', 'DistributionBin')
+
+    # The logarithmic bins of catalog.utils.sketch as of this migration
+    accuracy = getattr(settings, 'CATALOG_SKETCH_ACCURACY', 0.01)
+    gamma = (1 + accuracy) / (1 - accuracy)
+    zero_bin = math.ceil(math.log(0.01, gamma)) - 1
+
+    def to_bin(value):
+        value = float(value)
+        return zero_bin if value < 0.01 else math.ceil(math.log(value, gamma))
+
+    bins = Counter()
+    for service_id, price in Property.objects.values_list('property_type_id', 'price').iterator():
+        bins[('price', service_id, None, to_bin(price))] += 1
+    for service_id, day, fee, total in Transaction.objects.values_list(
+        'property__property_type_id', 'transaction_date', 'service_fee', 'total_amount'
+    ).iterator():
+        bins[('service_fee', service_id, day, to_bin(fee))] += 1
+        bins[('total_amount', service_id, day, to_bin(total))] += 1
+
+    DistributionBin.objects.bulk_create([
+        DistributionBin(field=field, service_id=service_id, day=day, bin=bin, count=count)
+        for (field, service_id, day, bin), count in bins.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_propertyinquiry_state_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistributionBin',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('price', 'Property price'), ('service_fee', 'Service fee'), ('total_amount', 'Transaction total')], max_length=20)),
+                ('day', models.DateField(help_text='Sale day, empty for property prices', null=True)),
+                ('bin', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('service', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.propertyservice')),
+            ],
+            options={
+                'verbose_name_plural': 'Distribution Bins',
+                'indexes': [models.Index(fields=['field', 'day'], name='catalog_dis_field_368a38_idx')],
+                'unique_together': {('field', 'service', 'day', 'bin')},
+            },
+        ),
+        migrations.RunPython(fill_bins, migrations.RunPython.noop),
+    ]
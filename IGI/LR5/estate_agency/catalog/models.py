@@ -1,6 +1,12 @@
+import os
+import random
+import time
+
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import Count, F, Q
+from django.db import IntegrityError, OperationalError, models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.conf import settings
 from users.models import Employee, Client
@@ -20,6 +26,11 @@ class PropertyType(models.Model):
         return self.title
 
 
+class PropertyManager(models.Manager):
+    def available(self):
+        return self.filter(is_available=True)
+
+
 class Property(models.Model):
     price = models.DecimalField(
         decimal_places=2,
@@ -44,6 +55,16 @@ class Property(models.Model):
     )
     photo = models.ImageField(blank=True, null=True, upload_to="properties/")
     location = models.CharField(max_length=200)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    is_available = models.BooleanField(
+        default=True,
+        db_index=True,
+        editable=False,
+        help_text="Cleared while the property has a transaction",
+    )
+
+    objects = PropertyManager()
 
     def get_photo_url(self):
         if self.photo and hasattr(self.photo, "url"):
@@ -53,6 +74,10 @@ class Property(models.Model):
     class Meta:
         ordering = ("-id",)
         verbose_name_plural = "Properties"
+        indexes = [
+            models.Index(fields=["is_available", "price", "id"]),
+            models.Index(fields=["is_available", "square_meters", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.location}: {self.price}"
@@ -91,6 +116,65 @@ class PropertyService(models.Model):
         return f"({str(self.service_type)[:2]}) - {self.title}"
 
 
+class GeocodedAddress(models.Model):
+    address = models.CharField(max_length=255, unique=True, help_text="Normalized address")
+    longitude = models.FloatField(null=True, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    found = models.BooleanField(default=True, help_text="False caches 'address not found'")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Geocoded Addresses"
+
+    def __str__(self):
+        if not self.found:
+            return f"{self.address}: not found"
+        return f"{self.address}: {self.longitude}, {self.latitude}"
+
+    @staticmethod
+    def normalize(address):
+        return " ".join((address or "").lower().replace(",", ", ").split()).strip(" ,.")
+
+    def is_expired(self):
+        ttl = settings.MAPBOX_GEOCODE_TTL if self.found else settings.MAPBOX_GEOCODE_NEGATIVE_TTL
+        return self.updated_at < timezone.now() - ttl
+
+
+class StaticMapTile(models.Model):
+    longitude = models.FloatField()
+    latitude = models.FloatField()
+    zoom = models.PositiveSmallIntegerField()
+    width = models.PositiveSmallIntegerField()
+    height = models.PositiveSmallIntegerField()
+    digest = models.CharField(max_length=64, db_index=True, help_text="SHA-256 of the image")
+    size = models.PositiveIntegerField(help_text="Image size in bytes")
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        unique_together = ["longitude", "latitude", "zoom", "width", "height"]
+
+    def __str__(self):
+        return f"{self.longitude},{self.latitude},{self.zoom} {self.width}x{self.height}"
+
+    def get_path(self):
+        return os.path.join(settings.MEDIA_ROOT, settings.MAPBOX_MAP_CACHE_DIR, f"{self.digest}.png")
+
+
+class TransactionManager(models.Manager):
+    def bulk_create(self, objs, *args, **kwargs):
+        from .utils.metrics import metrics
+        from .utils.snapshot import StatisticsSnapshot
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        Property.objects.filter(
+            pk__in=[obj.property_id for obj in objs]
+        ).update(is_available=False)
+        StatisticsSnapshot.add_transactions([obj.pk for obj in objs])
+        # bulk_create sends no post_save
+        metrics.invalidate("transaction", "property")
+        return objs
+
+
 class Transaction(models.Model):
     buyer = models.ForeignKey(Client, on_delete=models.SET_NULL, null=True)
     agent = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True)
@@ -98,13 +182,17 @@ class Transaction(models.Model):
     transaction_date = models.DateField(auto_now_add=True)
     property = models.OneToOneField(Property, on_delete=models.CASCADE)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, auto_created=True)
+    # Fee at the time of sale, so statistics do not follow later fee changes
+    service_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+
+    objects = TransactionManager()
 
     def save(self, *args, **kwargs):
-        service_fee = 0
+        self.service_fee = 0
         if self.property.property_type:
-            service_fee = self.property.property_type.service_fee
+            self.service_fee = self.property.property_type.service_fee
 
-        self.total_amount = service_fee + self.property.price
+        self.total_amount = self.service_fee + self.property.price
 
         super().save(*args, **kwargs)
 
@@ -113,25 +201,44 @@ class Transaction(models.Model):
 
 
 class PropertyInquiryManager(models.Manager):
-    def create_with_agent_assignment(self, **kwargs):
-        active_states = ["pending", "processing"]
-        agent = (
-            Employee.objects.annotate(
-                inquiry_count=Count(
-                    "propertyinquiry",
-                    filter=Q(propertyinquiry__state__in=active_states),
-                )
-            )
-            .order_by("inquiry_count")
-            .first()
-        )
-
-        if agent:
-            kwargs["agent"] = agent
-        else:
-            raise ValueError("No available agents found.")
-
-        return self.create(**kwargs)
+    def create_with_agent_assignment(self, strategy=None, **kwargs):
+        """
+        Create the inquiry for the agent picked by the assignment strategy
+        (CATALOG_ASSIGNMENT_STRATEGY by default), or return the buyer's
+        existing inquiry for the property. Safe under concurrent submissions.
+        """
+        from .utils.assignment import get_strategy
+
+        strategy = get_strategy(strategy)
+        property = kwargs.get("property") or kwargs.get("property_id")
+        lookup = {
+            key: value for key, value in kwargs.items()
+            if key in ("property", "property_id", "buyer", "buyer_id")
+        }
+        retries = getattr(settings, "CATALOG_ASSIGNMENT_RETRIES", 10)
+        for attempt in range(retries):
+            try:
+                with transaction.atomic(using=self.db):
+                    existing = self.filter(**lookup).first()
+                    if existing:
+                        return existing
+                    agent = strategy.claim(property, using=self.db)
+                    if agent:
+                        kwargs["agent"] = agent
+                        return self.create(**kwargs)
+            except IntegrityError:
+                # A concurrent duplicate submission inserted first
+                existing = self.filter(**lookup).first()
+                if existing:
+                    return existing
+                raise
+            except OperationalError as e:
+                # SQLite has no row locks and reports write conflicts as a locked database
+                if "locked" not in str(e) or attempt == retries - 1:
+                    raise
+            time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+
+        raise OperationalError(f"Could not assign an agent after {retries} attempts")
 
 
 class PropertyInquiry(models.Model):
@@ -140,6 +247,7 @@ class PropertyInquiry(models.Model):
         ("processing", "Processing"),
         ("completed", "Completed"),
     ]
+    ACTIVE_STATES = ("pending", "processing")
 
     property = models.ForeignKey(Property, on_delete=models.CASCADE)
     buyer = models.ForeignKey(Client, on_delete=models.CASCADE)
@@ -158,6 +266,140 @@ class PropertyInquiry(models.Model):
     class Meta:
         unique_together = ["property", "buyer"]
         verbose_name_plural = "Property Inquiries"
+        indexes = [
+            # Conversion funnel stages over a creation period
+            models.Index(fields=["state", "created_at"]),
+        ]
 
     def __str__(self):
         return f"{self.property} - {self.buyer.user.username}"
+
+
+class StatisticsCounters(models.Model):
+    sold_count = models.PositiveIntegerField(default=0)
+    fee_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    inquiry_count = models.PositiveIntegerField(default=0)
+    # Set by StatisticsSnapshot on every change, the ETag of the chart data follows it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class ServiceStatistics(StatisticsCounters):
+    service = models.OneToOneField(
+        PropertyService, on_delete=models.CASCADE, related_name="statistics"
+    )
+
+    class Meta:
+        verbose_name_plural = "Service Statistics"
+
+    def __str__(self):
+        return f"{self.service}: {self.sold_count}"
+
+
+class DailyRollup(StatisticsCounters):
+    """Counters per employee, service and day, summed for any date range"""
+    employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True)
+    service = models.ForeignKey(PropertyService, on_delete=models.SET_NULL, null=True)
+    day = models.DateField()
+
+    class Meta:
+        unique_together = ["employee", "service", "day"]
+        indexes = [
+            models.Index(fields=["day", "employee"]),
+            models.Index(fields=["day", "service"]),
+        ]
+        verbose_name_plural = "Daily Rollups"
+
+    def __str__(self):
+        return f"{self.employee} {self.service} {self.day}: {self.sold_count}"
+
+
+class DailyStatistics(StatisticsCounters):
+    day = models.DateField(unique=True)
+
+    class Meta:
+        verbose_name_plural = "Daily Statistics"
+
+    def __str__(self):
+        return f"{self.day}: {self.sold_count}"
+
+
+class DistributionBin(models.Model):
+    """Values in one QuantileSketch bin per field, service and day"""
+    FIELD_CHOICES = [
+        ("price", "Property price"),
+        ("service_fee", "Service fee"),
+        ("total_amount", "Transaction total"),
+    ]
+
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    service = models.ForeignKey(PropertyService, on_delete=models.SET_NULL, null=True)
+    day = models.DateField(null=True, help_text="Sale day, empty for property prices")
+    bin = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ["field", "service", "day", "bin"]
+        indexes = [
+            models.Index(fields=["field", "day"]),
+        ]
+        verbose_name_plural = "Distribution Bins"
+
+    def __str__(self):
+        return f"{self.field} {self.service} {self.day} [{self.bin}]: {self.count}"
+
+
+@receiver(post_save, sender=Transaction)
+def reserve_property(sender, instance, **kwargs):
+    """Take the property off the listing, releasing the one it replaced"""
+    Property.objects.filter(pk=instance.property_id).update(is_available=False)
+    previous_property_id = getattr(instance, "_previous_property_id", None)
+    if previous_property_id and previous_property_id != instance.property_id:
+        Property.objects.filter(pk=previous_property_id).update(is_available=True)
+
+
+@receiver(post_delete, sender=Transaction)
+def release_property(sender, instance, **kwargs):
+    """Return the property to the listing once its transaction is gone"""
+    Property.objects.filter(pk=instance.property_id).update(is_available=True)
+
+
+def count_active_inquiry(agent_id, delta):
+    agents = Employee.objects.filter(pk=agent_id)
+    if delta < 0:
+        # Never drive a drifted counter below zero
+        agents = agents.filter(active_inquiry_count__gte=-delta)
+    agents.update(active_inquiry_count=F("active_inquiry_count") + delta)
+
+
+@receiver(pre_save, sender=PropertyInquiry)
+def remember_previous_assignment(sender, instance, **kwargs):
+    instance._previous_active_agent_id = None
+    if instance.pk:
+        instance._previous_active_agent_id = (
+            PropertyInquiry.objects.filter(pk=instance.pk, state__in=PropertyInquiry.ACTIVE_STATES)
+            .values_list("agent_id", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=PropertyInquiry)
+def update_active_inquiry_count(sender, instance, **kwargs):
+    """Move the inquiry between agents' active counters on assignment and state changes"""
+    previous_agent_id = getattr(instance, "_previous_active_agent_id", None)
+    agent_id = instance.agent_id if instance.state in PropertyInquiry.ACTIVE_STATES else None
+    if previous_agent_id == agent_id:
+        return
+    if previous_agent_id:
+        count_active_inquiry(previous_agent_id, -1)
+    if agent_id:
+        count_active_inquiry(agent_id, 1)
+
+
+@receiver(post_delete, sender=PropertyInquiry)
+def release_active_inquiry(sender, instance, **kwargs):
+    if instance.agent_id and instance.state in PropertyInquiry.ACTIVE_STATES:
+        count_active_inquiry(instance.agent_id, -1)
@@ -0,0 +1,210 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from users.models import Client, CustomUser, Employee
+from .models import DailyRollup, Property, PropertyInquiry, PropertyService, ServiceStatistics, ServiceType, Transaction
+from .utils.assignment import invalidate_strategies
+from .utils.columnar import property_index
+from .utils.geocoding import geocoding_queue
+from .utils.metrics import metrics
+from .utils.search import PropertySearchIndex
+from .utils.snapshot import TRANSACTION_VALUES, StatisticsSnapshot
+
+
+@receiver(post_save, sender=Property)
+def index_property(sender, instance, **kwargs):
+    PropertySearchIndex.index_property(instance.pk)
+
+
+@receiver(post_delete, sender=Property)
+def unindex_property(sender, instance, **kwargs):
+    PropertySearchIndex.remove_property(instance.pk)
+
+
+@receiver(post_save, sender=PropertyService)
+def index_service_properties(sender, instance, **kwargs):
+    PropertySearchIndex.index_service(instance.pk)
+
+
+@receiver(pre_delete, sender=PropertyService)
+def remember_service_properties(sender, instance, **kwargs):
+    # property_type is SET_NULL without signals, so keep the ids to reindex
+    instance._property_ids = list(
+        instance.property_set.values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=PropertyService)
+def reindex_service_properties(sender, instance, **kwargs):
+    for property_id in getattr(instance, "_property_ids", []):
+        PropertySearchIndex.index_property(property_id)
+
+
+@receiver(post_save, sender=ServiceType)
+def index_service_type_properties(sender, instance, **kwargs):
+    PropertySearchIndex.index_service_type(instance.pk)
+
+
+@receiver(post_save, sender=Property)
+def refresh_column_index(sender, instance, **kwargs):
+    property_index.refresh([instance.pk])
+
+
+@receiver(post_delete, sender=Property)
+def remove_from_column_index(sender, instance, **kwargs):
+    property_index.remove(instance.pk)
+
+
+@receiver(post_save, sender=PropertyService)
+def refresh_service_column_index(sender, instance, **kwargs):
+    property_index.refresh(instance.property_set.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=PropertyService)
+def refresh_unlinked_column_index(sender, instance, **kwargs):
+    property_index.refresh(getattr(instance, "_property_ids", []))
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def refresh_sold_column_index(sender, instance, **kwargs):
+    property_index.refresh(
+        [instance.property_id, getattr(instance, "_previous_property_id", None)]
+    )
+
+
+@receiver(pre_save, sender=Property)
+def reset_coordinates(sender, instance, **kwargs):
+    previous_location = None
+    if instance.pk:
+        previous_location = (
+            Property.objects.filter(pk=instance.pk)
+            .values_list("location", flat=True)
+            .first()
+        )
+    instance._location_changed = previous_location != instance.location
+    if instance._location_changed:
+        instance.latitude = instance.longitude = None
+
+
+@receiver(post_save, sender=Property)
+def enqueue_geocoding(sender, instance, **kwargs):
+    if getattr(instance, "_location_changed", False) or instance.latitude is None:
+        property_id = instance.pk
+        transaction.on_commit(lambda: geocoding_queue.submit(property_id))
+
+
+@receiver(pre_save, sender=Transaction)
+@receiver(pre_delete, sender=Transaction)
+def remember_previous_transaction(sender, instance, **kwargs):
+    """Read the stored row once for the availability, column index and statistics receivers"""
+    row = instance.pk and (
+        Transaction.objects.filter(pk=instance.pk)
+        .values_list("property_id", *TRANSACTION_VALUES)
+        .first()
+    )
+    instance._previous_property_id = row[0] if row else None
+    instance._statistics_row = row and row[1:]
+
+
+@receiver(post_save, sender=Transaction)
+def update_transaction_statistics(sender, instance, **kwargs):
+    previous = getattr(instance, "_statistics_row", None)
+    current = StatisticsSnapshot.transaction_values(instance)
+    if previous == current:
+        return
+    if previous:
+        StatisticsSnapshot.apply_transaction(previous, -1)
+    StatisticsSnapshot.apply_transaction(current)
+
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction_statistics(sender, instance, **kwargs):
+    previous = getattr(instance, "_statistics_row", None)
+    if previous:
+        StatisticsSnapshot.apply_transaction(previous, -1)
+
+
+@receiver(pre_save, sender=PropertyInquiry)
+@receiver(pre_delete, sender=PropertyInquiry)
+def remember_inquiry_statistics(sender, instance, **kwargs):
+    instance._statistics_row = instance.pk and StatisticsSnapshot.inquiry_row(instance.pk)
+
+
+@receiver(post_save, sender=PropertyInquiry)
+def update_inquiry_statistics(sender, instance, **kwargs):
+    previous = getattr(instance, "_statistics_row", None)
+    current = StatisticsSnapshot.inquiry_values(instance)
+    if previous == current:
+        return
+    if previous:
+        StatisticsSnapshot.apply_inquiry(previous, -1)
+    StatisticsSnapshot.apply_inquiry(current)
+
+
+@receiver(post_delete, sender=PropertyInquiry)
+def remove_inquiry_statistics(sender, instance, **kwargs):
+    previous = getattr(instance, "_statistics_row", None)
+    if previous:
+        StatisticsSnapshot.apply_inquiry(previous, -1)
+
+
+@receiver(pre_save, sender=Property)
+@receiver(pre_delete, sender=Property)
+def remember_price_statistics(sender, instance, **kwargs):
+    instance._price_row = instance.pk and StatisticsSnapshot.price_row(instance.pk)
+
+
+@receiver(post_save, sender=Property)
+def update_price_statistics(sender, instance, **kwargs):
+    previous = getattr(instance, "_price_row", None)
+    current = StatisticsSnapshot.price_values(instance)
+    if previous == current:
+        return
+    if previous:
+        StatisticsSnapshot.apply_price(previous, -1)
+    StatisticsSnapshot.apply_price(current)
+
+
+@receiver(post_delete, sender=Property)
+def remove_price_statistics(sender, instance, **kwargs):
+    previous = getattr(instance, "_price_row", None)
+    if previous:
+        StatisticsSnapshot.apply_price(previous, -1)
+
+
+@receiver(post_save, sender=PropertyService)
+def touch_service_statistics(sender, instance, **kwargs):
+    StatisticsSnapshot.touch(ServiceStatistics, service_id=instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+def touch_employee_statistics(sender, instance, update_fields=None, **kwargs):
+    # Logins only save last_login
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    StatisticsSnapshot.touch(DailyRollup, employee__user_id=instance.pk)
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+@receiver(post_save, sender=PropertyService)
+@receiver(post_delete, sender=PropertyService)
+@receiver(post_save, sender=ServiceType)
+def reload_assignment_strategies(sender, instance, **kwargs):
+    invalidate_strategies()
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+@receiver(post_save, sender=PropertyService)
+@receiver(post_delete, sender=PropertyService)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=PropertyInquiry)
+@receiver(post_delete, sender=PropertyInquiry)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_metrics(sender, instance, **kwargs):
+    metrics.invalidate(sender._meta.model_name)
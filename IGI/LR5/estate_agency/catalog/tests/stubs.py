@@ -0,0 +1,66 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+
+class StubServer(object):
+    """
+    Local HTTP server standing in for third-party APIs in tests.
+    routes maps a path prefix to a callable(path, query) -> (status, body).
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        self.client_ports = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so tests can see whether clients reuse connections
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = unquote(url.path)
+                server.requests.append(path)
+                server.client_ports.add(self.client_address[1])
+                for prefix, route in server.routes.items():
+                    if path.startswith(prefix):
+                        status, body = route(path[len(prefix):], url.query)
+                        break
+                else:
+                    status, body = 404, {}
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def mapbox_geocoding_route(known):
+    """Route answering like the Mapbox geocoding API for the known addresses"""
+    def route(path, query):
+        address = path[: -len(".json")]
+        if address in known:
+            return 200, {"features": [{"geometry": {"coordinates": list(known[address])}}]}
+        return 200, {"features": []}
+    return route
@@ -1,8 +1,12 @@
+from django.core.management import call_command
 from django.core.validators import MinValueValidator
-from django.test import TestCase
+import threading
+
+from django.db import close_old_connections, connection
+from django.test import TestCase, TransactionTestCase
 from decimal import Decimal
 from datetime import date
-from users.models import User, Employee, Client
+from users.models import User, CustomUser, Employee, Client
 from ..models import (
     Property,
     ServiceType,
@@ -13,6 +17,7 @@ from ..models import (
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import timedelta
+from io import StringIO
 
 
 def create_user_with_role(username, role):
@@ -283,3 +288,228 @@ class PropertyInquiryModelTest(TestCase):
                 inquiry_text="Another inquiry"
             )
 
+
+class PropertyAvailabilityTest(TestCase):
+    """Test suite for the denormalized Property.is_available flag"""
+
+    def setUp(self):
+        self.buyer = CustomUser.objects.create_user(
+            username="testbuyer",
+            password="testpass"
+        ).client
+        self.agent = CustomUser.objects.create_user(
+            username="testagent",
+            password="testpass",
+            is_staff=True
+        ).employee
+        self.service_type = PropertyService.objects.create(
+            title="Test Service",
+            service_type=ServiceType.objects.create(title="Test Type"),
+            service_fee=Decimal('100.00')
+        )
+        self.properties = [
+            Property.objects.create(
+                price=Decimal('100000.00'),
+                square_meters=Decimal('100.00'),
+                property_type=self.service_type,
+                details="Test property",
+                location=f"Test Location {i}"
+            )
+            for i in range(3)
+        ]
+
+    def assertAvailable(self, prop, expected):
+        prop.refresh_from_db()
+        self.assertEqual(prop.is_available, expected)
+
+    def test_new_property_is_available(self):
+        """Test properties are listed until sold"""
+        self.assertEqual(Property.objects.available().count(), 3)
+
+    def test_transaction_create_and_delete(self):
+        """Test creating and deleting a transaction toggles the flag"""
+        transaction = Transaction.objects.create(
+            buyer=self.buyer,
+            agent=self.agent,
+            property=self.properties[0]
+        )
+        self.assertAvailable(self.properties[0], False)
+        transaction.delete()
+        self.assertAvailable(self.properties[0], True)
+
+    def test_transaction_property_change(self):
+        """Test moving a transaction to another property releases the old one"""
+        transaction = Transaction.objects.create(
+            buyer=self.buyer,
+            agent=self.agent,
+            property=self.properties[0]
+        )
+        transaction.property = self.properties[1]
+        transaction.save()
+        self.assertAvailable(self.properties[0], True)
+        self.assertAvailable(self.properties[1], False)
+
+    def test_bulk_create_and_queryset_delete(self):
+        """Test bulk paths used by the admin keep the flag in sync"""
+        Transaction.objects.bulk_create([
+            Transaction(buyer=self.buyer, agent=self.agent, property=prop, total_amount=prop.price)
+            for prop in self.properties[:2]
+        ])
+        self.assertEqual(list(Property.objects.available()), [self.properties[2]])
+        Transaction.objects.all().delete()
+        self.assertEqual(Property.objects.available().count(), 3)
+
+
+class ActiveInquiryCountTest(TestCase):
+    """Test suite for the maintained Employee.active_inquiry_count"""
+
+    def setUp(self):
+        self.buyers = [
+            CustomUser.objects.create_user(username=f"testbuyer{i}", password="testpass").client
+            for i in range(4)
+        ]
+        self.agents = [
+            CustomUser.objects.create_user(username=f"testagent{i}", password="testpass", is_staff=True).employee
+            for i in range(2)
+        ]
+        self.property = Property.objects.create(
+            price=Decimal('100000.00'),
+            square_meters=Decimal('100.00'),
+            details="Test property",
+            location="Test Location"
+        )
+
+    def assertCounts(self, *expected):
+        for agent in self.agents:
+            agent.refresh_from_db()
+        self.assertEqual(tuple(agent.active_inquiry_count for agent in self.agents), expected)
+
+    def create_inquiry(self, buyer, **kwargs):
+        return PropertyInquiry.objects.create_with_agent_assignment(
+            property=self.property, buyer=buyer, inquiry_text="Test inquiry", **kwargs
+        )
+
+    def test_assignment_balances_load(self):
+        """Test new inquiries go to the least-loaded agent"""
+        inquiries = [self.create_inquiry(buyer) for buyer in self.buyers]
+        self.assertEqual(
+            [inquiry.agent for inquiry in inquiries],
+            [self.agents[0], self.agents[1], self.agents[0], self.agents[1]]
+        )
+        self.assertCounts(2, 2)
+
+    def test_state_transitions(self):
+        """Test only pending and processing inquiries are counted"""
+        inquiry = self.create_inquiry(self.buyers[0])
+        inquiry.state = "processing"
+        inquiry.save()
+        self.assertCounts(1, 0)
+        inquiry.state = "completed"
+        inquiry.save()
+        self.assertCounts(0, 0)
+        inquiry.state = "pending"
+        inquiry.save()
+        self.assertCounts(1, 0)
+
+    def test_reassignment_and_delete(self):
+        """Test moving or deleting an inquiry updates both agents"""
+        inquiry = self.create_inquiry(self.buyers[0])
+        inquiry.agent = self.agents[1]
+        inquiry.save()
+        self.assertCounts(0, 1)
+        inquiry.delete()
+        self.assertCounts(0, 0)
+
+    def test_assignment_query_count(self):
+        """Test assignment costs the same few queries however many inquiries exist"""
+        for buyer in self.buyers[:3]:
+            self.create_inquiry(buyer)
+        # Savepoint, duplicate check, pick and claim the agent, insert,
+        # bump the counter, employee and daily statistics, release
+        with self.assertNumQueries(9):
+            self.create_inquiry(self.buyers[3])
+
+    def test_duplicate_submission_is_idempotent(self):
+        """Test submitting the same inquiry twice returns the first one"""
+        first = self.create_inquiry(self.buyers[0])
+        second = self.create_inquiry(self.buyers[0])
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(PropertyInquiry.objects.count(), 1)
+        self.assertCounts(1, 0)
+
+    def test_no_agents(self):
+        """Test assignment fails clearly without employees"""
+        Employee.objects.all().delete()
+        with self.assertRaises(ValueError):
+            self.create_inquiry(self.buyers[0])
+
+    def test_reconcile_command(self):
+        """Test the reconciliation command repairs drifted counters"""
+        self.create_inquiry(self.buyers[0])
+        PropertyInquiry.objects.update(state="completed")
+        Employee.objects.filter(pk=self.agents[1].pk).update(active_inquiry_count=5)
+
+        out = StringIO()
+        call_command("reconcile_inquiry_counts", "--dry-run", stdout=out)
+        self.assertIn("расхождений: 2", out.getvalue())
+        self.assertCounts(1, 5)
+
+        call_command("reconcile_inquiry_counts", stdout=StringIO())
+        self.assertCounts(0, 0)
+
+
+class ConcurrentAssignmentTest(TransactionTestCase):
+    """Test suite for inquiry assignment under parallel submissions"""
+
+    def setUp(self):
+        self.buyers = [
+            CustomUser.objects.create_user(username=f"testbuyer{i}", password="testpass").client
+            for i in range(12)
+        ]
+        self.agents = [
+            CustomUser.objects.create_user(username=f"testagent{i}", password="testpass", is_staff=True).employee
+            for i in range(3)
+        ]
+        # bulk_create keeps the geocoding signals from calling Mapbox after commit
+        self.property, = Property.objects.bulk_create([Property(
+            price=Decimal('100000.00'),
+            square_meters=Decimal('100.00'),
+            details="Test property",
+            location="Test Location"
+        )])
+
+    def submit(self, buyers, errors):
+        close_old_connections()
+        try:
+            for buyer in buyers:
+                PropertyInquiry.objects.create_with_agent_assignment(
+                    property=self.property, buyer=buyer, inquiry_text="Test inquiry"
+                )
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_parallel_submissions(self):
+        """Test parallel and duplicate submissions spread evenly without errors"""
+        errors = []
+        # Every buyer is submitted twice, from different threads
+        threads = [
+            threading.Thread(target=self.submit, args=(self.buyers[i::3], errors))
+            for i in range(3)
+        ] + [
+            threading.Thread(target=self.submit, args=(self.buyers[i::3][::-1], errors))
+            for i in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(PropertyInquiry.objects.count(), len(self.buyers))
+        counts = sorted(
+            Employee.objects.filter(pk__in=[agent.pk for agent in self.agents])
+            .values_list("active_inquiry_count", flat=True)
+        )
+        self.assertEqual(counts, [4, 4, 4])
@@ -1,15 +1,43 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db.models import Count
+from django.http import Http404
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from decimal import Decimal
-from datetime import timedelta
+from datetime import date, timedelta
 import matplotlib.pyplot as plt
+import numpy as np
 import os
+import requests
 import tempfile
+import time
+from io import StringIO
+from unittest import mock
 
 from ..utils.statistics import StatisticsCalculator
 from ..utils.plotter import Plotter
-from ..models import Property, PropertyService, Transaction, PropertyInquiry
+from ..utils.assignment import get_strategy, invalidate_strategies
+from ..utils.columnar import PropertyColumnIndex, property_index
+from ..utils.funnel import ConversionFunnel
+from ..utils.geocoding import geocoding_queue
+from ..utils.metrics import Aggregate, Metric, MetricRegistry
+from ..utils.mapbox_client import MapboxClient
+from ..utils.pagination import KeysetPaginator
+from ..utils.search import PropertySearchIndex
+from ..utils.sketch import RELATIVE_ACCURACY, QuantileSketch
+from ..utils.snapshot import StatisticsSnapshot
+from ..utils.vector_stats import VectorStatistics
+from ..models import (
+    Property, PropertyService, ServiceType, Transaction, PropertyInquiry, GeocodedAddress,
+    ServiceStatistics, DailyRollup, DailyStatistics, DistributionBin,
+)
+from .stubs import StubServer, mapbox_geocoding_route
 from users.models import CustomUser, Client, Employee
+from users.utils.timezone_service import TimezoneService
+from estate_agency.cache import TwoTierCache
+from estate_agency.http_client import CircuitBreaker, CircuitOpenError, HttpClient
 
 class StatisticsCalculatorTest(TestCase):
     """Test suite for StatisticsCalculator"""
@@ -131,4 +159,999 @@ class PlotterTest(TestCase):
         """Clean up temporary files"""
         for file in os.listdir(self.temp_dir):
             os.remove(os.path.join(self.temp_dir, file))
-        os.rmdir(self.temp_dir) 
\ No newline at end of file
+        os.rmdir(self.temp_dir) 
+
+
+class PropertySearchIndexTest(TestCase):
+    """Test suite for PropertySearchIndex"""
+
+    def setUp(self):
+        self.service = PropertyService.objects.create(
+            title="Аренда",
+            service_type=ServiceType.objects.create(title="Жилая"),
+            service_fee=Decimal('100.00')
+        )
+        self.flat = Property.objects.create(
+            price=Decimal('100000.00'),
+            square_meters=Decimal('50.00'),
+            property_type=self.service,
+            details="Просторная квартира с ремонтом",
+            location="Минск, ул. Ленина 1"
+        )
+        self.house = Property.objects.create(
+            price=Decimal('200000.00'),
+            square_meters=Decimal('150.00'),
+            details="Дом у озера, рядом с квартирами соседей",
+            location="Брест, ул. Советская 5"
+        )
+
+    def search(self, text):
+        return list(PropertySearchIndex.search(Property.objects.all(), text).order_by('search_rank'))
+
+    def test_build_query_stems_russian_words(self):
+        """Test inflected Russian words become prefix queries"""
+        self.assertEqual(PropertySearchIndex.build_query("Квартиры"), '"квартир"*')
+        self.assertEqual(PropertySearchIndex.build_query("  "), "")
+
+    def test_search_matches_inflections(self):
+        """Test search ignores case and word endings"""
+        self.assertEqual(self.search("МИНСК"), [self.flat])
+        self.assertEqual(self.search("квартиры"), [self.flat, self.house])
+
+    def test_search_matches_service_titles(self):
+        """Test search covers the service and service type titles"""
+        self.assertEqual(self.search("аренда"), [self.flat])
+        self.assertEqual(self.search("жилая"), [self.flat])
+
+    def test_index_follows_signals(self):
+        """Test saves and deletes keep the index in sync"""
+        self.service.title = "Продажа"
+        self.service.save()
+        self.assertEqual(self.search("аренда"), [])
+        self.assertEqual(self.search("продажа"), [self.flat])
+
+        self.house.location = "Гродно"
+        self.house.save()
+        self.assertEqual(self.search("брест"), [])
+
+        self.flat.delete()
+        self.assertEqual(self.search("минск"), [])
+
+    def test_rebuild(self):
+        """Test rebuilding the index restores every property"""
+        PropertySearchIndex.rebuild()
+        self.assertCountEqual(self.search("ул"), [self.flat, self.house])
+
+
+class KeysetPaginatorTest(TestCase):
+    """Test suite for KeysetPaginator"""
+
+    def setUp(self):
+        for i, price in enumerate([300, 100, 200, 100, 300, 100, 200]):
+            Property.objects.create(
+                price=Decimal(price),
+                square_meters=Decimal(10 + i),
+                details="Test property",
+                location=f"Test Location {i}"
+            )
+
+    def walk(self, ordering):
+        paginator = KeysetPaginator(Property.objects.all(), 3, ordering)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        return paginator, pages
+
+    def test_pages_follow_ordering(self):
+        """Test forward pages cover every row once in sort order"""
+        for ordering in KeysetPaginator.orderings:
+            _, pages = self.walk(ordering)
+            tie_breaker = "-pk" if ordering.startswith("-") else "pk"
+            expected = list(Property.objects.order_by(ordering, tie_breaker))
+            self.assertEqual([prop for page in pages for prop in page], expected)
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+            self.assertFalse(pages[0].has_previous())
+
+    def test_previous_cursor(self):
+        """Test prev cursors return the same pages backwards"""
+        paginator, pages = self.walk("-price")
+        previous = paginator.get_page(pages[2].prev_cursor)
+        self.assertEqual(previous.object_list, pages[1].object_list)
+        first = paginator.get_page(previous.prev_cursor)
+        self.assertEqual(first.object_list, pages[0].object_list)
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+    def test_count_is_optional(self):
+        """Test the exact count is only computed on request"""
+        self.assertIsNone(KeysetPaginator(Property.objects.all(), 3, "price").count)
+        self.assertEqual(KeysetPaginator(Property.objects.all(), 3, "price", count=True).count, 7)
+
+    def test_invalid_cursor(self):
+        """Test malformed or foreign cursors raise 404"""
+        paginator, pages = self.walk("price")
+        with self.assertRaises(Http404):
+            paginator.get_page("not-a-cursor")
+        with self.assertRaises(Http404):
+            KeysetPaginator(Property.objects.all(), 3, "-price").get_page(pages[0].next_cursor)
+
+
+class PropertyColumnIndexTest(TestCase):
+    """Test suite for PropertyColumnIndex"""
+
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(title="Test Type")
+        self.services = [
+            PropertyService.objects.create(
+                title=f"Test Service {i}",
+                service_type=self.service_type,
+                service_fee=Decimal('100.00')
+            )
+            for i in range(2)
+        ]
+        for i, price in enumerate(['150.50', '100.00', '300.00', '100.00', '250.00']):
+            Property.objects.create(
+                price=Decimal(price),
+                square_meters=Decimal(50 + i),
+                property_type=self.services[i % 2],
+                details="Test property",
+                location=f"Test Location {i}"
+            )
+        self.index = PropertyColumnIndex()
+        self.index.load()
+
+    def assertMatchesORM(self, result, queryset, ordering):
+        tie_breaker = "-pk" if ordering.startswith("-") else "pk"
+        expected = list(queryset.order_by(ordering, tie_breaker))
+        self.assertEqual(result.count(), len(expected))
+        self.assertEqual(list(result[0:3]), expected[:3])
+        self.assertEqual(list(result[3:6]), expected[3:6])
+
+    def test_query_matches_orm(self):
+        """Test filters, sorts and slices agree with the ORM"""
+        for ordering in PropertyColumnIndex.orderings:
+            self.assertMatchesORM(self.index.query(ordering=ordering), Property.objects.all(), ordering)
+            self.assertMatchesORM(
+                self.index.query(min_price=Decimal('100.00'), max_price=Decimal('150.50'), ordering=ordering),
+                Property.objects.filter(price__gte=100, price__lte=Decimal('150.50')),
+                ordering
+            )
+            self.assertMatchesORM(
+                self.index.query(service_id=self.services[0].pk, service_type_id=self.service_type.pk, ordering=ordering),
+                Property.objects.filter(property_type=self.services[0]),
+                ordering
+            )
+
+    def test_refresh_follows_writes(self):
+        """Test incremental refreshes for sold, new and removed rows"""
+        prop = Property.objects.order_by('pk').first()
+        Property.objects.filter(pk=prop.pk).update(is_available=False)
+        self.index.refresh([prop.pk])
+        self.assertNotIn(prop.pk, self.index.query().ids())
+
+        Property.objects.filter(pk=prop.pk).update(is_available=True, price=Decimal('999.00'))
+        self.index.refresh([prop.pk])
+        self.assertEqual(self.index.query().ids(0, 1).tolist(), [prop.pk])
+
+        for pk in Property.objects.exclude(pk=prop.pk).values_list('pk', flat=True):
+            self.index.remove(pk)
+        self.assertEqual(self.index.query().ids().tolist(), [prop.pk])
+
+    def test_signals_refresh_loaded_index(self):
+        """Test transactions update the shared index through signals"""
+        property_index.load()
+        self.addCleanup(property_index.unload)
+        prop = Property.objects.order_by('pk').first()
+        buyer = CustomUser.objects.create_user(username="testbuyer", password="testpass").client
+        transaction = Transaction.objects.create(buyer=buyer, property=prop)
+        self.assertNotIn(prop.pk, property_index.query().ids())
+        transaction.delete()
+        self.assertIn(prop.pk, property_index.query().ids())
+
+
+class MapboxClientTest(TestCase):
+    """Test suite for MapboxClient geocoding cache"""
+
+    def setUp(self):
+        self.server = StubServer({
+            "/geocoding/": mapbox_geocoding_route({"Минск, ул. Ленина 1": (27.56, 53.9)}),
+        })
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        settings_override = override_settings(
+            MAPBOX_GEOCODING_API=self.server.url + "/geocoding/{}.json",
+            MAPBOX_STATIC_MAP_API="https://maps.test/{lng},{lat}?token={token}",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_geocode_is_cached(self):
+        """Test repeated lookups of the same address hit Mapbox once"""
+        self.assertEqual(MapboxClient.geocode("Минск, ул. Ленина 1"), (27.56, 53.9))
+        self.assertEqual(MapboxClient.geocode("  минск,  УЛ. Ленина 1 "), (27.56, 53.9))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertTrue(GeocodedAddress.objects.get(address="минск, ул. ленина 1").found)
+
+    def test_not_found_is_cached(self):
+        """Test unknown addresses are negatively cached"""
+        self.assertIsNone(MapboxClient.geocode("Нигде"))
+        self.assertIsNone(MapboxClient.geocode("Нигде"))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(MapboxClient.get_map_image_url("Нигде"), settings.MAPBOX_DEFAULT_IMAGE)
+
+    def test_expired_entry_is_refreshed(self):
+        """Test entries older than the TTL are looked up again"""
+        MapboxClient.geocode("Нигде")
+        GeocodedAddress.objects.update(updated_at=timezone.now() - settings.MAPBOX_GEOCODE_NEGATIVE_TTL * 2)
+        MapboxClient.geocode("Нигде")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_unreachable_api_is_not_cached(self):
+        """Test network errors fall back to the placeholder without caching"""
+        with override_settings(MAPBOX_GEOCODING_API="http://127.0.0.1:1/{}.json"):
+            self.assertEqual(MapboxClient.get_map_image_url("Минск"), settings.MAPBOX_DEFAULT_IMAGE)
+        self.assertFalse(GeocodedAddress.objects.exists())
+
+    def test_map_image_url(self):
+        """Test the map URL points at the local proxy without the token"""
+        url = MapboxClient.get_map_image_url("Минск, ул. Ленина 1")
+        self.assertEqual(url, "/catalog/map/27.56000,53.90000,15/600x400.png")
+        self.assertNotIn(settings.MAPBOX_ACCESS_TOKEN, url)
+
+
+class GeocodingQueueTest(TestCase):
+    """Test suite for write-time property geocoding"""
+
+    def setUp(self):
+        self.server = StubServer({
+            "/geocoding/": mapbox_geocoding_route({
+                "Минск, ул. Ленина 1": (27.56, 53.9),
+                "Брест, ул. Советская 5": (23.68, 52.09),
+            }),
+        })
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        settings_override = override_settings(MAPBOX_GEOCODING_API=self.server.url + "/geocoding/{}.json")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        inline_queue = mock.patch.object(geocoding_queue, "workers", 0)
+        inline_queue.start()
+        self.addCleanup(inline_queue.stop)
+
+    def create_property(self, location):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Property.objects.create(
+                price=Decimal('100000.00'),
+                square_meters=Decimal('50.00'),
+                details="Test property",
+                location=location
+            )
+
+    def test_create_geocodes_property(self):
+        """Test new properties get coordinates after commit"""
+        prop = self.create_property("Минск, ул. Ленина 1")
+        prop.refresh_from_db()
+        self.assertEqual((prop.longitude, prop.latitude), (27.56, 53.9))
+
+    def test_location_change_regeocodes(self):
+        """Test changing the location replaces stale coordinates"""
+        prop = self.create_property("Минск, ул. Ленина 1")
+        prop.refresh_from_db()
+        prop.location = "Нигде"
+        with self.captureOnCommitCallbacks(execute=True):
+            prop.save()
+        prop.refresh_from_db()
+        self.assertIsNone(prop.latitude)
+
+        prop.location = "Брест, ул. Советская 5"
+        with self.captureOnCommitCallbacks(execute=True):
+            prop.save()
+        prop.refresh_from_db()
+        self.assertEqual((prop.longitude, prop.latitude), (23.68, 52.09))
+
+    def test_unchanged_location_is_not_regeocoded(self):
+        """Test saving other fields does not call Mapbox again"""
+        prop = self.create_property("Минск, ул. Ленина 1")
+        prop.refresh_from_db()
+        prop.price = Decimal('1.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            prop.save()
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_geocode_properties_command(self):
+        """Test the backfill command fills missing coordinates"""
+        Property.objects.bulk_create([
+            Property(price=Decimal('1.00'), square_meters=Decimal('1.00'), details="Test", location=location)
+            for location in ["Минск, ул. Ленина 1", "Брест, ул. Советская 5", "Нигде"]
+        ])
+        out = StringIO()
+        call_command("geocode_properties", "--workers", "0", "--batch-size", "2", stdout=out)
+        self.assertIn("2 из 3", out.getvalue())
+        self.assertEqual(Property.objects.filter(latitude__isnull=False).count(), 2)
+
+
+
+class AssignmentStrategyTest(TestCase):
+    """Test suite for pluggable agent-assignment strategies"""
+
+    def setUp(self):
+        invalidate_strategies()
+        self.addCleanup(invalidate_strategies)
+        service_type = ServiceType.objects.create(title="Аренда")
+        self.rent = PropertyService.objects.create(
+            title="Аренда квартир", service_type=service_type, service_fee=Decimal('100.00')
+        )
+        self.sale = PropertyService.objects.create(
+            title="Продажа", service_type=ServiceType.objects.create(title="Сделки"), service_fee=Decimal('100.00')
+        )
+        self.agents = []
+        for i, (specialization, department, rating) in enumerate([
+            ("Продажа", "", Decimal('4.00')),
+            ("", "аренда", Decimal('1.00')),
+            ("Ипотека", "", None),
+        ]):
+            agent = CustomUser.objects.create_user(username=f"testagent{i}", password="testpass", is_staff=True).employee
+            agent.specialization = specialization
+            agent.department = department
+            agent.performance_rating = rating
+            agent.save()
+            self.agents.append(agent)
+        self.buyers = [
+            CustomUser.objects.create_user(username=f"testbuyer{i}", password="testpass").client
+            for i in range(12)
+        ]
+
+    def create_property(self, service):
+        return Property.objects.create(
+            price=Decimal('100000.00'),
+            square_meters=Decimal('50.00'),
+            property_type=service,
+            details="Test property",
+            location="Test Location"
+        )
+
+    def assign(self, strategy, service=None, count=6):
+        prop = self.create_property(service)
+        return [
+            PropertyInquiry.objects.create_with_agent_assignment(
+                strategy=strategy, property=prop, buyer=buyer, inquiry_text="Test inquiry"
+            ).agent
+            for buyer in self.buyers[:count]
+        ]
+
+    def test_round_robin(self):
+        """Test round-robin takes agents in turn"""
+        self.assertEqual(self.assign("round_robin"), self.agents * 2)
+
+    def test_weighted(self):
+        """Test agents get inquiries in proportion to their rating"""
+        agents = self.assign("weighted", count=12)
+        # Ratings 4, 1 and the default 1
+        self.assertEqual([agents.count(agent) for agent in self.agents], [8, 2, 2])
+        self.assertEqual(agents[:2], [self.agents[0], self.agents[0]])
+
+    def test_specialization(self):
+        """Test services go to matching agents, others to everyone in turn"""
+        self.assertEqual(set(self.assign("specialization", self.sale, count=3)), {self.agents[0]})
+        self.assertEqual(set(self.assign("specialization", self.rent, count=3)), {self.agents[1]})
+        self.assertEqual(len(set(self.assign("specialization", None, count=3))), 3)
+
+    def test_state_reloads_on_employee_change(self):
+        """Test new agents are seen after an Employee save"""
+        self.assign("round_robin", count=1)
+        agent = CustomUser.objects.create_user(username="newagent", password="testpass", is_staff=True).employee
+        agent.save()
+        self.assertIn(agent, self.assign("round_robin", count=4))
+
+    def test_choice_does_not_scan_employees(self):
+        """Test in-memory strategies only touch the chosen agent's row"""
+        self.assign("round_robin", count=3)
+        prop = self.create_property(None)
+        # Savepoint, duplicate check, chosen agent, insert, counter,
+        # employee and daily statistics, release
+        with self.assertNumQueries(8):
+            PropertyInquiry.objects.create_with_agent_assignment(
+                strategy="round_robin", property=prop, buyer=self.buyers[5], inquiry_text="Test inquiry"
+            )
+
+    def test_unknown_strategy(self):
+        """Test unknown strategy names are rejected"""
+        with self.assertRaises(ValueError):
+            get_strategy("random")
+
+
+
+class StatisticsSnapshotTest(TestCase):
+    """Test suite for the incrementally maintained statistics snapshot"""
+
+    def setUp(self):
+        service_type = ServiceType.objects.create(title="Test Type")
+        self.services = [
+            PropertyService.objects.create(title=f"Service {i}", service_type=service_type, service_fee=fee)
+            for i, fee in enumerate([Decimal('100.00'), Decimal('250.00')])
+        ]
+        self.buyer = CustomUser.objects.create_user(username="testbuyer", password="testpass").client
+        self.agents = [
+            CustomUser.objects.create_user(username=f"testagent{i}", password="testpass", is_staff=True).employee
+            for i in range(2)
+        ]
+        self.properties = [
+            Property.objects.create(
+                price=Decimal(price),
+                square_meters=Decimal('50.00'),
+                property_type=service,
+                details="Test property",
+                location="Test Location"
+            )
+            for price, service in [(1000, self.services[0]), (2000, self.services[0]), (3000, self.services[1])]
+        ]
+
+    def snapshot(self):
+        return {
+            "services": {
+                row.service_id: (row.sold_count, row.fee_total, row.total_amount, row.inquiry_count)
+                for row in ServiceStatistics.objects.all()
+            },
+            "rollups": {
+                (row.employee_id, row.service_id, row.day): (row.sold_count, row.fee_total, row.total_amount, row.inquiry_count)
+                for row in DailyRollup.objects.all()
+            },
+            "days": {
+                row.day: (row.sold_count, row.fee_total, row.total_amount, row.inquiry_count)
+                for row in DailyStatistics.objects.all()
+            },
+            "bins": {
+                (row.field, row.service_id, row.day, row.bin): row.count
+                for row in DistributionBin.objects.filter(count__gt=0)
+            },
+        }
+
+    def sell(self, prop, agent):
+        return Transaction.objects.create(buyer=self.buyer, agent=agent, property=prop)
+
+    def test_sales_are_counted(self):
+        """Test transactions add to service, employee and daily counters"""
+        self.sell(self.properties[0], self.agents[0])
+        self.sell(self.properties[1], self.agents[0])
+        self.sell(self.properties[2], self.agents[1])
+        today = timezone.localdate()
+
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot["services"][self.services[0].pk], (2, Decimal('200.00'), Decimal('3200.00'), 0))
+        self.assertEqual(snapshot["services"][self.services[1].pk], (1, Decimal('250.00'), Decimal('3250.00'), 0))
+        self.assertEqual(snapshot["rollups"][(self.agents[0].pk, self.services[0].pk, today)][0], 2)
+        self.assertEqual(snapshot["rollups"][(self.agents[1].pk, self.services[1].pk, today)][0], 1)
+        self.assertEqual(snapshot["days"][today], (3, Decimal('450.00'), Decimal('6450.00'), 0))
+
+    def test_changes_and_deletes_are_reverted(self):
+        """Test moving or deleting a transaction takes its contribution back"""
+        transaction = self.sell(self.properties[0], self.agents[0])
+        transaction.property = self.properties[2]
+        transaction.agent = self.agents[1]
+        transaction.save()
+
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot["services"][self.services[0].pk][0], 0)
+        self.assertEqual(snapshot["services"][self.services[1].pk][0], 1)
+        self.assertEqual(snapshot["rollups"][(self.agents[0].pk, self.services[0].pk, timezone.localdate())][0], 0)
+
+        transaction.delete()
+        self.assertEqual(self.snapshot()["days"][timezone.localdate()][:3], (0, Decimal('0.00'), Decimal('0.00')))
+
+    def test_fingerprint_follows_changes(self):
+        """Test reassignments, renames and deletes all give a new ETag and a later Last-Modified"""
+        transaction = self.sell(self.properties[0], self.agents[0])
+        fingerprints = [StatisticsSnapshot.get_fingerprint()]
+        self.assertEqual(StatisticsSnapshot.get_fingerprint(), fingerprints[0])
+
+        transaction.agent = self.agents[1]
+        transaction.save()
+        fingerprints.append(StatisticsSnapshot.get_fingerprint())
+
+        self.services[0].title = "Renamed"
+        self.services[0].save()
+        fingerprints.append(StatisticsSnapshot.get_fingerprint())
+
+        user = self.agents[1].user
+        user.username = "renamed"
+        user.save()
+        fingerprints.append(StatisticsSnapshot.get_fingerprint())
+
+        transaction.delete()
+        fingerprints.append(StatisticsSnapshot.get_fingerprint())
+
+        self.assertEqual(len({etag for etag, _ in fingerprints}), len(fingerprints))
+        for (_, previous), (_, current) in zip(fingerprints, fingerprints[1:]):
+            self.assertGreater(current, previous)
+
+    def test_inquiries_are_counted(self):
+        """Test inquiries add to the inquiry counters"""
+        inquiry = PropertyInquiry.objects.create(property=self.properties[2], buyer=self.buyer, agent=self.agents[1])
+        self.assertEqual(self.snapshot()["services"][self.services[1].pk][3], 1)
+        inquiry.delete()
+        self.assertEqual(self.snapshot()["services"][self.services[1].pk][3], 0)
+
+    def test_fee_is_kept_from_time_of_sale(self):
+        """Test later fee changes do not rewrite past sales"""
+        self.sell(self.properties[0], self.agents[0])
+        PropertyService.objects.filter(pk=self.services[0].pk).update(service_fee=Decimal('999.00'))
+        StatisticsSnapshot.rebuild()
+        self.assertEqual(self.snapshot()["services"][self.services[0].pk][1], Decimal('100.00'))
+
+    def test_rebuild_matches_incremental(self):
+        """Test the bulk rebuild gives the same snapshot as incremental updates"""
+        self.sell(self.properties[0], self.agents[0])
+        self.sell(self.properties[2], self.agents[1])
+        PropertyInquiry.objects.create(property=self.properties[1], buyer=self.buyer, agent=self.agents[0])
+        incremental = self.snapshot()
+
+        ServiceStatistics.objects.update(sold_count=42)
+        out = StringIO()
+        call_command("rebuild_statistics", stdout=out)
+        self.assertIn("ServiceStatistics 2", out.getvalue())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_distributions_follow_sales_and_prices(self):
+        """Test sketches take in sales and price changes and merge over services and days"""
+        self.sell(self.properties[0], self.agents[0])
+        self.sell(self.properties[2], self.agents[1])
+        self.properties[1].price = Decimal('5000.00')
+        self.properties[1].save()
+
+        totals = StatisticsSnapshot.get_distribution("total_amount")
+        self.assertEqual(totals.count, 2)
+        self.assertAlmostEqual(totals.quantile(1), 3250, delta=3250 * RELATIVE_ACCURACY)
+        fees = StatisticsSnapshot.get_distribution("service_fee", services=[self.services[0].pk])
+        self.assertEqual(fees.count, 1)
+        self.assertAlmostEqual(fees.quantile(0), 100, delta=100 * RELATIVE_ACCURACY)
+        yesterday = timezone.localdate() - timedelta(days=1)
+        self.assertEqual(StatisticsSnapshot.get_distribution("total_amount", end=yesterday).count, 0)
+
+        prices = StatisticsSnapshot.get_distribution("price", start=yesterday)
+        self.assertEqual(prices.count, 3)
+        self.assertAlmostEqual(prices.quantile(1), 5000, delta=5000 * RELATIVE_ACCURACY)
+
+        self.properties[2].delete()
+        self.assertEqual(StatisticsSnapshot.get_distribution("price").count, 2)
+        self.assertEqual(StatisticsSnapshot.get_distribution("total_amount").count, 1)
+
+    def test_employees_in_period(self):
+        """Test employee totals only include days in the period"""
+        self.sell(self.properties[0], self.agents[0])
+        self.sell(self.properties[2], self.agents[1])
+        DailyRollup.objects.filter(employee=self.agents[1]).update(
+            day=timezone.localdate() - timedelta(days=40)
+        )
+        employees = StatisticsSnapshot.get_employees(days_ago=30)
+        self.assertEqual([(e, e.total_amount) for e in employees], [(self.agents[0], Decimal('1100.00'))])
+
+    def test_sales_without_agent_are_rolled_up(self):
+        """Test sales without an agent count for their service and day"""
+        self.sell(self.properties[0], None)
+        self.sell(self.properties[1], None)
+        rollups = self.snapshot()["rollups"]
+        self.assertEqual(rollups, {
+            (None, self.services[0].pk, timezone.localdate()): (2, Decimal('200.00'), Decimal('3200.00'), 0)
+        })
+        self.assertEqual(StatisticsSnapshot.get_employees(), [])
+
+    def test_date_ranges_sum_rollups(self):
+        """Test arbitrary periods are answered from the rollups"""
+        today = timezone.localdate()
+        for prop, agent, days_ago in [
+            (self.properties[0], self.agents[0], 0),
+            (self.properties[1], self.agents[1], 40),
+            (self.properties[2], self.agents[1], 400),
+        ]:
+            transaction = self.sell(prop, agent)
+            Transaction.objects.filter(pk=transaction.pk).update(transaction_date=today - timedelta(days=days_ago))
+        StatisticsSnapshot.rebuild()
+
+        last_week = StatisticsSnapshot.get_services(today - timedelta(days=6), today)
+        self.assertEqual([(s.service, s.sold_count) for s in last_week], [(self.services[0], 1)])
+        self.assertEqual(len(StatisticsSnapshot.get_services()), 2)
+
+        year = StatisticsSnapshot.get_employees(start=today - timedelta(days=364), end=today)
+        self.assertEqual([(e, e.total_amount) for e in year], [(self.agents[1], Decimal('2100.00')), (self.agents[0], Decimal('1100.00'))])
+        old = StatisticsSnapshot.get_employees(start=today - timedelta(days=500), end=today - timedelta(days=100))
+        self.assertEqual([(e, e.sold_count) for e in old], [(self.agents[1], 1)])
+
+        self.assertEqual(StatisticsSnapshot.get_totals(today - timedelta(days=364))["total_amount"], Decimal('3200.00'))
+        monthly = StatisticsSnapshot.get_monthly()
+        self.assertEqual([month["sold_count"] for month in monthly], [1, 1, 1])
+        self.assertIsNone(monthly[0]["change"])
+
+
+class MetricRegistryTest(TestCase):
+    """Test suite for the metric registry"""
+
+    def setUp(self):
+        cache.clear()
+        self.service = PropertyService.objects.create(
+            title="Test Service",
+            service_type=ServiceType.objects.create(title="Test Type"),
+            service_fee=Decimal('100.00')
+        )
+        self.buyer = CustomUser.objects.create_user(username="testbuyer", password="testpass").client
+        self.properties = [
+            Property.objects.create(
+                price=Decimal(price),
+                square_meters=Decimal('50.00'),
+                property_type=self.service,
+                details="Test property",
+                location="Test Location"
+            )
+            for price in [1000, 2000, 3000]
+        ]
+
+    def test_aggregates_share_one_query(self):
+        """Test aggregates over one model are computed in a single query"""
+        with self.assertNumQueries(1):
+            stats = StatisticsCalculator.get_property_stats()
+        self.assertEqual(stats["total_properties"], 3)
+        self.assertEqual(stats["active_listings"], 3)
+        self.assertEqual(stats["price_range"], {"min": Decimal('1000.00'), "max": Decimal('3000.00')})
+        with self.assertNumQueries(0):
+            StatisticsCalculator.get_property_stats()
+
+    def test_writes_invalidate_tagged_metrics(self):
+        """Test a sale refreshes the metrics tagged with its models"""
+        StatisticsCalculator.get_property_stats()
+        StatisticsCalculator.get_transaction_stats()
+        Transaction.objects.create(buyer=self.buyer, property=self.properties[0])
+        self.assertEqual(StatisticsCalculator.get_property_stats()["active_listings"], 2)
+        stats = StatisticsCalculator.get_transaction_stats()
+        self.assertEqual((stats["total_transactions"], stats["monthly_transactions"]), (1, 1))
+        self.assertEqual(stats["avg_transaction_value"], Decimal('1100.00'))
+
+    def test_service_performance_counts_each_sale_once(self):
+        """Test inquiries do not multiply the sales of a service"""
+        for i in range(3):
+            PropertyInquiry.objects.create(
+                property=self.properties[0],
+                buyer=CustomUser.objects.create_user(username=f"testclient{i}", password="testpass").client,
+                inquiry_text="Test inquiry",
+            )
+        Transaction.objects.create(buyer=self.buyer, property=self.properties[0])
+        performance = StatisticsCalculator.get_service_performance()
+        self.assertEqual(len(performance), 1)
+        self.assertEqual(performance[0]["total_transactions"], 1)
+        self.assertEqual(performance[0]["total_revenue"], Decimal('1100.00'))
+        self.assertEqual(performance[0]["avg_processing_time"], timedelta(0))
+        self.assertEqual(
+            set(performance[0]), {"title", "total_transactions", "total_revenue", "avg_processing_time"}
+        )
+
+    def test_tags_and_timings(self):
+        """Test only the invalidated tags recompute and timings are kept per metric"""
+        registry = MetricRegistry(prefix="test-metrics")
+        calls = []
+        registry.register(Metric("first", lambda: calls.append("first") or len(calls), tags=("a",)))
+        registry.register(Metric("second", lambda: calls.append("second") or len(calls), tags=("b",)))
+        registry.register(Aggregate("count", Property, Count("id")))
+
+        self.assertEqual(registry.get_many(["first", "second"]), {"first": 1, "second": 2})
+        registry.invalidate("b")
+        self.assertEqual(registry.get_many(["first", "second"]), {"first": 1, "second": 3})
+        self.assertEqual(registry.get("count"), 3)
+
+        stats = registry.stats()
+        self.assertEqual((stats["first"]["hits"], stats["first"]["misses"]), (1, 1))
+        self.assertEqual((stats["second"]["hits"], stats["second"]["misses"]), (0, 2))
+        self.assertGreater(stats["count"]["time"], 0)
+        with self.assertRaises(ValueError):
+            registry.register(Metric("first", lambda: 0))
+
+
+
+class ConversionFunnelTest(TestCase):
+    """Test suite for the inquiry to sale funnel"""
+
+    def setUp(self):
+        cache.clear()
+        self.service = PropertyService.objects.create(
+            title="Test Service",
+            service_type=ServiceType.objects.create(title="Test Type"),
+            service_fee=Decimal('100.00')
+        )
+        self.agent = CustomUser.objects.create_user(username="testagent", password="testpass", is_staff=True).employee
+        self.properties = [
+            Property.objects.create(
+                price=Decimal('1000.00'),
+                square_meters=Decimal('50.00'),
+                property_type=self.service,
+                details="Test property",
+                location="Test Location"
+            )
+            for _ in range(4)
+        ]
+        self.buyers = [
+            CustomUser.objects.create_user(username=f"testclient{i}", password="testpass").client
+            for i in range(3)
+        ]
+        # Every buyer asks about the first property, one buys it
+        for i, buyer in enumerate(self.buyers):
+            PropertyInquiry.objects.create(
+                property=self.properties[0], buyer=buyer, agent=self.agent,
+                state="processing" if i else "pending",
+            )
+        for days, prop in zip([2, 10], self.properties[1:3]):
+            inquiry = PropertyInquiry.objects.create(property=prop, buyer=self.buyers[0], agent=self.agent)
+            PropertyInquiry.objects.filter(pk=inquiry.pk).update(
+                created_at=timezone.now() - timedelta(days=days)
+            )
+            Transaction.objects.create(buyer=self.buyers[0], agent=self.agent, property=prop)
+        Transaction.objects.create(buyer=self.buyers[1], agent=self.agent, property=self.properties[0])
+
+    def test_stages_and_time_to_close(self):
+        """Test each inquiry counts once per stage and closes on its own sale"""
+        with self.assertNumQueries(2):
+            rows = ConversionFunnel.compute("agent")
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row["key"], "testagent")
+        self.assertEqual((row["created"], row["processing"], row["closed"]), (5, 4, 3))
+        self.assertAlmostEqual(row["conversion"], 60.0)
+        self.assertEqual(row["time_to_close"]["mean"], 4.0)
+        self.assertEqual(row["time_to_close"]["percentiles"][50], 2.0)
+        self.assertEqual(row["time_to_close"]["percentiles"][90], 8.4)
+
+    def test_period_and_daily_cache(self):
+        """Test the period bounds the inquiries and results are cached for the day"""
+        rows = ConversionFunnel.get("service_type", start=timezone.localdate() - timedelta(days=5))
+        self.assertEqual((rows[0]["key"], rows[0]["created"], rows[0]["closed"]), ("Test Type", 4, 2))
+        PropertyInquiry.objects.create(property=self.properties[3], buyer=self.buyers[2])
+        with self.assertNumQueries(0):
+            ConversionFunnel.get("service_type", start=timezone.localdate() - timedelta(days=5))
+
+    def test_client_insights_conversion(self):
+        """Test the conversion rate is not multiplied by the inquiries on a sold property"""
+        preferred = StatisticsCalculator.get_client_insights()["preferred_properties"]
+        self.assertEqual(preferred[0]["inquiry_count"], 5)
+        self.assertAlmostEqual(preferred[0]["conversion_rate"], 60.0)
+
+
+class VectorStatisticsTest(TestCase):
+    """Test suite for the NumPy statistics core"""
+
+    def setUp(self):
+        service_type = ServiceType.objects.create(title="Test Type")
+        self.service = PropertyService.objects.create(
+            title="Test Service", service_type=service_type, service_fee=Decimal('100.00')
+        )
+        self.buyer = CustomUser.objects.create_user(username="testbuyer", password="testpass").client
+        self.prices = [1000, 2000, 2000, 3500, 8000, 1250]
+        for price in self.prices:
+            Transaction.objects.create(
+                buyer=self.buyer,
+                property=Property.objects.create(
+                    price=Decimal(price),
+                    square_meters=Decimal('50.00'),
+                    property_type=self.service,
+                    details="Test property",
+                    location="Test Location"
+                ),
+            )
+
+    def test_load_columns_in_chunks(self):
+        """Test columns are streamed in chunks smaller than the row count"""
+        columns = VectorStatistics.load_columns(
+            Transaction.objects.order_by("pk"), ("total_amount", "service_fee"), chunk_size=4
+        )
+        np.testing.assert_array_equal(columns["total_amount"], [price + 100 for price in self.prices])
+        np.testing.assert_array_equal(columns["service_fee"], [100] * len(self.prices))
+        self.assertEqual(columns["total_amount"].dtype, np.float64)
+
+    def test_describe_matches_numpy(self):
+        """Test describe agrees with numpy for mean, median and percentiles"""
+        values = np.random.default_rng(0).integers(0, 50, size=1001).astype(np.float64)
+        stats = VectorStatistics.describe(values)
+        self.assertEqual(stats["count"], 1001)
+        self.assertAlmostEqual(stats["mean"], values.mean())
+        self.assertAlmostEqual(stats["median"], np.median(values))
+        for q, value in stats["percentiles"].items():
+            self.assertAlmostEqual(value, np.percentile(values, q))
+        counts = np.bincount(values.astype(np.int64))
+        self.assertEqual(stats["mode"], counts.argmax())
+
+    def test_describe_mode_ties_and_empty(self):
+        """Test the smallest value wins a mode tie and empty input gives zeros"""
+        self.assertEqual(VectorStatistics.describe(np.array([3.0, 1.0, 3.0, 1.0, 2.0]))["mode"], 1.0)
+        stats = VectorStatistics.describe(np.array([]))
+        self.assertEqual((stats["count"], stats["mean"], stats["median"]), (0, 0.0, 0.0))
+
+    def test_ages_around_birthday(self):
+        """Test a birthday later in the year is not counted yet"""
+        clients = []
+        for i, birth_date in enumerate([date(2000, 6, 14), date(2000, 6, 15), date(2000, 6, 16)]):
+            client = CustomUser.objects.create_user(username=f"testclient{i}", password="testpass").client
+            client.birth_date = birth_date
+            client.save()
+            clients.append(client.pk)
+        ages = VectorStatistics.ages(
+            Client.objects.filter(pk__in=clients).order_by("birth_date"), "birth_date", date(2020, 6, 15)
+        )
+        np.testing.assert_array_equal(ages, [20, 20, 19])
+
+    def test_sale_cost_stats(self):
+        """Test sale statistics are read from the sketches within their accuracy"""
+        cost_stats, service_stats = StatisticsCalculator.get_sale_cost_stats()
+        totals = np.array(self.prices) + 100
+        self.assertAlmostEqual(cost_stats["mean_cost"], totals.mean(), delta=totals.mean() * RELATIVE_ACCURACY)
+        self.assertAlmostEqual(cost_stats["median_cost"], 2100, delta=2100 * RELATIVE_ACCURACY)
+        self.assertAlmostEqual(cost_stats["mode_cost"], 2100, delta=2100 * RELATIVE_ACCURACY)
+        self.assertAlmostEqual(service_stats["mean_cost"], 100, delta=100 * RELATIVE_ACCURACY)
+
+
+class QuantileSketchTest(TestCase):
+    """Test suite for the mergeable quantile sketch"""
+
+    def test_quantiles_within_accuracy(self):
+        """Test every quantile is within the relative accuracy of numpy's"""
+        values = np.random.default_rng(0).lognormal(8, 1, size=5000)
+        sketch = QuantileSketch.from_values(values)
+        self.assertEqual(sketch.count, 5000)
+        for q in (0, 0.05, 0.25, 0.5, 0.75, 0.95, 1):
+            expected = np.percentile(values, q * 100)
+            self.assertLessEqual(abs(sketch.quantile(q) - expected), expected * RELATIVE_ACCURACY)
+
+    def test_merge_equals_sketch_of_all_values(self):
+        """Test merged sketches give the quantiles of the combined values"""
+        rng = np.random.default_rng(1)
+        parts = [rng.uniform(10, 10000, size=size) for size in (100, 1000, 10)]
+        merged = QuantileSketch()
+        for part in parts:
+            merged.merge(QuantileSketch.from_values(part))
+        combined = QuantileSketch.from_values(np.concatenate(parts))
+        self.assertEqual(merged.bins, combined.bins)
+        self.assertEqual(merged.describe(), combined.describe())
+
+    def test_removal_and_zero(self):
+        """Test removed values leave the sketch and amounts below a cent read as zero"""
+        sketch = QuantileSketch.from_values([0, 0, 500, 700])
+        sketch.add(700, -1)
+        self.assertEqual(sketch.count, 3)
+        self.assertEqual(sketch.describe()["mode"], 0.0)
+        self.assertAlmostEqual(sketch.quantile(1), 500, delta=500 * RELATIVE_ACCURACY)
+        self.assertEqual(QuantileSketch().describe()["count"], 0)
+
+
+class HttpClientTest(TestCase):
+    """Test suite for pooled outbound HTTP with circuit breakers"""
+
+    def setUp(self):
+        self.healthy = True
+
+        def flaky_route(path, query):
+            return (200, {"ok": True}) if self.healthy else (500, {})
+
+        def slow_route(path, query):
+            time.sleep(0.3)
+            return 200, {}
+
+        self.server = StubServer({
+            "/flaky": flaky_route,
+            "/slow": slow_route,
+        })
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.client = HttpClient(pool_size=2, failure_threshold=3, reset_timeout=0.2)
+        self.host = self.server.url[len("http://"):]
+
+    def test_connections_are_reused(self):
+        """Test sequential requests share one keep-alive connection"""
+        for _ in range(5):
+            self.assertEqual(self.client.get(self.server.url + "/flaky").status_code, 200)
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(len(self.server.client_ports), 1)
+
+    def test_circuit_opens_after_failures(self):
+        """Test repeated 5xx answers open the circuit and stop calling the host"""
+        self.healthy = False
+        for _ in range(3):
+            self.assertEqual(self.client.get(self.server.url + "/flaky").status_code, 500)
+        with self.assertRaises(CircuitOpenError):
+            self.client.get(self.server.url + "/flaky")
+        self.assertEqual(len(self.server.requests), 3)
+
+        stats = self.client.stats()[self.host]
+        self.assertEqual(stats["state"], CircuitBreaker.OPEN)
+        self.assertEqual((stats["requests"], stats["errors"], stats["rejected"]), (3, 3, 1))
+
+    def test_half_open_probe_closes_circuit(self):
+        """Test a successful probe after the reset timeout closes the circuit"""
+        self.healthy = False
+        for _ in range(3):
+            self.client.get(self.server.url + "/flaky")
+        self.healthy = True
+        time.sleep(0.25)
+        self.assertEqual(self.client.get(self.server.url + "/flaky").status_code, 200)
+        self.assertEqual(self.client.stats()[self.host]["state"], CircuitBreaker.CLOSED)
+
+    def test_failed_probe_reopens_circuit(self):
+        """Test a failing probe opens the circuit again immediately"""
+        self.healthy = False
+        for _ in range(3):
+            self.client.get(self.server.url + "/flaky")
+        time.sleep(0.25)
+        self.client.get(self.server.url + "/flaky")
+        with self.assertRaises(CircuitOpenError):
+            self.client.get(self.server.url + "/flaky")
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_timeouts_are_counted(self):
+        """Test timeouts count as errors and latency is recorded"""
+        with self.assertRaises(requests.Timeout):
+            self.client.get(self.server.url + "/slow", timeout=0.1)
+        self.client.get(self.server.url + "/slow", timeout=2)
+        stats = self.client.stats()[self.host]
+        self.assertEqual((stats["requests"], stats["errors"]), (2, 1))
+        self.assertGreaterEqual(stats["max_latency"], 0.3)
+
+    def test_timezone_service_falls_back_when_circuit_open(self):
+        """Test TimezoneService answers UTC without calling an open-circuit host"""
+        breaker, _ = self.client._for_host("ip-api.com")
+        for _ in range(3):
+            breaker.record_failure()
+        with mock.patch("users.utils.timezone_service.http_client", self.client):
+            self.assertEqual(str(TimezoneService.get_timezone_from_ip("1.2.3.4")), "UTC")
+        self.assertEqual(self.client.stats()["ip-api.com"]["rejected"], 1)
+
+    def test_timezone_service_falls_back_on_unexpected_json(self):
+        """Test TimezoneService answers UTC for well-formed JSON of another shape"""
+        for payload in ([], {"timezone": 5}, {"timezone": "Nowhere/Else"}):
+            response = mock.Mock(json=mock.Mock(return_value=payload))
+            with mock.patch("users.utils.timezone_service.http_client.get", return_value=response):
+                self.assertEqual(str(TimezoneService.get_timezone_from_ip("1.2.3.4")), "UTC")
+
+
+class TwoTierCacheTest(TestCase):
+    """Test suite for the in-process LRU in front of the shared cache"""
+
+    def setUp(self):
+        self.shared = caches["shared"]
+        self.cache = TwoTierCache("", {
+            "OPTIONS": {"SHARED": "shared", "LOCAL_MAX_ENTRIES": 2, "LOCAL_TIMEOUT": 0.2},
+        })
+        self.other = TwoTierCache("", {"OPTIONS": {"SHARED": "shared"}})
+        self.cache.clear()
+
+    def test_local_hit_skips_shared(self):
+        """Test a value read once is served without asking the shared cache"""
+        value = {"rows": [1, 2, 3]}
+        self.cache.set("key", value)
+        with mock.patch.object(self.shared, "get", side_effect=AssertionError) as shared_get:
+            self.assertIs(self.cache.get("key"), value)
+            self.assertEqual(self.cache.get_many(["key"]), {"key": value})
+        shared_get.assert_not_called()
+
+    def test_other_processes_see_changes(self):
+        """Test version stamps are read through at once and values after the local timeout"""
+        self.cache.set("page:version", 1, None)
+        self.cache.set("page", "old")
+        self.other.set("page:version", 2, None)
+        self.other.set("page", "new")
+        self.assertEqual(self.cache.get("page:version"), 2)
+        self.assertEqual(self.cache.get("page"), "old")
+        time.sleep(0.25)
+        self.assertEqual(self.cache.get("page"), "new")
+
+    def test_lru_is_bounded(self):
+        """Test the least recently used value leaves the local tier but stays shared"""
+        for key in ("a", "b"):
+            self.cache.set(key, key)
+        self.cache.get("a")
+        self.cache.set("c", "c")
+        self.assertEqual(len(self.cache.local), 2)
+        self.assertEqual(self.cache.get_many(["a", "b", "c"]), {"a": "a", "b": "b", "c": "c"})
+
+    def test_writes_reach_both_tiers(self):
+        """Test delete, add and incr keep the tiers consistent"""
+        self.cache.set("key", 1)
+        self.cache.delete("key")
+        self.assertIsNone(self.cache.get("key"))
+        self.assertTrue(self.cache.add("key", 1))
+        self.assertFalse(self.other.add("key", 5))
+        self.assertEqual(self.cache.incr("key"), 2)
+        self.assertEqual(self.other.get("key"), 2)
+        self.assertEqual(self.cache.get("key"), 2)
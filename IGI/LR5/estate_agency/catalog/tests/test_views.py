@@ -1,8 +1,17 @@
-from datetime import datetime
-from django.test import TestCase, RequestFactory, Client
-from django.urls import reverse
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory, Client, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
 from django.contrib.messages import get_messages
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
 from decimal import Decimal
 from ..views import (
     PropertyServiceListView,
@@ -10,8 +19,13 @@ from ..views import (
     PropertyDetailView,
     ClientDashboardView,
     EmployeeDashboardView,
+    StaticMapView,
+    StatisticsView,
 )
-from ..models import PropertyService, ServiceType, Property, Transaction, PropertyInquiry
+from ..models import PropertyService, ServiceType, Property, Transaction, PropertyInquiry, StaticMapTile
+from ..utils.map_cache import TOTAL_SIZE_KEY, StaticMapCache
+from ..utils.snapshot import StatisticsSnapshot
+from .stubs import StubServer
 from users.models import Client as UserClient, Employee, User
 
 def create_user(username, role, password='testpass'):
@@ -77,6 +91,49 @@ class AvailablePropertyListViewTest(ViewTestBase):
         response = self.client.get(reverse('property_list'))
         self.assertEqual(response.status_code, 302)
 
+class AvailablePropertyPaginationTest(TestCase):
+    """Test suite for the pager of the available-property listing"""
+
+    def setUp(self):
+        cache.clear()
+        service = PropertyService.objects.create(
+            title="Аренда", service_type=ServiceType.objects.create(title="Test Type"), service_fee=Decimal('100.00')
+        )
+        # Saved one by one so the search index is filled
+        for i in range(12):
+            Property.objects.create(
+                price=Decimal(1000 + i),
+                square_meters=Decimal('50.00'),
+                property_type=service,
+                details="Test property",
+                location=f"Test Location {i}",
+            )
+
+    def render(self, **params):
+        request = RequestFactory().get(reverse('catalog:property_list'), params)
+        request.user = mock.Mock(
+            pk=1, is_authenticated=True, is_superuser=False, role="client",
+            first_name="Anna", profile=mock.Mock(id=1),
+        )
+        response = AvailablePropertyListView.as_view()(request)
+        return response.render().content.decode()
+
+    def test_keyset_mode(self):
+        """Test the listing shows only the cursor links"""
+        content = self.render()
+        self.assertEqual(content.count('class="pagination'), 1)
+        self.assertIn("?cursor=", content)
+        self.assertNotIn("page=", content)
+
+    def test_search_mode(self):
+        """Test search results show only the page links"""
+        content = self.render(search="Test")
+        self.assertEqual(content.count('class="pagination'), 1)
+        self.assertIn("page=2", content)
+        self.assertIn("Страница 1 из 2", content)
+        self.assertNotIn("cursor=", content)
+
+
 class PropertyDetailViewTest(ViewTestBase):
     def test_context_for_authenticated(self):
         self.login()
@@ -326,3 +383,200 @@ class PropertyInquiryViewTest(TestCase):
         inquiry.refresh_from_db()
         self.assertEqual(inquiry.state, 'processing')
 
+
+class StaticMapViewTest(TestCase):
+    """Test suite for the static map proxy"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.server = StubServer({"/static/": lambda path, query: (200, f"PNG {path}".encode())})
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            MAPBOX_STATIC_MAP_API=self.server.url + "/static/{lng},{lat},{zoom}/{width}x{height}",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        prop = Property.objects.create(
+            price=Decimal('1000.00'),
+            square_meters=Decimal('50.00'),
+            details="Test property",
+            location="Test Location",
+        )
+        # Saving a new location clears the coordinates until it is geocoded
+        Property.objects.filter(pk=prop.pk).update(longitude=27.560001, latitude=53.899998)
+        self.url = reverse('catalog:static_map', kwargs={
+            'lng': '27.56000', 'lat': '53.90000', 'zoom': 15, 'width': 600, 'height': 400,
+        })
+
+    def get(self, url=None, user=True, **headers):
+        url = url or self.url
+        request = RequestFactory().get(url, **headers)
+        request.user = mock.Mock(is_authenticated=True) if user else AnonymousUser()
+        return StaticMapView.as_view()(request, **resolve(url).kwargs)
+
+    def test_map_is_fetched_once(self):
+        """Test repeated requests are served from the disk cache"""
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"PNG 27.56,53.9,15/600x400")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+        self.get()
+        self.assertEqual(len(self.server.requests), 1)
+
+        tile = StaticMapTile.objects.get()
+        self.assertTrue(os.path.exists(tile.get_path()))
+        self.assertEqual(os.path.basename(tile.get_path()), f"{tile.digest}.png")
+
+    def test_conditional_request(self):
+        """Test a matching ETag returns 304"""
+        etag = self.get()["ETag"]
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalid_size(self):
+        """Test oversized maps are rejected"""
+        url = reverse('catalog:static_map', kwargs={
+            'lng': '27.56000', 'lat': '53.90000', 'zoom': 15, 'width': 5000, 'height': 400,
+        })
+        with self.assertRaises(Http404):
+            self.get(url)
+
+    def test_only_property_locations(self):
+        """Test maps of other or impossible coordinates are not fetched"""
+        for lng, lat in (('27.57000', '53.90000'), ('270.56000', '53.90000'), ('27.56000', '93.90000')):
+            url = reverse('catalog:static_map', kwargs={
+                'lng': lng, 'lat': lat, 'zoom': 15, 'width': 600, 'height': 400,
+            })
+            with self.assertRaises(Http404):
+                self.get(url)
+        self.assertEqual(self.server.requests, [])
+
+    def test_requires_login(self):
+        """Test anonymous visitors are sent to the login page"""
+        self.assertEqual(self.get(user=False).status_code, 302)
+        self.assertEqual(self.server.requests, [])
+
+    def test_tile_evicted_during_request(self):
+        """Test a tile file removed after the lookup is fetched again instead of failing"""
+        tile = StaticMapCache.get_tile(27.56, 53.9, 15, 600, 400)
+        evicted = StaticMapTile(digest="0" * 64)
+        with mock.patch.object(StaticMapCache, "get_tile", side_effect=[evicted, tile]):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], f'"{tile.digest}"')
+
+    def test_running_total(self):
+        """Test misses keep a running size and evict once it is over the limit"""
+        for zoom in (10, 11):
+            StaticMapCache.get_tile(27.56, 53.9, zoom, 600, 400)
+        sizes = list(StaticMapTile.objects.values_list("size", flat=True))
+        self.assertEqual(cache.get(TOTAL_SIZE_KEY), sum(sizes))
+
+        with override_settings(MAPBOX_MAP_CACHE_MAX_BYTES=sum(sizes)):
+            StaticMapCache.get_tile(27.56, 53.9, 12, 600, 400)
+        self.assertFalse(StaticMapTile.objects.filter(zoom=10).exists())
+        self.assertEqual(cache.get(TOTAL_SIZE_KEY), StaticMapCache.get_total_size())
+
+    def test_lru_eviction(self):
+        """Test the least recently used tiles are dropped over the size limit"""
+        for zoom in (10, 11, 12):
+            StaticMapCache.get_tile(27.56, 53.9, zoom, 600, 400)
+        self.assertEqual(StaticMapTile.objects.count(), 3)
+        oldest = StaticMapTile.objects.get(zoom=10)
+        tile_size = oldest.size
+
+        StaticMapCache.evict(max_bytes=tile_size * 2)
+        self.assertFalse(StaticMapTile.objects.filter(zoom=10).exists())
+        self.assertFalse(os.path.exists(oldest.get_path()))
+        self.assertEqual(StaticMapTile.objects.count(), 2)
+
+
+class StatisticsViewTest(TestCase):
+    """Test suite for StatisticsView"""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user(
+            username="testadmin", password="testpass", is_staff=True, is_superuser=True
+        )
+        buyer = get_user_model().objects.create_user(username="testbuyer", password="testpass").client
+        service = PropertyService.objects.create(
+            title="Аренда", service_type=ServiceType.objects.create(title="Test Type"), service_fee=Decimal('100.00')
+        )
+        for price in [1000, 3000]:
+            Transaction.objects.create(
+                buyer=buyer,
+                agent=self.admin.employee,
+                property=Property.objects.create(
+                    price=Decimal(price),
+                    square_meters=Decimal('50.00'),
+                    property_type=service,
+                    details="Test property",
+                    location="Test Location"
+                ),
+            )
+
+    def get(self, **params):
+        request = RequestFactory().get(reverse("catalog:statistics"), params)
+        request.user = self.admin
+        return StatisticsView.as_view()(request)
+
+    def test_context_from_snapshot(self):
+        """Test the page context comes from snapshot aggregates"""
+        context = self.get().context_data
+        self.assertEqual(context["popular_category"].sold_count, 2)
+        self.assertEqual(context["highest_cost_service"].total_amount, Decimal('4200.00'))
+        self.assertEqual(context["employee_total_stats"], [self.admin.employee])
+        self.assertAlmostEqual(context["cost_stats"]["median_cost"], 2100, delta=21)
+
+    def test_period_filters_statistics(self):
+        """Test the chosen period limits rankings, totals and months"""
+        Transaction.objects.filter(property__price=3000).update(
+            transaction_date=timezone.localdate() - timedelta(days=60)
+        )
+        StatisticsSnapshot.rebuild()
+        context = self.get(period="30").context_data
+        self.assertEqual(context["popular_category"].sold_count, 1)
+        self.assertEqual(context["totals"]["total_amount"], Decimal('1100.00'))
+        self.assertEqual(len(self.get(start=timezone.localdate() - timedelta(days=90)).context_data["monthly"]), 2)
+
+        self.client.force_login(self.admin)
+        charts = self.client.get(reverse("catalog:statistics_data"), {"period": "7"}).json()["charts"]
+        self.assertEqual(charts["services_by_full_costs"]["values"], [1100.0])
+
+    def test_chart_data(self):
+        """Test the JSON endpoint returns the series behind every chart"""
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("catalog:statistics_data"))
+        self.assertEqual(response.status_code, 200)
+        charts = response.json()["charts"]
+        self.assertEqual(charts["services_by_sold_count"], {"labels": ["(Te) - Аренда"], "values": [2.0]})
+        self.assertEqual(charts["employee_total_stats"], {"labels": ["testadmin"], "values": [4200.0]})
+        self.assertEqual(len(charts), 5)
+
+    def test_chart_data_not_modified(self):
+        """Test unchanged data is answered with 304 and a new sale changes the ETag"""
+        self.client.force_login(self.admin)
+        url = reverse("catalog:statistics_data")
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304
+        )
+
+        Transaction.objects.first().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_chart_data_requires_superuser(self):
+        """Test other users cannot read the statistics data"""
+        self.client.force_login(get_user_model().objects.get(username="testbuyer"))
+        self.assertEqual(self.client.get(reverse("catalog:statistics_data")).status_code, 403)
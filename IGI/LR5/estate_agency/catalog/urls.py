@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'catalog'
@@ -11,4 +11,10 @@ urlpatterns = [
     path('client/dashboard/', views.ClientDashboardView.as_view(), name='client_dashboard'),
     path('employee/dashboard/', views.EmployeeDashboardView.as_view(), name='employee_dashboard'),
     path('statistics/', views.StatisticsView.as_view(), name='statistics'),
+    path('statistics/data.json', views.StatisticsDataView.as_view(), name='statistics_data'),
+    re_path(
+        r'^map/(?P<lng>-?\d{1,3}\.\d{1,5}),(?P<lat>-?\d{1,2}\.\d{1,5}),(?P<zoom>\d{1,2})/(?P<width>\d{1,4})x(?P<height>\d{1,4})\.png$',
+        views.StaticMapView.as_view(),
+        name='static_map',
+    ),
 ]
\ No newline at end of file
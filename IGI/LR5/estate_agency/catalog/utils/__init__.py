@@ -1,5 +1,6 @@
 from .mapbox_client import *
 from .plotter import *
-from .statistic_calculator import *
+from .search import *
+from .statistics import *
 
-__all__ = ['StatisticsCalculator', 'Plotter', 'MapboxClient']
\ No newline at end of file
+__all__ = ['StatisticsCalculator', 'Plotter', 'MapboxClient', 'PropertySearchIndex']
\ No newline at end of file
@@ -0,0 +1,239 @@
+import heapq
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+
+from users.models import Employee
+from ..models import Property, PropertyService
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = {}
+
+
+def register_strategy(cls):
+    STRATEGIES[cls.name] = cls()
+    return cls
+
+
+def get_strategy(name=None):
+    name = name or getattr(settings, "CATALOG_ASSIGNMENT_STRATEGY", "least_loaded")
+    try:
+        return STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown assignment strategy: {name}")
+
+
+def invalidate_strategies():
+    for strategy in STRATEGIES.values():
+        strategy.invalidate()
+
+
+def normalize(value):
+    return " ".join((value or "").split()).casefold()
+
+
+def lock_agent(agent_id, using):
+    agents = Employee.objects.using(using).filter(pk=agent_id)
+    if connections[using].features.has_select_for_update:
+        agents = agents.select_for_update()
+    return agents.first()
+
+
+class AssignmentStrategy(object):
+    """
+    Picks the agent for a new inquiry inside the assignment transaction.
+    claim() returns the locked Employee, or None when a concurrent
+    assignment got in first and the caller should retry.
+    """
+
+    name = None
+
+    def claim(self, property, using):
+        raise NotImplementedError
+
+    def invalidate(self):
+        pass
+
+
+@register_strategy
+class LeastLoadedStrategy(AssignmentStrategy):
+    """Fewest active inquiries, read from the (active_inquiry_count, id) index"""
+
+    name = "least_loaded"
+
+    def claim(self, property, using):
+        features = connections[using].features
+        agents = Employee.objects.using(using).order_by("active_inquiry_count", "id")
+        agent = None
+        if features.has_select_for_update_skip_locked:
+            # Concurrent transactions spread over the next least-loaded agents
+            agent = agents.select_for_update(skip_locked=True).first()
+        if agent is None and features.has_select_for_update:
+            agent = agents.select_for_update().first()
+        if agent is None:
+            agent = agents.first()
+        if agent is None:
+            raise ValueError("No available agents found.")
+
+        # Compare-and-set on the counter: takes the row's write lock and
+        # fails if the agent's load moved since it was read
+        claimed = Employee.objects.using(using).filter(
+            pk=agent.pk, active_inquiry_count=agent.active_inquiry_count
+        ).update(active_inquiry_count=F("active_inquiry_count"))
+        return agent if claimed else None
+
+
+class InMemoryStrategy(AssignmentStrategy):
+    """
+    Chooses from agent state loaded once per process, so a choice costs no
+    scan of the employee table. The state is dropped on Employee and
+    PropertyService changes, and after max_age seconds so changes made by
+    other processes are picked up.
+    """
+
+    def __init__(self):
+        self.max_age = getattr(settings, "CATALOG_ASSIGNMENT_STATE_MAX_AGE", None)
+        self.lock = threading.RLock()
+        self.loaded_at = None
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def is_stale(self):
+        if self.loaded_at is None:
+            return True
+        return self.max_age is not None and time.monotonic() - self.loaded_at > self.max_age
+
+    def load(self):
+        agents = list(
+            Employee.objects.order_by("id").values(
+                "id", "specialization", "department", "performance_rating"
+            )
+        )
+        self.build(agents)
+        self.loaded_at = time.monotonic()
+        logger.debug(f"Loaded {len(agents)} agents for {self.name} assignment")
+
+    def build(self, agents):
+        raise NotImplementedError
+
+    def prepare(self, property):
+        """Whatever choose() needs from the database, fetched outside the lock"""
+        return property
+
+    def choose(self, key):
+        raise NotImplementedError
+
+    def claim(self, property, using):
+        key = self.prepare(property)
+        with self.lock:
+            if self.is_stale():
+                self.load()
+            agent_id = self.choose(key)
+        if agent_id is None:
+            raise ValueError("No available agents found.")
+
+        agent = lock_agent(agent_id, using)
+        if agent is None:
+            # Deleted since the state was loaded
+            self.invalidate()
+        return agent
+
+
+@register_strategy
+class RoundRobinStrategy(InMemoryStrategy):
+    name = "round_robin"
+
+    def build(self, agents):
+        self.agent_ids = [agent["id"] for agent in agents]
+        self.position = 0
+
+    def next_agent(self, agent_ids):
+        if not agent_ids:
+            return None
+        agent_id = agent_ids[self.position % len(agent_ids)]
+        self.position += 1
+        return agent_id
+
+    def choose(self, key):
+        return self.next_agent(self.agent_ids)
+
+
+@register_strategy
+class WeightedStrategy(InMemoryStrategy):
+    """
+    Stride scheduling by performance_rating: each agent gets inquiries in
+    proportion to their rating, interleaved rather than in bursts
+    """
+
+    name = "weighted"
+    default_weight = 1.0
+    min_weight = 0.1
+
+    def build(self, agents):
+        self.heap = []
+        for agent in agents:
+            rating = agent["performance_rating"]
+            weight = float(rating) if rating is not None else self.default_weight
+            stride = 1.0 / max(weight, self.min_weight)
+            # (next pass, id, stride): the lowest pass is served next
+            self.heap.append((stride, agent["id"], stride))
+        heapq.heapify(self.heap)
+
+    def choose(self, key):
+        if not self.heap:
+            return None
+        pass_value, agent_id, stride = self.heap[0]
+        heapq.heapreplace(self.heap, (pass_value + stride, agent_id, stride))
+        return agent_id
+
+
+@register_strategy
+class SpecializationStrategy(RoundRobinStrategy):
+    """
+    Agents whose specialization or department names the property's service
+    or service type, taken in turn; everyone in turn when nobody matches
+    """
+
+    name = "specialization"
+
+    def build(self, agents):
+        super().build(agents)
+        by_key = defaultdict(list)
+        for agent in agents:
+            for key in {normalize(agent["specialization"]), normalize(agent["department"])}:
+                if key:
+                    by_key[key].append(agent["id"])
+
+        self.candidates = {}
+        services = PropertyService.objects.values_list("id", "title", "service_type__title")
+        for service_id, title, service_type_title in services:
+            matched = set(by_key.get(normalize(title), []))
+            matched.update(by_key.get(normalize(service_type_title), []))
+            if matched:
+                self.candidates[service_id] = sorted(matched)
+        self.positions = defaultdict(int)
+
+    def prepare(self, property):
+        if isinstance(property, Property):
+            return property.property_type_id
+        return (
+            Property.objects.filter(pk=property)
+            .values_list("property_type_id", flat=True)
+            .first()
+        )
+
+    def choose(self, service_id):
+        candidates = self.candidates.get(service_id)
+        if not candidates:
+            return self.next_agent(self.agent_ids)
+        agent_id = candidates[self.positions[service_id] % len(candidates)]
+        self.positions[service_id] += 1
+        return agent_id
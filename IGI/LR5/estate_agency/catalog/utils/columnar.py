@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from ..models import Property
+
+logger = logging.getLogger(__name__)
+
+# Money and area are kept as integer hundredths so range filters stay exact
+COLUMNS = {
+    "id": np.int64,
+    "price": np.int64,
+    "square_meters": np.int64,
+    "service_id": np.int64,
+    "service_type_id": np.int64,
+    "alive": np.bool_,
+}
+VALUES = ("id", "price", "square_meters", "property_type_id", "property_type__service_type_id")
+INITIAL_CAPACITY = 1024
+
+
+def to_hundredths(value):
+    return int(round(value * 100))
+
+
+class ColumnarResult(object):
+    """Lazy ordered result that fetches only the sliced rows from the DB"""
+
+    model = Property
+
+    def __init__(self, index, ids, keys, ordering, queryset=None):
+        self.index = index
+        self.keys = keys
+        self.ids_column = ids
+        self.ordering = ordering
+        self.queryset = queryset if queryset is not None else Property.objects.all()
+
+    def count(self):
+        return len(self.ids_column)
+
+    def __len__(self):
+        return len(self.ids_column)
+
+    def ids(self, start=0, stop=None):
+        return self.index.ordered_ids(self.ids_column, self.keys, self.ordering, start, stop)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+
+        ids = [int(pk) for pk in self.ids(item.start or 0, item.stop)]
+        objects = self.queryset.in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+class PropertyColumnIndex(object):
+    """
+    In-process column store of available properties for listing queries
+    """
+
+    orderings = ("price", "-price", "square_meters", "-square_meters")
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self.lock = threading.RLock()
+        self.loaded_at = None
+        self._reset(INITIAL_CAPACITY)
+
+    def _reset(self, capacity):
+        self.columns = {
+            name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS.items()
+        }
+        self.positions = {}
+        self.size = 0
+
+    def _grow(self, capacity):
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[: self.size] = column[: self.size]
+            self.columns[name] = grown
+
+    def _write(self, row, values):
+        pk, price, square_meters, service_id, service_type_id = values
+        self.columns["id"][row] = pk
+        self.columns["price"][row] = to_hundredths(price)
+        self.columns["square_meters"][row] = to_hundredths(square_meters)
+        self.columns["service_id"][row] = service_id or 0
+        self.columns["service_type_id"][row] = service_type_id or 0
+        self.columns["alive"][row] = True
+
+    def is_stale(self):
+        if self.loaded_at is None:
+            return True
+        return self.max_age is not None and time.monotonic() - self.loaded_at > self.max_age
+
+    def load(self, queryset=None):
+        if queryset is None:
+            queryset = Property.objects.available()
+        queryset = queryset.order_by().values_list(*VALUES)
+
+        started = time.perf_counter()
+        with self.lock:
+            self._reset(max(queryset.count(), INITIAL_CAPACITY))
+            for values in queryset.iterator(chunk_size=10000):
+                self._write(self.size, values)
+                self.positions[values[0]] = self.size
+                self.size += 1
+            self.loaded_at = time.monotonic()
+        logger.info(
+            f"Loaded {self.size} properties into column index in "
+            f"{time.perf_counter() - started:.3f}s"
+        )
+
+    def unload(self):
+        with self.lock:
+            self._reset(INITIAL_CAPACITY)
+            self.loaded_at = None
+
+    def ensure_loaded(self):
+        if self.is_stale():
+            self.load()
+
+    def upsert(self, values):
+        with self.lock:
+            row = self.positions.get(values[0])
+            if row is None:
+                if self.size == len(self.columns["id"]):
+                    self._grow(self.size * 2)
+                row = self.size
+                self.positions[values[0]] = row
+                self.size += 1
+            self._write(row, values)
+
+    def remove(self, pk):
+        with self.lock:
+            row = self.positions.pop(pk, None)
+            if row is not None:
+                self.columns["alive"][row] = False
+            if self.size and len(self.positions) < self.size // 2:
+                self._compact()
+
+    def _compact(self):
+        alive = np.flatnonzero(self.columns["alive"][: self.size])
+        for name, column in self.columns.items():
+            column[: len(alive)] = column[alive]
+        self.size = len(alive)
+        self.columns["alive"][self.size:] = False
+        ids = self.columns["id"][: self.size].tolist()
+        self.positions = dict(zip(ids, range(self.size)))
+
+    def refresh(self, pks):
+        """Re-read the given properties from the DB after a write"""
+        if self.loaded_at is None:
+            return
+
+        pks = {pk for pk in pks if pk}
+        rows = Property.objects.available().filter(pk__in=pks).values_list(*VALUES)
+        with self.lock:
+            found = set()
+            for values in rows:
+                self.upsert(values)
+                found.add(values[0])
+            for pk in pks - found:
+                self.remove(pk)
+
+    def query(self, min_price=None, max_price=None, service_id=None,
+              service_type_id=None, ordering="-price", queryset=None):
+        if ordering not in self.orderings:
+            raise ValueError(f"Unsupported column index ordering: {ordering}")
+
+        self.ensure_loaded()
+        with self.lock:
+            size = self.size
+            mask = self.columns["alive"][:size].copy()
+            if min_price is not None:
+                mask &= self.columns["price"][:size] >= to_hundredths(min_price)
+            if max_price is not None:
+                mask &= self.columns["price"][:size] <= to_hundredths(max_price)
+            if service_id is not None:
+                mask &= self.columns["service_id"][:size] == service_id
+            if service_type_id is not None:
+                mask &= self.columns["service_type_id"][:size] == service_type_id
+            rows = np.flatnonzero(mask)
+            ids = self.columns["id"][rows]
+            keys = self.columns[ordering.lstrip("-")][rows]
+        return ColumnarResult(self, ids, keys, ordering, queryset)
+
+    @staticmethod
+    def ordered_ids(ids, keys, ordering, start=0, stop=None):
+        if ordering.startswith("-"):
+            ids, keys = -ids, -keys
+        if stop is not None and 0 < stop < len(keys):
+            # Only the rows up to the kth key (ties included) can reach the page
+            kth = np.partition(keys, stop - 1)[stop - 1]
+            candidates = keys <= kth
+            ids, keys = ids[candidates], keys[candidates]
+        ordered = ids[np.lexsort((ids, keys))][start:stop]
+        return -ordered if ordering.startswith("-") else ordered
+
+
+property_index = PropertyColumnIndex(
+    max_age=getattr(settings, "CATALOG_COLUMNAR_INDEX_MAX_AGE", None)
+)
+
+
+def is_column_index_enabled():
+    return getattr(settings, "CATALOG_COLUMNAR_INDEX", False)
@@ -0,0 +1,109 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import PropertyInquiry, Transaction
+from .vector_stats import VectorStatistics
+
+logger = logging.getLogger(__name__)
+
+# Field each funnel can be broken down by
+DIMENSIONS = {
+    "service_type": "property__property_type__service_type__title",
+    "service": "property__property_type__title",
+    "agent": "agent__user__username",
+}
+TIME_TO_CLOSE_PERCENTILES = (50, 75, 90)
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def start_of_day(day):
+    """Aware local midnight of day; bounds on it keep created_at indexable"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class ConversionFunnel(object):
+    """
+    Inquiries created, taken into processing and closed by a transaction,
+    per service type, service or agent
+    """
+
+    @staticmethod
+    def get_inquiries(start=None, end=None):
+        """
+        Inquiries created from start to end, annotated with the date of the
+        sale that closed them: the transaction on the same property to the
+        same buyer
+        """
+        inquiries = PropertyInquiry.objects.annotate(
+            created_on=TruncDate("created_at"),
+            closed_on=Subquery(
+                Transaction.objects.filter(
+                    property=OuterRef("property"), buyer=OuterRef("buyer")
+                ).values("transaction_date")[:1]
+            ),
+        )
+        if start:
+            inquiries = inquiries.filter(created_at__gte=start_of_day(start))
+        if end:
+            inquiries = inquiries.filter(created_at__lt=start_of_day(end + timedelta(days=1)))
+        return inquiries
+
+    @staticmethod
+    def compute(dimension, start=None, end=None):
+        field = DIMENSIONS[dimension]
+        inquiries = ConversionFunnel.get_inquiries(start, end)
+        closed = Q(closed_on__isnull=False)
+
+        # One grouped query for the three stages
+        stages = (
+            inquiries.values(key=F(field))
+            .annotate(
+                created=Count("id"),
+                processing=Count("id", filter=Q(state__in=("processing", "completed")) | closed),
+                closed=Count("id", filter=closed),
+            )
+            .order_by("-created", "key")
+        )
+
+        # Only closed inquiries are read for the time to close, two narrow columns
+        days_to_close = defaultdict(list)
+        for key, duration in (
+            inquiries.filter(closed)
+            .annotate(days_to_close=F("closed_on") - F("created_on"))
+            .values_list(field, "days_to_close")
+            .iterator()
+        ):
+            days_to_close[key].append(duration.days)
+
+        rows = []
+        for stage in stages:
+            days = np.array(days_to_close.get(stage["key"], []), dtype=np.float64)
+            time_to_close = VectorStatistics.describe(days, percentiles=TIME_TO_CLOSE_PERCENTILES)
+            rows.append({
+                **stage,
+                "processing_rate": 100.0 * stage["processing"] / stage["created"],
+                "conversion": 100.0 * stage["closed"] / stage["created"],
+                "time_to_close": {
+                    "mean": time_to_close["mean"] if len(days) else None,
+                    "percentiles": time_to_close["percentiles"] if len(days) else {},
+                },
+            })
+        return rows
+
+    @staticmethod
+    def get(dimension, start=None, end=None):
+        """Funnel rows, computed at most once a day for each period"""
+        key = f"catalog:funnel:{dimension}:{start}:{end}:{timezone.localdate()}"
+        rows = cache.get(key)
+        if rows is None:
+            rows = ConversionFunnel.compute(dimension, start, end)
+            cache.set(key, rows, CACHE_TIMEOUT)
+            logger.debug(f"Computed {dimension} funnel for {start}..{end}")
+        return rows
@@ -0,0 +1,94 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from ..models import Property
+from .mapbox_client import MapboxClient
+
+logger = logging.getLogger(__name__)
+
+
+def geocode_property(property_id):
+    """
+    Resolve the property's location and store its coordinates.
+    Returns True when coordinates were written.
+    """
+    location = (
+        Property.objects.filter(pk=property_id)
+        .values_list("location", flat=True)
+        .first()
+    )
+    if location is None:
+        return False
+
+    coordinates = MapboxClient.geocode(location)
+    if coordinates is None:
+        logger.warning(f"No coordinates for property {property_id}: {location}")
+        return False
+
+    lng, lat = coordinates
+    # The location may have changed while Mapbox was answering
+    updated = Property.objects.filter(pk=property_id, location=location).update(
+        longitude=lng, latitude=lat
+    )
+    logger.debug(f"Geocoded property {property_id}: lng={lng}, lat={lat}")
+    return bool(updated)
+
+
+class GeocodingQueue(object):
+    """
+    Background pool geocoding properties after writes.
+    With workers=0 jobs run inline, which keeps tests and scripts synchronous.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.lock = threading.RLock()
+        self.pending = {}
+        self._executor = None
+
+    @property
+    def executor(self):
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="geocoding"
+                )
+            return self._executor
+
+    def submit(self, property_id):
+        if not self.workers:
+            return geocode_property(property_id)
+
+        with self.lock:
+            if property_id in self.pending:
+                return self.pending[property_id]
+            future = self.executor.submit(self._run, property_id)
+            self.pending[property_id] = future
+        future.add_done_callback(lambda _: self._done(property_id))
+        return future
+
+    def _done(self, property_id):
+        with self.lock:
+            self.pending.pop(property_id, None)
+
+    def _run(self, property_id):
+        close_old_connections()
+        try:
+            return geocode_property(property_id)
+        except Exception as e:
+            logger.exception(f"Geocoding property {property_id} failed: {str(e)}")
+            return False
+        finally:
+            connection.close()
+
+    def join(self, timeout=None):
+        with self.lock:
+            futures = list(self.pending.values())
+        wait(futures, timeout=timeout)
+
+
+geocoding_queue = GeocodingQueue(getattr(settings, "MAPBOX_GEOCODE_WORKERS", 2))
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models import Sum
+from django.utils import timezone
+
+from ..models import StaticMapTile
+from .mapbox_client import MapboxClient
+
+logger = logging.getLogger(__name__)
+
+# Hits refresh last_used at most this often so warm tiles do not write per request
+TOUCH_INTERVAL = timedelta(hours=1)
+# Running size of all tiles, so a miss does not sum the whole table
+TOTAL_SIZE_KEY = "static_map_cache:size"
+
+
+class StaticMapCache(object):
+    @staticmethod
+    def get_directory():
+        return os.path.join(settings.MEDIA_ROOT, settings.MAPBOX_MAP_CACHE_DIR)
+
+    @staticmethod
+    def write_image(content):
+        """Atomically store content under its SHA-256 name and return the digest"""
+        digest = hashlib.sha256(content).hexdigest()
+        directory = StaticMapCache.get_directory()
+        path = os.path.join(directory, f"{digest}.png")
+        if os.path.exists(path):
+            return digest
+
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(content)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return digest
+
+    @staticmethod
+    def get_tile(lng, lat, zoom, width, height):
+        """
+        Return the cached StaticMapTile, fetching it from Mapbox on a miss.
+        Returns None if Mapbox cannot provide the image.
+        """
+        key = {
+            "longitude": round(lng, 5),
+            "latitude": round(lat, 5),
+            "zoom": zoom,
+            "width": width,
+            "height": height,
+        }
+        tile = StaticMapTile.objects.filter(**key).first()
+        if tile and os.path.exists(tile.get_path()):
+            if tile.last_used < timezone.now() - TOUCH_INTERVAL:
+                StaticMapTile.objects.filter(pk=tile.pk).update(last_used=timezone.now())
+            logger.debug(f"Static map cache hit for {tile}")
+            return tile
+
+        try:
+            content = MapboxClient.fetch_static_map(
+                key["longitude"], key["latitude"], zoom, width, height
+            )
+        except requests.RequestException as e:
+            logger.error(f"Error while fetching static map {key}: {str(e)}")
+            return None
+
+        digest = StaticMapCache.write_image(content)
+        try:
+            tile, _ = StaticMapTile.objects.update_or_create(
+                **key,
+                defaults={"digest": digest, "size": len(content), "last_used": timezone.now()},
+            )
+        except IntegrityError:
+            # A concurrent request stored the same tile first
+            tile = StaticMapTile.objects.get(**key)
+        logger.info(f"Cached static map {tile} as {digest}")
+
+        if StaticMapCache.add_size(len(content)) > settings.MAPBOX_MAP_CACHE_MAX_BYTES:
+            StaticMapCache.evict()
+        return tile
+
+    @staticmethod
+    def get_total_size():
+        return StaticMapTile.objects.aggregate(total=Sum("size"))["total"] or 0
+
+    @staticmethod
+    def add_size(size):
+        """
+        Add size to the running total and return it. The total only drifts
+        upwards, when a tile is replaced, and evict() corrects it.
+        """
+        try:
+            return cache.incr(TOTAL_SIZE_KEY, size)
+        except ValueError:
+            # Not cached yet; the new tile is already in the table
+            total = StaticMapCache.get_total_size()
+            cache.set(TOTAL_SIZE_KEY, total, None)
+            return total
+
+    @staticmethod
+    def evict(max_bytes=None):
+        """Drop least recently used tiles until the cache fits in max_bytes"""
+        if max_bytes is None:
+            max_bytes = settings.MAPBOX_MAP_CACHE_MAX_BYTES
+
+        total = StaticMapCache.get_total_size()
+        if total <= max_bytes:
+            cache.set(TOTAL_SIZE_KEY, total, None)
+            return 0
+
+        evicted = []
+        for tile in StaticMapTile.objects.order_by("last_used", "id").iterator():
+            if total <= max_bytes:
+                break
+            evicted.append(tile)
+            total -= tile.size
+        StaticMapTile.objects.filter(pk__in=[tile.pk for tile in evicted]).delete()
+        cache.set(TOTAL_SIZE_KEY, total, None)
+
+        # Identical renders share one file, so only unlink unreferenced digests
+        digests = {tile.digest for tile in evicted}
+        still_used = set(
+            StaticMapTile.objects.filter(digest__in=digests).values_list("digest", flat=True)
+        )
+        for tile in evicted:
+            if tile.digest not in still_used and os.path.exists(tile.get_path()):
+                os.remove(tile.get_path())
+                still_used.add(tile.digest)
+        logger.info(f"Evicted {len(evicted)} static map tiles")
+        return len(evicted)
@@ -1,13 +1,43 @@
 import requests
 import logging
+import threading
+import time
 from django.conf import settings
+from django.urls import reverse
 from urllib.parse import quote
 
+from estate_agency.http_client import http_client
+
+from ..models import GeocodedAddress
+
 logger = logging.getLogger(__name__)
 
+class RateLimiter(object):
+    """Spaces out calls so no more than `rate` start per second across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
 class MapboxClient(object):
+    rate_limiter = RateLimiter(getattr(settings, 'MAPBOX_RATE_LIMIT', None))
+
     @staticmethod
-    def get_map_image_url(address):
+    def request_coordinates(address):
+        """
+        Ask the Mapbox geocoding API, returning (lng, lat) or None if not found
+        """
         geocoding_url = settings.MAPBOX_GEOCODING_API.format(
             quote(address)
         )
@@ -18,29 +48,95 @@ class MapboxClient(object):
             'limit': 1
         }
 
-        try:
-            response = requests.get(geocoding_url, params=params, timeout=5)
-            response.raise_for_status()
-            data = response.json()
+        MapboxClient.rate_limiter.acquire()
+        response = http_client.get(geocoding_url, params=params, timeout=5)
+        response.raise_for_status()
+        data = response.json()
+
+        if not data.get('features'):
+            logger.warning(f"Address not found: {address}")
+            return None
 
-            if not data.get('features'):
-                logger.warning(f"Address not found: {address}")
-                return settings.MAPBOX_DEFAULT_IMAGE
+        lng, lat = data['features'][0]['geometry']['coordinates']
+        logger.debug(f"lng={lng}, lat={lat}")
+        return lng, lat
 
-            lng, lat = data['features'][0]['geometry']['coordinates']
-            logger.debug(f"lng={lng}, lat={lat}")
+    @staticmethod
+    def geocode(address):
+        """
+        Get (lng, lat) for address, consulting the persistent cache first.
+        Returns None when the address is unknown or Mapbox is unreachable.
+        """
+        key = GeocodedAddress.normalize(address)
+        if not key:
+            return None
 
-            map_url = settings.MAPBOX_STATIC_MAP_API.format(
-                lng=lng,
-                lat=lat,
-                token=settings.MAPBOX_ACCESS_TOKEN
-            )
-            logger.info(f"Generate map URL for {address}: {map_url}")
-            return map_url
+        cached = GeocodedAddress.objects.filter(address=key).first()
+        if cached and not cached.is_expired():
+            logger.debug(f"Geocode cache hit for {key}")
+            return (cached.longitude, cached.latitude) if cached.found else None
 
+        try:
+            coordinates = MapboxClient.request_coordinates(address)
         except requests.RequestException as e:
             logger.error(f"Error while requesting Mapbox API for address {address}: {str(e)}")
-            return settings.MAPBOX_DEFAULT_IMAGE
-        except (KeyError, IndexError) as e:
+            return None
+        except (KeyError, IndexError, TypeError, ValueError) as e:
             logger.error(f"Error processing Mapbox API response for address {address}: {str(e)}")
+            return None
+
+        lng, lat = coordinates or (None, None)
+        GeocodedAddress.objects.update_or_create(
+            address=key,
+            defaults={'longitude': lng, 'latitude': lat, 'found': coordinates is not None},
+        )
+        return coordinates
+
+    @staticmethod
+    def get_static_map_url(lng, lat, zoom=None, width=None, height=None):
+        default_width, default_height = settings.MAPBOX_MAP_SIZE
+        return settings.MAPBOX_STATIC_MAP_API.format(
+            lng=lng,
+            lat=lat,
+            zoom=zoom or settings.MAPBOX_MAP_ZOOM,
+            width=width or default_width,
+            height=height or default_height,
+            token=settings.MAPBOX_ACCESS_TOKEN
+        )
+
+    @staticmethod
+    def fetch_static_map(lng, lat, zoom, width, height):
+        """
+        Download the static map image, returning its bytes
+        """
+        MapboxClient.rate_limiter.acquire()
+        response = http_client.get(
+            MapboxClient.get_static_map_url(lng, lat, zoom, width, height),
+            timeout=5,
+        )
+        response.raise_for_status()
+        return response.content
+
+    @staticmethod
+    def get_map_proxy_url(lng, lat, zoom=None, width=None, height=None):
+        """
+        URL of the local map proxy, which keeps the access token out of the HTML
+        """
+        default_width, default_height = settings.MAPBOX_MAP_SIZE
+        return reverse('catalog:static_map', kwargs={
+            'lng': f"{lng:.5f}",
+            'lat': f"{lat:.5f}",
+            'zoom': zoom or settings.MAPBOX_MAP_ZOOM,
+            'width': width or default_width,
+            'height': height or default_height,
+        })
+
+    @staticmethod
+    def get_map_image_url(address):
+        coordinates = MapboxClient.geocode(address)
+        if coordinates is None:
             return settings.MAPBOX_DEFAULT_IMAGE
+
+        map_url = MapboxClient.get_map_proxy_url(*coordinates)
+        logger.info(f"Generate map URL for {address}: {map_url}")
+        return map_url
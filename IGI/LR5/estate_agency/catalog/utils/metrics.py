@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class Metric(object):
+    """
+    A value computed by compute(), cached for ttl seconds and dropped
+    whenever one of its tags is invalidated
+    """
+
+    def __init__(self, name, compute, ttl=300, tags=()):
+        self.name = name
+        self.compute = compute
+        self.ttl = ttl
+        self.tags = tuple(tags)
+
+
+class Aggregate(Metric):
+    """
+    A single aggregate over a model. Aggregates over the same model are
+    computed together in one aggregate() query. expression may be a callable
+    for aggregates that depend on the current time.
+    """
+
+    def __init__(self, name, model, expression, ttl=300, tags=None):
+        super().__init__(name, None, ttl, tags if tags is not None else (model._meta.model_name,))
+        self.model = model
+        self.expression = expression
+
+    def get_expression(self):
+        return self.expression() if callable(self.expression) else self.expression
+
+
+class MetricRegistry(object):
+    def __init__(self, prefix="metrics"):
+        self.prefix = prefix
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.timings = defaultdict(lambda: {"hits": 0, "misses": 0, "time": 0.0, "max_time": 0.0})
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def tag_key(self, tag):
+        return f"{self.prefix}:tag:{tag}"
+
+    def get_tag_versions(self, tags):
+        keys = {tag: self.tag_key(tag) for tag in tags}
+        versions = cache.get_many(keys.values())
+        missing = {key for key in keys.values() if key not in versions}
+        for key in missing:
+            # A fresh version, never one an evicted tag may have had before
+            cache.add(key, time.time_ns(), None)
+        if missing:
+            versions.update(cache.get_many(missing))
+        return {tag: versions.get(key, 0) for tag, key in keys.items()}
+
+    def cache_key(self, metric, versions):
+        stamp = ":".join(f"{tag}={versions[tag]}" for tag in sorted(metric.tags))
+        return f"{self.prefix}:{metric.name}:{hashlib.md5(stamp.encode()).hexdigest()}"
+
+    def get(self, name):
+        return self.get_many([name])[name]
+
+    def get_many(self, names):
+        """Values of the named metrics, computing the missing ones in as few queries as possible"""
+        metrics = [self.metrics[name] for name in names]
+        versions = self.get_tag_versions({tag for metric in metrics for tag in metric.tags})
+        keys = {metric.name: self.cache_key(metric, versions) for metric in metrics}
+        cached = cache.get_many(keys.values())
+
+        values = {}
+        missing = []
+        for metric in metrics:
+            key = keys[metric.name]
+            if key in cached:
+                values[metric.name] = cached[key]
+                self.record(metric.name, hit=True)
+            else:
+                missing.append(metric)
+
+        batches = defaultdict(list)
+        for metric in missing:
+            if isinstance(metric, Aggregate):
+                batches[metric.model].append(metric)
+            else:
+                started = time.perf_counter()
+                values[metric.name] = metric.compute()
+                self.record(metric.name, elapsed=time.perf_counter() - started)
+
+        for model, batch in batches.items():
+            started = time.perf_counter()
+            result = model._default_manager.aggregate(
+                **{metric.name: metric.get_expression() for metric in batch}
+            )
+            # Metrics sharing a query are each charged its full time
+            elapsed = time.perf_counter() - started
+            for metric in batch:
+                values[metric.name] = result[metric.name]
+                self.record(metric.name, elapsed=elapsed)
+
+        for metric in missing:
+            cache.set(keys[metric.name], values[metric.name], metric.ttl)
+        if missing:
+            logger.debug(f"Computed metrics {[metric.name for metric in missing]}")
+        return values
+
+    def invalidate(self, *tags):
+        cache.set_many({self.tag_key(tag): time.time_ns() for tag in tags}, None)
+        logger.debug(f"Invalidated metric tags {tags}")
+
+    def record(self, name, hit=False, elapsed=0.0):
+        with self.lock:
+            timing = self.timings[name]
+            if hit:
+                timing["hits"] += 1
+                return
+            timing["misses"] += 1
+            timing["time"] += elapsed
+            timing["max_time"] = max(timing["max_time"], elapsed)
+
+    def stats(self):
+        """Per-metric cache hits, computations and compute time"""
+        with self.lock:
+            return {
+                name: {
+                    **timing,
+                    "mean_time": timing["time"] / timing["misses"] if timing["misses"] else 0.0,
+                }
+                for name, timing in self.timings.items()
+            }
+
+
+metrics = MetricRegistry()
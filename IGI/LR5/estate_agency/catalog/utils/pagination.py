@@ -0,0 +1,119 @@
+import base64
+import binascii
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q, QuerySet
+from django.http import Http404
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+
+class KeysetPage(object):
+    def __init__(self, object_list, paginator, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator(object):
+    """Cursor paginator over one sort field with id as the tie-breaker"""
+
+    orderings = ("price", "-price", "square_meters", "-square_meters")
+
+    def __init__(self, queryset, per_page, ordering, count=False):
+        if ordering not in self.orderings:
+            raise ValueError(f"Unsupported keyset ordering: {ordering}")
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.field = ordering.lstrip("-")
+        self.descending = ordering.startswith("-")
+        self.with_count = count
+
+    @cached_property
+    def count(self):
+        """Exact number of rows, or None when counting is skipped"""
+        return self.queryset.count() if self.with_count else None
+
+    @classmethod
+    def supports(cls, queryset):
+        if not isinstance(queryset, QuerySet):
+            return False
+        order_by = queryset.query.order_by
+        return len(order_by) == 1 and order_by[0] in cls.orderings
+
+    def encode_cursor(self, obj, direction):
+        payload = {
+            "o": self.ordering,
+            "v": str(getattr(obj, self.field)),
+            "id": obj.pk,
+            "d": direction,
+        }
+        raw = json.dumps(payload, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            if payload["o"] != self.ordering or payload["d"] not in ("next", "prev"):
+                raise ValueError("cursor does not match ordering")
+            return Decimal(payload["v"]), int(payload["id"]), payload["d"]
+        except (binascii.Error, ValueError, KeyError, TypeError, InvalidOperation) as e:
+            logger.warning(f"Invalid pagination cursor {cursor!r}: {str(e)}")
+            raise Http404("Invalid cursor")
+
+    def _seek(self, value, pk, forward):
+        # Walking forward through a descending sort means moving to smaller keys
+        lookup = "gt" if forward != self.descending else "lt"
+        return Q(**{f"{self.field}__{lookup}": value}) | Q(
+            **{self.field: value, f"pk__{lookup}": pk}
+        )
+
+    def _order(self, forward):
+        prefix = "-" if forward == self.descending else ""
+        return (f"{prefix}{self.field}", f"{prefix}pk")
+
+    def get_page(self, cursor=None):
+        forward = True
+        queryset = self.queryset
+        if cursor:
+            value, pk, direction = self.decode_cursor(cursor)
+            forward = direction == "next"
+            queryset = queryset.filter(self._seek(value, pk, forward))
+
+        rows = list(queryset.order_by(*self._order(forward))[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if not forward:
+            rows.reverse()
+
+        has_next = has_more if forward else True
+        has_previous = bool(cursor) if forward else has_more
+
+        next_cursor = prev_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1], "next")
+        if rows and has_previous:
+            prev_cursor = self.encode_cursor(rows[0], "prev")
+
+        return KeysetPage(rows, self, next_cursor, prev_cursor)
@@ -1,6 +1,7 @@
 import matplotlib
 matplotlib.use('Agg')
 from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
 from django.db.models import Count
 from ..models import Property, PropertyType
 
@@ -10,36 +11,38 @@ def create_property_type_chart():
     property_types = PropertyType.objects.annotate(count=Count('property'))
     types = [pt.title for pt in property_types]
     counts = [pt.count for pt in property_types]
-    
-    plt.figure(figsize=(10, 6))
-    plt.bar(range(len(counts)), counts)
-    plt.xticks(range(len(types)), types, rotation=15)
-    plt.title('Распределение типов недвижимости')
-    plt.xlabel('Тип недвижимости')
-    plt.ylabel('Количество объектов')
-    
-    plt.tight_layout()
-    plt.savefig('media/property_types_chart.png')
-    plt.close('all')
+
+    figure = Figure(figsize=(10, 6))
+    axes = figure.subplots()
+    axes.bar(range(len(counts)), counts)
+    axes.set_xticks(range(len(types)), types, rotation=15)
+    axes.set_title('Распределение типов недвижимости')
+    axes.set_xlabel('Тип недвижимости')
+    axes.set_ylabel('Количество объектов')
+
+    figure.tight_layout()
+    figure.savefig('media/property_types_chart.png')
 
 
 class Plotter:
     @staticmethod
     def plt_bars(data, path=None, categories=None, show=False, x_label=None, y_label=None, title=None):
-        plt.figure(figsize=(10, 6))
-        plt.bar(range(len(data)), data)
+        # A standalone Figure keeps no pyplot global state, so concurrent
+        # renders cannot close each other's figures
+        figure = plt.figure(figsize=(10, 6)) if show else Figure(figsize=(10, 6))
+        axes = figure.subplots()
+        axes.bar(range(len(data)), data)
         if x_label:
-            plt.xlabel(x_label)
+            axes.set_xlabel(x_label)
         if y_label:
-            plt.ylabel(y_label)
+            axes.set_ylabel(y_label)
         if categories:
-            plt.xticks(range(len(data)), categories, rotation=15)
+            axes.set_xticks(range(len(data)), categories, rotation=15)
         if title:
-            plt.title(title)
+            axes.set_title(title)
 
         if path:
-            plt.savefig(path)
+            figure.savefig(path)
         if show:
             plt.show()
-
-        plt.close('all')
+            plt.close(figure)
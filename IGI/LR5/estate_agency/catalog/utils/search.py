@@ -0,0 +1,131 @@
+import logging
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = "catalog_property_fts"
+
+# unicode61 folds Cyrillic case and, with remove_diacritics 2, maps "ё" to "е"
+CREATE_SEARCH_TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        location, details, service,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+DROP_SEARCH_TABLE_SQL = f"DROP TABLE IF EXISTS {SEARCH_TABLE}"
+
+INDEX_SQL = f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, location, details, service)
+    SELECT p.id, p.location, p.details,
+           COALESCE(s.title, '') || ' ' || COALESCE(t.title, '')
+    FROM catalog_property p
+    LEFT JOIN catalog_propertyservice s ON s.id = p.property_type_id
+    LEFT JOIN catalog_servicetype t ON t.id = s.service_type_id
+"""
+
+RUSSIAN_ENDINGS = sorted(
+    [
+        "иями", "ями", "ами", "ией", "иям", "ием", "иях",
+        "ого", "его", "ому", "ему", "ыми", "ими",
+        "ой", "ей", "ий", "ый", "ая", "яя", "ое", "ее", "ые", "ие",
+        "ов", "ев", "ах", "ях", "ам", "ям", "ом", "ем", "ую", "юю",
+        "а", "я", "о", "е", "ы", "и", "у", "ю", "ь",
+    ],
+    key=len,
+    reverse=True,
+)
+MIN_STEM_LENGTH = 3
+WEIGHTS = (2.0, 1.0, 1.5)  # location, details, service
+
+
+class PropertySearchIndex(object):
+    @staticmethod
+    def is_enabled():
+        return connection.vendor == "sqlite"
+
+    @staticmethod
+    def stem(word):
+        """Strip the inflection so "квартиры" and "квартира" share a prefix"""
+        for ending in RUSSIAN_ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+                return word[: -len(ending)]
+        return word
+
+    @staticmethod
+    def build_query(text):
+        terms = [
+            PropertySearchIndex.stem(word.lower().replace("ё", "е"))
+            for word in re.findall(r"\w+", text or "")
+        ]
+        return " ".join(f'"{term}"*' for term in terms if term)
+
+    @staticmethod
+    def search(queryset, text):
+        """Filter queryset to matches of text and annotate BM25 search_rank"""
+        query = PropertySearchIndex.build_query(text)
+        if not query:
+            return queryset.none()
+
+        property_table = queryset.model._meta.db_table
+        logger.debug(f"Full-text query for '{text}': {query}")
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+                (query,),
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT bm25({SEARCH_TABLE}, {', '.join(map(str, WEIGHTS))}) "
+                f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                f"AND rowid = {property_table}.id",
+                (query,),
+            )
+        )
+
+    @staticmethod
+    def _reindex(where=None, params=()):
+        if not PropertySearchIndex.is_enabled():
+            return
+
+        condition = f" WHERE {where}" if where else ""
+        with connection.cursor() as cursor:
+            if where:
+                cursor.execute(
+                    f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN "
+                    f"(SELECT p.id FROM catalog_property p"
+                    f" LEFT JOIN catalog_propertyservice s ON s.id = p.property_type_id"
+                    f"{condition})",
+                    params,
+                )
+            else:
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+            cursor.execute(INDEX_SQL + condition, params)
+
+    @staticmethod
+    def index_property(property_id):
+        PropertySearchIndex._reindex("p.id = %s", (property_id,))
+
+    @staticmethod
+    def index_service(service_id):
+        PropertySearchIndex._reindex("s.id = %s", (service_id,))
+
+    @staticmethod
+    def index_service_type(service_type_id):
+        PropertySearchIndex._reindex("s.service_type_id = %s", (service_type_id,))
+
+    @staticmethod
+    def remove_property(property_id):
+        if not PropertySearchIndex.is_enabled():
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", (property_id,))
+
+    @staticmethod
+    def rebuild():
+        logger.info("Rebuilding property search index")
+        PropertySearchIndex._reindex()
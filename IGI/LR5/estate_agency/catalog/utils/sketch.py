@@ -0,0 +1,110 @@
+import math
+from collections import Counter
+
+from django.conf import settings
+
+from .vector_stats import PERCENTILES
+
+# Bins are persisted, run rebuild_statistics after changing the accuracy
+RELATIVE_ACCURACY = getattr(settings, "CATALOG_SKETCH_ACCURACY", 0.01)
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+# Amounts below a cent share one bin and are reported as zero
+MIN_VALUE = 0.01
+ZERO_BIN = math.ceil(math.log(MIN_VALUE, GAMMA)) - 1
+
+
+class QuantileSketch(object):
+    """
+    Histogram over logarithmic bins (DDSketch). Every quantile is within
+    RELATIVE_ACCURACY of a value at that rank, and sketches merge by adding
+    the counts of equal bins, so days and services combine in any order.
+    """
+
+    def __init__(self, bins=None):
+        self.bins = Counter(bins or {})
+
+    @staticmethod
+    def bin(value):
+        value = float(value)
+        if value < MIN_VALUE:
+            return ZERO_BIN
+        return math.ceil(math.log(value, GAMMA))
+
+    @staticmethod
+    def value(bin):
+        """The value reported for a bin, within RELATIVE_ACCURACY of any value in it"""
+        if bin == ZERO_BIN:
+            return 0.0
+        return 2 * GAMMA ** bin / (GAMMA + 1)
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(Counter(cls.bin(value) for value in values))
+
+    def add(self, value, count=1):
+        self.bins[self.bin(value)] += count
+
+    def merge(self, other):
+        self.bins.update(other.bins)
+        return self
+
+    def ordered(self):
+        """(bin, count) pairs in value order; bins drifted below zero are left out"""
+        return [(bin, count) for bin, count in sorted(self.bins.items()) if count > 0]
+
+    @property
+    def count(self):
+        return sum(count for _, count in self.ordered())
+
+    def values_at(self, ranks):
+        """Values at the given 0-based ranks, in the order of the ranks"""
+        values = [0.0] * len(ranks)
+        pending = sorted((rank, i) for i, rank in enumerate(ranks))
+        seen = 0
+        position = 0
+        for bin, count in self.ordered():
+            seen += count
+            while position < len(pending) and pending[position][0] < seen:
+                values[pending[position][1]] = self.value(bin)
+                position += 1
+        return values
+
+    def quantiles(self, qs):
+        """
+        Quantiles for every q in 0..1, interpolated between the closest
+        ranks as numpy's default
+        """
+        total = self.count
+        if not total:
+            return [0.0 for _ in qs]
+        positions = [q * (total - 1) for q in qs]
+        lower = [math.floor(position) for position in positions]
+        values = self.values_at(lower + [min(rank + 1, total - 1) for rank in lower])
+        return [
+            low + (high - low) * (position - rank)
+            for position, rank, low, high in zip(positions, lower, values[:len(qs)], values[len(qs):])
+        ]
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    def describe(self, percentiles=PERCENTILES):
+        """The summary VectorStatistics.describe gives, read from the bins"""
+        ordered = self.ordered()
+        total = sum(count for _, count in ordered)
+        if not total:
+            return {
+                "count": 0, "mean": 0.0, "median": 0.0, "mode": 0.0,
+                "percentiles": {q: 0.0 for q in percentiles},
+            }
+
+        # The fullest bin is the mode; ties go to the smallest value
+        mode_bin = max(ordered, key=lambda item: (item[1], -item[0]))[0]
+        quantiles = self.quantiles([0.5] + [q / 100 for q in percentiles])
+        return {
+            "count": total,
+            "mean": sum(self.value(bin) * count for bin, count in ordered) / total,
+            "median": quantiles[0],
+            "mode": self.value(mode_bin),
+            "percentiles": dict(zip(percentiles, quantiles[1:])),
+        }
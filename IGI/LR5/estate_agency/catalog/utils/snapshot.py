@@ -0,0 +1,371 @@
+import logging
+from collections import Counter, defaultdict
+import hashlib
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+from users.models import Employee
+
+from ..models import (
+    DailyRollup,
+    DailyStatistics,
+    DistributionBin,
+    Property,
+    PropertyInquiry,
+    PropertyService,
+    ServiceStatistics,
+    StatisticsCounters,
+    Transaction,
+)
+from .sketch import QuantileSketch
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_VALUES = ("property__property_type_id", "agent_id", "transaction_date", "service_fee", "total_amount")
+INQUIRY_VALUES = ("property__property_type_id", "agent_id", "created_at")
+# Value plotted by each statistics chart
+CHART_VALUES = {
+    "services_by_sold_count": "sold_count",
+    "services_by_service_profit": "fee_total",
+    "employee_service_stats": "fee_total",
+    "employee_total_stats": "total_amount",
+    "services_by_full_costs": "total_amount",
+}
+SALE_TOTALS = {
+    "sold_count": Count("id"),
+    "fee_total": Sum("service_fee"),
+    "total_amount": Sum("total_amount"),
+}
+COUNTERS = ("sold_count", "fee_total", "total_amount", "inquiry_count")
+# Sums of the counters over rollup rows, the names differ from the fields
+ROLLUP_TOTALS = {f"{field}_sum": Sum(field) for field in COUNTERS}
+
+
+class StatisticsSnapshot(object):
+    """
+    Sales and inquiry counters per service, per employee, service and day and
+    per day, and price, fee and total distributions, kept current by catalog
+    signals and rebuilt by rebuild_statistics
+    """
+
+    @staticmethod
+    def inquiry_row(inquiry_id):
+        return (
+            PropertyInquiry.objects.filter(pk=inquiry_id)
+            .values_list(*INQUIRY_VALUES)
+            .first()
+        )
+
+    @staticmethod
+    def price_row(property_id):
+        return (
+            Property.objects.filter(pk=property_id)
+            .values_list("property_type_id", "price")
+            .first()
+        )
+
+    @staticmethod
+    def transaction_values(instance):
+        """The TRANSACTION_VALUES row, taken from a saved instance"""
+        return (
+            instance.property.property_type_id,
+            instance.agent_id,
+            instance.transaction_date,
+            instance.service_fee,
+            instance.total_amount,
+        )
+
+    @staticmethod
+    def inquiry_values(instance):
+        return (instance.property.property_type_id, instance.agent_id, instance.created_at)
+
+    @staticmethod
+    def price_values(instance):
+        return (instance.property_type_id, instance.price)
+
+    @staticmethod
+    def increment(model, key, **deltas):
+        deltas = {field: value for field, value in deltas.items() if value}
+        if not deltas:
+            return
+        updates = {field: F(field) + value for field, value in deltas.items()}
+        if issubclass(model, StatisticsCounters):
+            # update() skips auto_now
+            updates["updated_at"] = timezone.now()
+        rows = model.objects.filter(**key)
+        if None in key.values():
+            # Unique constraints do not cover NULL, concurrent creates may
+            # have left duplicates and only one of them takes the delta
+            rows = model.objects.filter(pk__in=rows.values("pk")[:1])
+        if rows.update(**updates):
+            return
+        if any(value < 0 for value in deltas.values()):
+            logger.warning(f"Missing {model.__name__} row for {key}, run rebuild_statistics")
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**key, **deltas)
+        except IntegrityError:
+            # Created concurrently
+            model.objects.filter(**key).update(**updates)
+
+    @staticmethod
+    def touch(model, **key):
+        """Mark the counters of a renamed service or employee as changed, the charts show the names"""
+        rows = model.objects.filter(**key).values("pk")[:1]
+        model.objects.filter(pk__in=rows).update(updated_at=timezone.now())
+
+    @staticmethod
+    def apply(service_id, agent_id, day, sign, **deltas):
+        deltas = {field: sign * value for field, value in deltas.items()}
+        if service_id:
+            StatisticsSnapshot.increment(ServiceStatistics, {"service_id": service_id}, **deltas)
+        StatisticsSnapshot.increment(
+            DailyRollup, {"employee_id": agent_id, "service_id": service_id, "day": day}, **deltas
+        )
+        StatisticsSnapshot.increment(DailyStatistics, {"day": day}, **deltas)
+
+    @staticmethod
+    def apply_transaction(row, sign=1):
+        service_id, agent_id, day, fee, total = row
+        StatisticsSnapshot.apply(
+            service_id, agent_id, day, sign, sold_count=1, fee_total=fee, total_amount=total
+        )
+        StatisticsSnapshot.add_to_distribution("service_fee", service_id, day, fee, sign)
+        StatisticsSnapshot.add_to_distribution("total_amount", service_id, day, total, sign)
+
+    @staticmethod
+    def apply_price(row, sign=1):
+        service_id, price = row
+        StatisticsSnapshot.add_to_distribution("price", service_id, None, price, sign)
+
+    @staticmethod
+    def add_to_distribution(field, service_id, day, value, sign=1):
+        key = {"field": field, "service_id": service_id, "day": day, "bin": QuantileSketch.bin(value)}
+        StatisticsSnapshot.increment(DistributionBin, key, count=sign)
+
+    @staticmethod
+    def apply_inquiry(row, sign=1):
+        service_id, agent_id, created_at = row
+        StatisticsSnapshot.apply(
+            service_id, agent_id, timezone.localdate(created_at), sign, inquiry_count=1
+        )
+
+    @staticmethod
+    def add_transactions(transaction_ids):
+        rows = Transaction.objects.filter(pk__in=transaction_ids).values_list(*TRANSACTION_VALUES)
+        for row in rows:
+            StatisticsSnapshot.apply_transaction(row)
+
+    @staticmethod
+    def rebuild():
+        """Recompute every counter with grouped aggregates"""
+        inquiries = PropertyInquiry.objects.annotate(day=TruncDate("created_at"))
+        groups = [
+            (ServiceStatistics, ("service_id",), [
+                Transaction.objects.filter(property__property_type__isnull=False)
+                .values(service_id=F("property__property_type_id")).annotate(**SALE_TOTALS),
+                PropertyInquiry.objects.filter(property__property_type__isnull=False)
+                .values(service_id=F("property__property_type_id")).annotate(inquiry_count=Count("id")),
+            ]),
+            (DailyRollup, ("employee_id", "service_id", "day"), [
+                Transaction.objects.values(
+                    employee_id=F("agent_id"), service_id=F("property__property_type_id"), day=F("transaction_date")
+                ).annotate(**SALE_TOTALS),
+                inquiries.values(
+                    "day", employee_id=F("agent_id"), service_id=F("property__property_type_id")
+                ).annotate(inquiry_count=Count("id")),
+            ]),
+            (DailyStatistics, ("day",), [
+                Transaction.objects.values(day=F("transaction_date")).annotate(**SALE_TOTALS),
+                inquiries.values("day").annotate(inquiry_count=Count("id")),
+            ]),
+        ]
+
+        counts = {}
+        with transaction.atomic():
+            for model, key_fields, querysets in groups:
+                rows = defaultdict(dict)
+                for queryset in querysets:
+                    for values in queryset:
+                        key = tuple(values.pop(field) for field in key_fields)
+                        rows[key].update(values)
+                model.objects.all().delete()
+                model.objects.bulk_create(
+                    [model(**dict(zip(key_fields, key)), **values) for key, values in rows.items()],
+                    batch_size=1000,
+                )
+                counts[model.__name__] = len(rows)
+
+            bins = Counter()
+            for service_id, price in Property.objects.values_list("property_type_id", "price").iterator():
+                bins[("price", service_id, None, QuantileSketch.bin(price))] += 1
+            for service_id, _, day, fee, total in Transaction.objects.values_list(*TRANSACTION_VALUES).iterator():
+                bins[("service_fee", service_id, day, QuantileSketch.bin(fee))] += 1
+                bins[("total_amount", service_id, day, QuantileSketch.bin(total))] += 1
+            DistributionBin.objects.all().delete()
+            DistributionBin.objects.bulk_create(
+                [
+                    DistributionBin(field=field, service_id=service_id, day=day, bin=bin, count=count)
+                    for (field, service_id, day, bin), count in bins.items()
+                ],
+                batch_size=1000,
+            )
+            counts[DistributionBin.__name__] = len(bins)
+        logger.info(f"Rebuilt statistics snapshot: {counts}")
+        return counts
+
+    @staticmethod
+    def get_period(start=None, end=None):
+        """Rollup rows of the days from start to end, both included and optional"""
+        rows = DailyRollup.objects.all()
+        if start:
+            rows = rows.filter(day__gte=start)
+        if end:
+            rows = rows.filter(day__lte=end)
+        return rows
+
+    @staticmethod
+    def get_services(start=None, end=None):
+        """
+        Services with sales, all time from ServiceStatistics or, for a
+        period, as unsaved ServiceStatistics summed from the rollups
+        """
+        if start is None and end is None:
+            return list(
+                ServiceStatistics.objects.filter(sold_count__gt=0)
+                .select_related("service")
+            )
+
+        rows = (
+            StatisticsSnapshot.get_period(start, end)
+            .filter(service__isnull=False)
+            .values("service_id")
+            .annotate(**ROLLUP_TOTALS)
+            .filter(sold_count_sum__gt=0)
+        )
+        services = PropertyService.objects.in_bulk([row["service_id"] for row in rows])
+        return [
+            ServiceStatistics(
+                service=services[row["service_id"]],
+                **{field: row[f"{field}_sum"] for field in COUNTERS},
+            )
+            for row in rows
+        ]
+
+    @staticmethod
+    def get_employees(days_ago=30, start=None, end=None):
+        """Employees with sales from start (days_ago days back by default) to end"""
+        if start is None:
+            start = timezone.localdate() - timedelta(days=days_ago)
+        period = {"dailyrollup__day__gte": start}
+        if end:
+            period["dailyrollup__day__lte"] = end
+        return list(
+            Employee.objects.filter(**period, dailyrollup__sold_count__gt=0)
+            .annotate(
+                sold_count=Sum("dailyrollup__sold_count"),
+                fee_total=Sum("dailyrollup__fee_total"),
+                total_amount=Sum("dailyrollup__total_amount"),
+            )
+            .select_related("user")
+            .order_by("-total_amount")
+        )
+
+    @staticmethod
+    def get_totals(start=None, end=None):
+        """Counters summed over the period"""
+        days = DailyStatistics.objects.all()
+        if start:
+            days = days.filter(day__gte=start)
+        if end:
+            days = days.filter(day__lte=end)
+        totals = days.aggregate(**ROLLUP_TOTALS)
+        return {field: totals[f"{field}_sum"] or 0 for field in COUNTERS}
+
+    @staticmethod
+    def get_monthly(start=None, end=None):
+        """Counters per month with the change of the sales total against the previous month"""
+        days = DailyStatistics.objects.all()
+        if start:
+            days = days.filter(day__gte=start)
+        if end:
+            days = days.filter(day__lte=end)
+        months = []
+        previous = None
+        for row in days.values(month=TruncMonth("day")).annotate(**ROLLUP_TOTALS).order_by("month"):
+            month = {"month": row["month"], **{field: row[f"{field}_sum"] for field in COUNTERS}}
+            month["change"] = (
+                float((month["total_amount"] - previous) / previous * 100) if previous else None
+            )
+            previous = month["total_amount"]
+            months.append(month)
+        return months
+
+    @staticmethod
+    def get_distribution(field, start=None, end=None, services=None):
+        """
+        QuantileSketch of a field merged over the sale days from start to end
+        and the given service ids, all of them by default. Property prices
+        have no day and ignore the period.
+        """
+        bins = DistributionBin.objects.filter(field=field)
+        if start and field != "price":
+            bins = bins.filter(day__gte=start)
+        if end and field != "price":
+            bins = bins.filter(day__lte=end)
+        if services is not None:
+            bins = bins.filter(service__in=services)
+        return QuantileSketch(dict(bins.values_list("bin").annotate(Sum("count")).order_by()))
+
+    @staticmethod
+    def get_rankings(start=None, end=None):
+        """
+        Services and employees in the order of each statistics chart. Without
+        a period services are ranked over all time and employees over 30 days.
+        """
+        services = StatisticsSnapshot.get_services(start, end)
+        employees = StatisticsSnapshot.get_employees(start=start, end=end)
+        return {
+            "services_by_sold_count": sorted(services, key=lambda s: s.sold_count, reverse=True),
+            "services_by_service_profit": sorted(services, key=lambda s: s.fee_total, reverse=True),
+            "employee_service_stats": sorted(employees, key=lambda e: e.fee_total, reverse=True),
+            "employee_total_stats": employees,
+            "services_by_full_costs": sorted(services, key=lambda s: s.total_amount, reverse=True),
+        }
+
+    @staticmethod
+    def get_chart_series(rankings):
+        """Labels and values of every chart, ready for JSON"""
+        return {
+            name: {
+                "labels": [
+                    str(row.service) if isinstance(row, ServiceStatistics) else row.user.username
+                    for row in rows
+                ],
+                "values": [float(getattr(row, CHART_VALUES[name])) for row in rows],
+            }
+            for name, rows in rankings.items()
+        }
+
+    @staticmethod
+    def get_fingerprint():
+        """
+        ETag and last modification time of the chart data. Every counter
+        change, including reassignments and deletes, and every rename of a
+        charted service or employee moves the newest updated_at; the row
+        counts cover counters deleted with their service, and the date the
+        employees' sliding window.
+        """
+        source = [timezone.localdate()]
+        modified = [timezone.make_aware(datetime.combine(timezone.localdate(), time.min))]
+        for model in (ServiceStatistics, DailyRollup, DailyStatistics):
+            row = model.objects.aggregate(count=Count("pk"), updated_at=Max("updated_at"))
+            source += [row["count"], row["updated_at"]]
+            if row["updated_at"]:
+                modified.append(row["updated_at"])
+        etag = f'"{hashlib.sha256(":".join(map(str, source)).encode()).hexdigest()[:32]}"'
+        return etag, max(modified)
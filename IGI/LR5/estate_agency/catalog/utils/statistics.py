@@ -1,119 +1,239 @@
 from typing import Dict, List, Tuple, Any
-from django.db.models import Count, Sum, Avg, F, Q
-from django.db.models.functions import TruncMonth
+from django.db.models import Count, Sum, Avg, Min, Max, F, Q
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
 from django.utils import timezone
 from datetime import timedelta
 import logging
 
-from ..models import Property, PropertyService, Transaction, PropertyInquiry
+import numpy as np
+from users.models import Client
+
+from ..models import DailyStatistics, Property, PropertyService, Transaction, PropertyInquiry
+from .funnel import ConversionFunnel
+from .metrics import Aggregate, Metric, metrics
+from .snapshot import StatisticsSnapshot
+from .vector_stats import VectorStatistics
 
 logger = logging.getLogger(__name__)
 
+__all__ = ['StatisticsCalculator']
+
+
+def describe_costs(sketch):
+    stats = sketch.describe()
+    return {
+        'mean_cost': stats['mean'],
+        'median_cost': stats['median'],
+        'mode_cost': stats['mode'],
+        'percentiles': stats['percentiles'],
+    }
+
+
+def compute_sale_cost_stats(start=None, end=None, services=None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # Merged from the persisted sketches, no sale is loaded
+    return tuple(
+        describe_costs(StatisticsSnapshot.get_distribution(field, start, end, services))
+        for field in ('total_amount', 'service_fee')
+    )
+
+
+def compute_client_ages() -> Dict[str, float]:
+    ages = VectorStatistics.ages(Client.objects.all(), 'birth_date', timezone.localdate())
+    return {
+        'mean_age': float(ages.mean()) if len(ages) else np.nan,
+        'median_age': float(np.median(ages)) if len(ages) else np.nan,
+    }
+
+
+def compute_service_performance() -> List[Dict[str, Any]]:
+    # Property and Transaction are one-to-one, inquiries are averaged apart
+    # so they do not multiply the sales
+    processing_times = dict(
+        Transaction.objects.filter(property__propertyinquiry__isnull=False)
+        .values_list('property__property_type')
+        .annotate(avg=Avg(F('transaction_date') - TruncDate('property__propertyinquiry__created_at')))
+    )
+    services = PropertyService.objects.annotate(
+        total_transactions=Count('property__transaction'),
+        total_revenue=Sum('property__transaction__total_amount'),
+    ).values('id', 'title', 'total_transactions', 'total_revenue').order_by('-total_revenue')
+    rows = []
+    for service in services:
+        # Popped before unpacking, otherwise the id stays in the row
+        service_id = service.pop('id')
+        rows.append({**service, 'avg_processing_time': processing_times.get(service_id)})
+    return rows
+
+
+def month_ago():
+    return timezone.localdate() - timedelta(days=30)
+
+
+# Every statistic is declared once; aggregates over the same model share a query
+for metric in [
+    Aggregate('total_properties', Property, Count('id')),
+    # Sales flip availability with update(), which sends no Property signals
+    Aggregate(
+        'active_listings', Property, Count('id', filter=Q(is_available=True)),
+        tags=('property', 'transaction'),
+    ),
+    Aggregate('avg_price', Property, Avg('price')),
+    Aggregate('min_price', Property, Min('price')),
+    Aggregate('max_price', Property, Max('price')),
+    Aggregate('total_transactions', Transaction, Count('id')),
+    # Windows are summed from the daily rollups instead of raw transactions
+    Aggregate(
+        'monthly_transactions', DailyStatistics,
+        lambda: Coalesce(Sum('sold_count', filter=Q(day__gte=month_ago())), 0),
+        # The window moves with the date
+        ttl=60 * 60,
+        tags=('transaction',),
+    ),
+    Aggregate('avg_transaction_value', Transaction, Avg('total_amount')),
+    Metric(
+        'monthly_trend',
+        lambda: list(
+            DailyStatistics.objects.filter(sold_count__gt=0)
+            .values(month=TruncMonth('day'))
+            .annotate(count=Sum('sold_count'), total=Sum('total_amount'))
+            .order_by('month')
+        ),
+        ttl=60 * 60,
+        tags=('transaction',),
+    ),
+    Metric(
+        'service_performance',
+        compute_service_performance,
+        tags=('propertyservice', 'property', 'transaction', 'propertyinquiry'),
+    ),
+    Metric(
+        'employee_performance',
+        lambda: list(
+            Transaction.objects.values('agent__user__username')
+            .annotate(
+                total_sales=Count('id'),
+                total_revenue=Sum('total_amount'),
+                avg_deal_size=Avg('total_amount'),
+            )
+            .order_by('-total_revenue')
+        ),
+        tags=('transaction',),
+    ),
+    Metric(
+        'property_types',
+        lambda: list(
+            Property.objects.values('property_type__title')
+            .annotate(count=Count('id'), avg_price=Avg('price'))
+            .order_by('-count')
+        ),
+        ttl=60 * 60,
+        tags=('property', 'propertyservice'),
+    ),
+    Metric(
+        'inquiry_trends',
+        lambda: list(
+            PropertyInquiry.objects.annotate(month=TruncMonth('created_at'))
+            .values('month').annotate(count=Count('id'))
+            .order_by('month')
+        ),
+        ttl=60 * 60,
+        tags=('propertyinquiry',),
+    ),
+    Metric(
+        'preferred_properties',
+        # Inquiries are matched to the sale they closed, not joined with every
+        # transaction on the property
+        lambda: [
+            {
+                'property_type__title': row['key'],
+                'inquiry_count': row['created'],
+                'conversion_rate': row['conversion'],
+            }
+            for row in ConversionFunnel.compute('service')
+        ],
+        ttl=60 * 60,
+        tags=('property', 'propertyservice', 'propertyinquiry', 'transaction'),
+    ),
+    Metric(
+        'client_segments',
+        lambda: list(
+            Transaction.objects.values('buyer__preferences')
+            .annotate(count=Count('id'), avg_transaction=Avg('total_amount'))
+            .order_by('-count')
+        ),
+        ttl=60 * 60,
+        tags=('transaction', 'client'),
+    ),
+    Metric('sale_cost_stats', compute_sale_cost_stats, tags=('transaction',)),
+    Metric(
+        'price_distribution',
+        lambda: describe_costs(StatisticsSnapshot.get_distribution('price')),
+        tags=('property',),
+    ),
+    Metric('client_ages', compute_client_ages, ttl=60 * 60 * 24, tags=('client',)),
+]:
+    metrics.register(metric)
+
+
 class StatisticsCalculator:
-    """Enhanced statistics calculator with caching and optimization"""
-    
+    """Statistics read from the metric registry, cached per metric"""
+
     @staticmethod
     def get_property_stats() -> Dict[str, Any]:
         """Get comprehensive property statistics"""
+        stats = metrics.get_many(
+            ['total_properties', 'active_listings', 'avg_price', 'min_price', 'max_price']
+        )
         return {
-            'total_properties': Property.objects.count(),
-            'active_listings': Property.objects.exclude(
-                id__in=Transaction.objects.values_list('property_id', flat=True)
-            ).count(),
-            'avg_price': Property.objects.aggregate(avg=Avg('price'))['avg'],
+            'total_properties': stats['total_properties'],
+            'active_listings': stats['active_listings'],
+            'avg_price': stats['avg_price'],
             'price_range': {
-                'min': Property.objects.aggregate(min=Min('price'))['min'],
-                'max': Property.objects.aggregate(max=Max('price'))['max']
+                'min': stats['min_price'],
+                'max': stats['max_price']
             }
         }
 
     @staticmethod
     def get_transaction_stats() -> Dict[str, Any]:
         """Get transaction statistics with time-based analysis"""
-        now = timezone.now()
-        month_ago = now - timedelta(days=30)
-        
-        return {
-            'total_transactions': Transaction.objects.count(),
-            'monthly_transactions': Transaction.objects.filter(
-                transaction_date__gte=month_ago
-            ).count(),
-            'avg_transaction_value': Transaction.objects.aggregate(
-                avg=Avg('total_amount')
-            )['avg'],
-            'monthly_trend': Transaction.objects.annotate(
-                month=TruncMonth('transaction_date')
-            ).values('month').annotate(
-                count=Count('id'),
-                total=Sum('total_amount')
-            ).order_by('month')
-        }
+        return metrics.get_many(
+            ['total_transactions', 'monthly_transactions', 'avg_transaction_value', 'monthly_trend']
+        )
 
     @staticmethod
     def get_service_performance() -> List[Dict[str, Any]]:
         """Get detailed service performance metrics"""
-        return PropertyService.objects.annotate(
-            total_transactions=Count('property__transaction'),
-            total_revenue=Sum('property__transaction__total_amount'),
-            avg_processing_time=Avg(
-                F('property__transaction__transaction_date') - 
-                F('property__propertyinquiry__created_at')
-            )
-        ).values(
-            'title', 'total_transactions', 'total_revenue', 'avg_processing_time'
-        ).order_by('-total_revenue')
+        return metrics.get('service_performance')
 
     @staticmethod
     def get_employee_performance() -> List[Dict[str, Any]]:
         """Get employee performance metrics"""
-        return Transaction.objects.values(
-            'agent__user__username'
-        ).annotate(
-            total_sales=Count('id'),
-            total_revenue=Sum('total_amount'),
-            avg_deal_size=Avg('total_amount'),
-            client_satisfaction=Avg('property__propertyinquiry__rating')
-        ).order_by('-total_revenue')
+        return metrics.get('employee_performance')
 
     @staticmethod
     def get_market_trends() -> Dict[str, Any]:
         """Get market trend analysis"""
-        return {
-            'property_types': Property.objects.values(
-                'property_type__title'
-            ).annotate(
-                count=Count('id'),
-                avg_price=Avg('price')
-            ).order_by('-count'),
-            'price_trends': Property.objects.annotate(
-                month=TruncMonth('created_at')
-            ).values('month').annotate(
-                avg_price=Avg('price'),
-                count=Count('id')
-            ).order_by('month'),
-            'inquiry_trends': PropertyInquiry.objects.annotate(
-                month=TruncMonth('created_at')
-            ).values('month').annotate(
-                count=Count('id')
-            ).order_by('month')
-        }
+        return metrics.get_many(['property_types', 'inquiry_trends'])
 
     @staticmethod
     def get_client_insights() -> Dict[str, Any]:
         """Get client behavior insights"""
-        return {
-            'preferred_properties': Property.objects.filter(
-                propertyinquiry__isnull=False
-            ).values(
-                'property_type__title'
-            ).annotate(
-                inquiry_count=Count('propertyinquiry'),
-                conversion_rate=Count('transaction') * 100.0 / Count('propertyinquiry')
-            ).order_by('-inquiry_count'),
-            'client_segments': Transaction.objects.values(
-                'buyer__preferences'
-            ).annotate(
-                count=Count('id'),
-                avg_transaction=Avg('total_amount')
-            ).order_by('-count')
-        } 
\ No newline at end of file
+        return metrics.get_many(['preferred_properties', 'client_segments'])
+
+    @staticmethod
+    def get_sale_cost_stats(start=None, end=None, services=None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Mean, median, mode and percentiles of sale totals and service fees, optionally for a period"""
+        if start is None and end is None and services is None:
+            return metrics.get('sale_cost_stats')
+        return compute_sale_cost_stats(start, end, services)
+
+    @staticmethod
+    def get_price_stats() -> Dict[str, Any]:
+        """Mean, median, mode and percentiles of property prices"""
+        return metrics.get('price_distribution')
+
+    @staticmethod
+    def get_client_stats() -> Dict[str, float]:
+        """Mean and median client age"""
+        return metrics.get('client_ages')
@@ -0,0 +1,84 @@
+import logging
+from itertools import islice
+
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast, ExtractDay, ExtractMonth, ExtractYear
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class VectorStatistics(object):
+    @staticmethod
+    def load_columns(queryset, fields, dtype=np.float64, chunk_size=CHUNK_SIZE):
+        """
+        Stream the fields of queryset into one preallocated array per field.
+        Decimal fields are cast to float by the database, so no Decimal
+        objects are built per row.
+        """
+        casts = {f"_{field}": Cast(field, FloatField()) for field in fields} if dtype == np.float64 else {}
+        names = list(casts) or list(fields)
+        rows = queryset.annotate(**casts).values_list(*names).iterator(chunk_size=chunk_size)
+
+        capacity = queryset.count()
+        columns = np.empty((capacity, len(names)), dtype=dtype)
+        size = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            if size + len(chunk) > capacity:
+                # Rows inserted since the count
+                capacity = max(2 * capacity, size + len(chunk))
+                columns = np.resize(columns, (capacity, len(names)))
+            columns[size:size + len(chunk)] = chunk
+            size += len(chunk)
+
+        return {field: columns[:size, i] for i, field in enumerate(fields)}
+
+    @staticmethod
+    def describe(values, percentiles=PERCENTILES):
+        """Count, mean, median, mode and percentiles from a single sort"""
+        if not len(values):
+            return {
+                "count": 0, "mean": 0.0, "median": 0.0, "mode": 0.0,
+                "percentiles": {q: 0.0 for q in percentiles},
+            }
+
+        ordered = np.sort(values)
+        # Runs of equal values in sorted order, the longest is the mode;
+        # ties go to the smallest value
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        run_lengths = np.diff(np.r_[starts, len(ordered)])
+        mode = ordered[starts[run_lengths.argmax()]]
+
+        # Linear interpolation between closest ranks, as numpy's default
+        positions = (len(ordered) - 1) * np.asarray((50,) + tuple(percentiles), dtype=np.float64) / 100
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.minimum(lower + 1, len(ordered) - 1)
+        quantiles = ordered[lower] + (ordered[upper] - ordered[lower]) * (positions - lower)
+
+        return {
+            "count": len(ordered),
+            "mean": float(ordered.mean()),
+            "median": float(quantiles[0]),
+            "mode": float(mode),
+            "percentiles": {q: float(value) for q, value in zip(percentiles, quantiles[1:])},
+        }
+
+    @staticmethod
+    def ages(queryset, field, today, chunk_size=CHUNK_SIZE):
+        """Whole years between the date field and today, for every row"""
+        parts = VectorStatistics.load_columns(
+            queryset.filter(**{f"{field}__isnull": False}).annotate(
+                _year=ExtractYear(field), _month=ExtractMonth(field), _day=ExtractDay(field)
+            ),
+            ("_year", "_month", "_day"),
+            dtype=np.int64,
+            chunk_size=chunk_size,
+        )
+        had_birthday = (today.month * 100 + today.day) >= (parts["_month"] * 100 + parts["_day"])
+        return today.year - parts["_year"] - (~had_birthday).astype(np.int64)
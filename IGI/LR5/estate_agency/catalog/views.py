@@ -1,4 +1,5 @@
 import logging
+from decimal import Decimal, InvalidOperation
 
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -6,14 +7,23 @@ from django.db.models import Q
 from django.shortcuts import redirect, get_object_or_404, render
 from django.urls import reverse_lazy
 from django.utils import timezone
-from django.views.generic import ListView, DetailView, CreateView, TemplateView, UpdateView, DeleteView
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.generic import ListView, DetailView, CreateView, TemplateView, UpdateView, DeleteView, View
 from django.conf import settings
 from users.models import Client, Employee
 
-from .forms import PropertyInquiryForm, PropertyForm
+from .forms import PropertyInquiryForm, PropertyForm, StatisticsPeriodForm
 from .models import ServiceType, PropertyService, Property, Transaction, PropertyInquiry, PropertyType
-from .utils import Plotter, StatisticsCalculator, MapboxClient
+from .utils import StatisticsCalculator, MapboxClient, PropertySearchIndex
+from .utils.columnar import is_column_index_enabled, property_index
+from .utils.funnel import ConversionFunnel
+from .utils.map_cache import StaticMapCache
+from .utils.pagination import KeysetPage, KeysetPaginator
 from .utils.plotter import create_property_type_chart
+from .utils.snapshot import StatisticsSnapshot
 
 logger = logging.getLogger(__name__)
 
@@ -55,33 +65,46 @@ class AvailablePropertyListView(LoginRequiredMixin, ListView):
     model = Property
     template_name = "estate_list.html"
     paginate_by = 9
+    paginate_count = False
+    cursor_kwarg = "cursor"
     ordering = "-price"
     login_url = '/accounts/login/'
+    sort_options = {
+        "price_asc": "price",
+        "price_desc": "-price",
+        "area_asc": "square_meters",
+        "area_desc": "-square_meters",
+    }
 
     def get_queryset(self):
         logger.debug("Fetching queryset for AvailablePropertyListView")
-        sold_properties_ids = Transaction.objects.all().values_list("property_id", flat=True)
-        queryset = Property.objects.exclude(id__in=sold_properties_ids).select_related(
-            "category"
-        )
-
         search_query = self.request.GET.get("search")
+        if not search_query and is_column_index_enabled():
+            return self.get_indexed_queryset()
+
+        queryset = Property.objects.available().select_related("property_type")
+
         if search_query:
-            queryset = queryset.filter(
-                Q(address__icontains=search_query)
-                | Q(description__icontains=search_query)
-                | Q(category__title__icontains=search_query)
-            )
+            logger.debug(f"Searching by: {search_query}")
+            if PropertySearchIndex.is_enabled():
+                queryset = PropertySearchIndex.search(queryset, search_query)
+            else:
+                queryset = queryset.filter(
+                    Q(location__icontains=search_query)
+                    | Q(details__icontains=search_query)
+                    | Q(property_type__title__icontains=search_query)
+                    | Q(property_type__service_type__title__icontains=search_query)
+                )
 
         category_id = self.request.GET.get("category")
         if category_id:
             logger.debug(f"Filtering by category_id: {category_id}")
-            queryset = queryset.filter(category_id=category_id)
+            queryset = queryset.filter(property_type_id=category_id)
 
         service_category_id = self.request.GET.get("service_category")
         if service_category_id:
             logger.debug(f"Filtering by service_category_id: {service_category_id}")
-            queryset = queryset.filter(category__category_id=service_category_id)
+            queryset = queryset.filter(property_type__service_type_id=service_category_id)
 
         min_price = self.request.GET.get("min_price")
         max_price = self.request.GET.get("max_price")
@@ -95,29 +118,65 @@ class AvailablePropertyListView(LoginRequiredMixin, ListView):
         sort = self.request.GET.get("sort")
         if sort:
             logger.debug(f"Sorting by: {sort}")
-            sort_options = {
-                "price_asc": "price",
-                "price_desc": "-price",
-                "area_asc": "square_meters",
-                "area_desc": "-square_meters",
-            }
-            if sort in sort_options:
-                queryset = queryset.order_by(sort_options[sort])
+            if sort in self.sort_options:
+                queryset = queryset.order_by(self.sort_options[sort])
             else:
                 logger.warning(f"Invalid sort option: {sort}")
                 queryset = queryset.order_by(self.ordering)
+        elif search_query and PropertySearchIndex.is_enabled():
+            queryset = queryset.order_by("search_rank", self.ordering)
         else:
             queryset = queryset.order_by(self.ordering)
 
         logger.info("AvailablePropertyListView queryset prepared")
         return queryset
 
+    def get_indexed_queryset(self):
+        filters = {}
+        for param, name, parse in (
+            ("min_price", "min_price", Decimal),
+            ("max_price", "max_price", Decimal),
+            ("category", "service_id", int),
+            ("service_category", "service_type_id", int),
+        ):
+            value = self.request.GET.get(param)
+            if not value:
+                continue
+            try:
+                filters[name] = parse(value)
+            except (ValueError, InvalidOperation):
+                logger.warning(f"Ignoring invalid {param}: {value}")
+
+        sort = self.request.GET.get("sort")
+        ordering = self.sort_options.get(sort, self.ordering)
+        logger.debug(f"Querying column index with {filters}, ordering={ordering}")
+        return property_index.query(
+            ordering=ordering,
+            queryset=Property.objects.select_related("property_type"),
+            **filters,
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        if not KeysetPaginator.supports(queryset):
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(
+            queryset,
+            page_size,
+            queryset.query.order_by[0],
+            count=self.paginate_count,
+        )
+        page = paginator.get_page(self.request.GET.get(self.cursor_kwarg))
+        logger.debug(f"Keyset page with {len(page)} properties")
+        return paginator, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["categories"] = PropertyService.objects.all()
         context["service_categories"] = ServiceType.objects.all()
         context["search_query"] = self.request.GET.get("search", "")
         context["current_sort"] = self.request.GET.get("sort")
+        context["keyset_pagination"] = isinstance(context.get("page_obj"), KeysetPage)
         return context
 
 
@@ -146,9 +205,12 @@ class PropertyDetailView(LoginRequiredMixin, DetailView):
             )
 
         if self.request.user.is_authenticated:
-            context["map_image_url"] = MapboxClient.get_map_image_url(
-                self.object.address
-            )
+            if self.object.latitude is not None and self.object.longitude is not None:
+                context["map_image_url"] = MapboxClient.get_map_proxy_url(
+                    self.object.longitude, self.object.latitude
+                )
+            else:
+                context["map_image_url"] = settings.MAPBOX_DEFAULT_IMAGE
             logger.debug(
                 f"Map image URL for property {self.object.id}: {context['map_image_url']}"
             )
@@ -157,6 +219,56 @@ class PropertyDetailView(LoginRequiredMixin, DetailView):
         return context
 
 
+class StaticMapView(LoginRequiredMixin, View):
+    login_url = '/accounts/login/'
+    # Proxy URLs carry coordinates rounded to 5 decimals
+    coordinate_precision = 0.5e-5
+
+    def is_property_location(self, lng, lat):
+        """Only maps of listed properties are fetched, so the proxy can't spend the quota on anything else"""
+        precision = self.coordinate_precision
+        return Property.objects.filter(
+            longitude__range=(lng - precision, lng + precision),
+            latitude__range=(lat - precision, lat + precision),
+        ).exists()
+
+    def get(self, request, lng, lat, zoom, width, height):
+        logger.debug(f"Static map requested: {lng},{lat},{zoom} {width}x{height}")
+        lng, lat = float(lng), float(lat)
+        zoom, width, height = int(zoom), int(width), int(height)
+        max_size = settings.MAPBOX_MAP_MAX_SIZE
+        if not (
+            -180 <= lng <= 180 and -90 <= lat <= 90 and 0 <= zoom <= 22
+            and 0 < width <= max_size and 0 < height <= max_size
+        ):
+            raise Http404("Unsupported map parameters")
+        if not self.is_property_location(lng, lat):
+            raise Http404("No property at these coordinates")
+
+        # A second attempt fetches a tile evicted by another request after the lookup
+        for _ in range(2):
+            tile = StaticMapCache.get_tile(lng, lat, zoom, width, height)
+            if tile is None:
+                break
+            etag = f'"{tile.digest}"'
+            if request.headers.get("If-None-Match") == etag:
+                response = HttpResponseNotModified()
+                break
+            try:
+                response = FileResponse(open(tile.get_path(), "rb"), content_type="image/png")
+                break
+            except FileNotFoundError:
+                logger.debug(f"Static map {tile} was evicted during the request")
+        else:
+            tile = None
+        if tile is None:
+            return redirect(settings.MAPBOX_DEFAULT_IMAGE)
+
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, max_age=settings.MAPBOX_MAP_CACHE_MAX_AGE, immutable=True)
+        return response
+
+
 class CreatePropertyInquiryView(LoginRequiredMixin, CreateView):
     model = PropertyInquiry
     form_class = PropertyInquiryForm
@@ -168,24 +280,19 @@ class CreatePropertyInquiryView(LoginRequiredMixin, CreateView):
         )
 
         if self.request.user.is_authenticated and hasattr(self.request.user, "client"):
-            form.instance.client = self.request.user.client
-            form.instance.property_id = self.kwargs["pk"]
-
-            if PropertyInquiry.objects.filter(
-                client=self.request.user.client, property_id=self.kwargs["pk"]
-            ).exists():
-                logger.error(
-                    f"Duplicate PropertyInquiry for property {form.instance.property_id} and client {form.instance.client}"
-                )
-            else:
-                PropertyInquiry.objects.create_with_assignment(
-                    client=self.request.user.client,
+            try:
+                # Repeated submissions return the existing inquiry
+                inquiry = PropertyInquiry.objects.create_with_agent_assignment(
+                    buyer=self.request.user.client,
                     property_id=self.kwargs["pk"],
                     inquiry_text=form.cleaned_data["inquiry_text"],
                 )
                 logger.info(
-                    f"PropertyInquiry created by {self.request.user.username}: property={form.instance.property}"
+                    f"PropertyInquiry {inquiry.pk} by {self.request.user.username}: "
+                    f"property={inquiry.property_id}, agent={inquiry.agent_id}"
                 )
+            except ValueError as e:
+                logger.error(f"Could not assign PropertyInquiry: {str(e)}")
         else:
             logger.error(f"User not authenticated or no client")
 
@@ -311,69 +418,31 @@ class StatisticsView(LoginRequiredMixin, TemplateView):
         )
         context = super().get_context_data(**kwargs)
 
-        cost_stats, service_stats = StatisticsCalculator.get_sale_cost_stats()
         client_stats = StatisticsCalculator.get_client_stats()
-        services_by_sold_count, counts = (
-            StatisticsCalculator.get_services_by_sold_count()
-        )
-        services_by_service_profit, service_profits = (
-            StatisticsCalculator.get_services_by_service_profit()
-        )
-        services_by_full_costs, full_costs = (
-            StatisticsCalculator.get_services_by_full_costs()
-        )
-        employee_service_stats, employee_service_costs = (
-            StatisticsCalculator.get_employees_by_service_profit()
-        )
-        employee_total_stats, total_costs = (
-            StatisticsCalculator.get_employees_by_full_costs()
-        )
 
-        image_paths = {
-            "services_by_sold_count": f"{settings.MEDIA_URL}services_by_sold_count.jpg",
-            "services_by_service_profit": f"{settings.MEDIA_URL}services_by_service_profit.jpg",
-            "employee_service_stats": f"{settings.MEDIA_URL}employee_service_stats.jpg",
-            "employee_total_stats": f"{settings.MEDIA_URL}employee_total_stats.jpg",
-            "services_by_full_costs": f"{settings.MEDIA_URL}services_by_full_costs.jpg",
-        }
-
-        Plotter.plt_bars(
-            counts,
-            path=image_paths["services_by_sold_count"][1:],
-            categories=(str(s)[:12] for s in services_by_sold_count),
-        )
-        Plotter.plt_bars(
-            service_profits,
-            path=image_paths["services_by_service_profit"][1:],
-            categories=(str(s)[:12] for s in services_by_sold_count),
-        )
-        Plotter.plt_bars(
-            employee_service_costs,
-            path=image_paths["employee_service_stats"][1:],
-            categories=(e.user.username for e in employee_service_stats),
-        )
-        Plotter.plt_bars(
-            total_costs,
-            path=image_paths["employee_total_stats"][1:],
-            categories=(e.user.username for e in employee_total_stats),
-        )
-        Plotter.plt_bars(
-            full_costs,
-            path=image_paths["services_by_full_costs"][1:],
-            categories=(str(s)[:12] for s in services_by_full_costs),
-        )
+        # Aggregates come from the snapshot maintained on every sale and inquiry;
+        # the charts themselves are drawn in the browser from StatisticsDataView
+        period_form = StatisticsPeriodForm(self.request.GET or None)
+        start, end = period_form.get_range()
+        cost_stats, service_stats = StatisticsCalculator.get_sale_cost_stats(start, end)
+        rankings = StatisticsSnapshot.get_rankings(start, end)
 
         context.update(
             {
+                "period_form": period_form,
+                "totals": StatisticsSnapshot.get_totals(start, end),
+                "monthly": StatisticsSnapshot.get_monthly(start, end),
+                "service_funnel": ConversionFunnel.get("service_type", start, end),
+                "agent_funnel": ConversionFunnel.get("agent", start, end),
                 "cost_stats": cost_stats,
                 "service_stats": service_stats,
+                "price_stats": StatisticsCalculator.get_price_stats(),
                 "client_stats": client_stats,
-                "popular_category": services_by_sold_count.first(),
-                "profitable_service": services_by_service_profit.first(),
-                "employee_service_stats": employee_service_stats,
-                "employee_total_stats": employee_total_stats,
-                "highest_cost_service": services_by_full_costs.first(),
-                "chart_images": image_paths,
+                "popular_category": next(iter(rankings["services_by_sold_count"]), None),
+                "profitable_service": next(iter(rankings["services_by_service_profit"]), None),
+                "employee_service_stats": rankings["employee_service_stats"],
+                "employee_total_stats": rankings["employee_total_stats"],
+                "highest_cost_service": next(iter(rankings["services_by_full_costs"]), None),
             }
         )
 
@@ -383,6 +452,30 @@ class StatisticsView(LoginRequiredMixin, TemplateView):
         return context
 
 
+class StatisticsDataView(LoginRequiredMixin, View):
+    """Series behind the statistics charts, answered with 304 while unchanged"""
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            raise PermissionDenied
+
+        etag, last_modified = StatisticsSnapshot.get_fingerprint()
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            logger.info(f"Serving statistics data to {request.user.username}")
+            start, end = StatisticsPeriodForm(request.GET).get_range()
+            rankings = StatisticsSnapshot.get_rankings(start, end)
+            response = JsonResponse({"charts": StatisticsSnapshot.get_chart_series(rankings)})
+
+        response["ETag"] = etag
+        if timestamp:
+            response["Last-Modified"] = http_date(timestamp)
+        # Only the superuser's browser keeps it, revalidating every use
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 class PropertyTypeView(LoginRequiredMixin, ListView):
     model = PropertyType
     template_name = "property_type_list.html"
@@ -0,0 +1,187 @@
+import fnmatch
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_MISSING = object()
+
+
+class LocalLRU(object):
+    """Bounded, thread-safe mapping of keys to values that expire after a timeout"""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return _MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Keep the value for the local timeout, or less when it expires earlier"""
+        if timeout is not None and timeout <= 0:
+            self.delete(key)
+            return
+        lifetime = self.timeout if timeout is None else min(self.timeout, timeout)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + lifetime)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class TwoTierCache(BaseCache):
+    """
+    A per-process LRU in front of a shared cache. Local hits skip the
+    shared backend and pickling, so values are shared between callers
+    and must not be mutated.
+
+    Other processes see a change after at most LOCAL_TIMEOUT seconds.
+    Keys matching SHARED_ONLY are always read from the shared backend.
+    These are the version stamps and locks, so a bumped version retires
+    every local copy of the keys built from it at once.
+
+    OPTIONS:
+        SHARED: alias of the shared cache in CACHES
+        LOCAL_MAX_ENTRIES: size of the LRU, 1000 by default
+        LOCAL_TIMEOUT: seconds a value is kept locally, 5 by default
+        SHARED_ONLY: fnmatch patterns of keys never kept locally
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get("OPTIONS", {}))
+        self.shared_alias = options.pop("SHARED", "shared")
+        local_max_entries = options.pop("LOCAL_MAX_ENTRIES", 1000)
+        local_timeout = options.pop("LOCAL_TIMEOUT", 5)
+        shared_only = options.pop("SHARED_ONLY", ("*:version", "*:lock", "*:tag:*"))
+        # One compiled pattern, checked on every read
+        self.shared_only = re.compile("|".join(fnmatch.translate(pattern) for pattern in shared_only) or "(?!)")
+        super().__init__({**params, "OPTIONS": options})
+        self.local = LocalLRU(local_max_entries, local_timeout)
+        self.add_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        # caches[] is per thread
+        return caches[self.shared_alias]
+
+    def is_local(self, key):
+        return not self.shared_only.match(key)
+
+    def get_local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return timeout
+
+    def get(self, key, default=None, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        local = self.is_local(cache_key)
+        if local:
+            value = self.local.get(cache_key)
+            if value is not _MISSING:
+                return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        if local:
+            # The remaining shared lifetime is unknown, the local timeout bounds it
+            self.local.set(cache_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            cache_key = self.make_and_validate_key(key, version=version)
+            value = self.local.get(cache_key) if self.is_local(cache_key) else _MISSING
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            for key, value in fetched.items():
+                cache_key = self.make_and_validate_key(key, version=version)
+                if self.is_local(cache_key):
+                    self.local.set(cache_key, value)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, timeout, version=version)
+        if self.is_local(cache_key):
+            self.local.set(cache_key, value, self.get_local_timeout(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            cache_key = self.make_and_validate_key(key, version=version)
+            if key in failed or not self.is_local(cache_key):
+                self.local.delete(cache_key)
+            else:
+                self.local.set(cache_key, value, self.get_local_timeout(timeout))
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        # Backends like the file cache check and write in two steps; this
+        # makes add() atomic within the process, memcached and redis across processes
+        with self.add_lock:
+            added = self.shared.add(key, value, timeout, version=version)
+        if added and self.is_local(cache_key):
+            self.local.set(cache_key, value, self.get_local_timeout(timeout))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        self.local.delete(cache_key)
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local.delete(self.make_and_validate_key(key, version=version))
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
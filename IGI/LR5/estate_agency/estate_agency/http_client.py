@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a host whose circuit is open"""
+
+
+class CircuitBreaker(object):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self.probing = False
+            # Half-open lets a single probe through at a time
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class HostStats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency, error):
+        with self.lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_rejected(self):
+        with self.lock:
+            self.rejected += 1
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "avg_latency": self.total_latency / self.requests if self.requests else 0.0,
+                "max_latency": self.max_latency,
+            }
+
+
+class HttpClient(object):
+    """
+    Outbound HTTP shared by third-party API clients: one pooled keep-alive
+    session, a circuit breaker and latency/error counters per host
+    """
+
+    def __init__(self, pool_size=10, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.host_stats = {}
+
+    def _for_host(self, host):
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self.host_stats[host] = HostStats()
+            return self.breakers[host], self.host_stats[host]
+
+    def request(self, method, url, **kwargs):
+        host = urlparse(url).netloc
+        breaker, stats = self._for_host(host)
+        if not breaker.allow_request():
+            stats.record_rejected()
+            logger.warning(f"Circuit open for {host}, skipping {method} {url}")
+            raise CircuitOpenError(f"Circuit open for {host}")
+
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception:
+            stats.record(time.perf_counter() - started, error=True)
+            breaker.record_failure()
+            raise
+
+        failed = response.status_code >= 500
+        stats.record(time.perf_counter() - started, error=failed)
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def stats(self):
+        with self.lock:
+            hosts = list(self.host_stats.items())
+            states = {host: breaker.state for host, breaker in self.breakers.items()}
+        return {host: dict(stats.as_dict(), state=states[host]) for host, stats in hosts}
+
+
+http_client = HttpClient(
+    pool_size=getattr(settings, "OUTBOUND_HTTP_POOL_SIZE", 10),
+    failure_threshold=getattr(settings, "OUTBOUND_HTTP_FAILURE_THRESHOLD", 5),
+    reset_timeout=getattr(settings, "OUTBOUND_HTTP_RESET_TIMEOUT", 30.0),
+)
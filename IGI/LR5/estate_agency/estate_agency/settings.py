@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+from datetime import timedelta
 from pathlib import Path
 from .config import Config
 
@@ -85,10 +86,39 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Take the write lock when a transaction starts, so concurrent writers
+        # wait for it instead of failing on a read-to-write upgrade
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
     }
 }
 
 
+# Cache
+# A short-lived in-process LRU in front of a cache shared by every process.
+# Point "shared" at memcached or redis in production: their add() is atomic
+# across processes, so a cache miss is recomputed by one worker, not each.
+
+CACHES = {
+    "default": {
+        "BACKEND": "estate_agency.cache.TwoTierCache",
+        "OPTIONS": {
+            "SHARED": "shared",
+            "LOCAL_MAX_ENTRIES": 1000,
+            "LOCAL_TIMEOUT": 5,
+            # Version stamps and locks are always read from the shared cache
+            "SHARED_ONLY": ["*:version", "*:lock", "*:tag:*"],
+        },
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        # Private to this checkout; the directory holds pickles, so keep it out of shared temp dirs
+        "LOCATION": os.environ.get("ESTATE_AGENCY_CACHE_DIR", os.path.join(BASE_DIR, "cache")),
+    },
+}
+
+# Tests run with estate_agency.test_settings, which keeps them off this cache
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -180,6 +210,38 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 MAPBOX_ACCESS_TOKEN = Config.MAPBOX_ACCESS_TOKEN
 MAPBOX_GEOCODING_API = 'https://api.mapbox.com/geocoding/v5/mapbox.places/{}.json'
-MAPBOX_STATIC_MAP_API = 'https://api.mapbox.com/styles/v1/mapbox/streets-v12/static/pin-s+0d6efd({lng},{lat})/{lng},{lat},15,0/600x400?access_token={token}'
+MAPBOX_STATIC_MAP_API = 'https://api.mapbox.com/styles/v1/mapbox/streets-v12/static/pin-s+0d6efd({lng},{lat})/{lng},{lat},{zoom},0/{width}x{height}?access_token={token}'
 MAPBOX_LANGUAGE = 'ru'
 MAPBOX_DEFAULT_IMAGE = MEDIA_URL + 'map_placeholder.jpg'
+MAPBOX_GEOCODE_TTL = timedelta(days=90)
+MAPBOX_GEOCODE_NEGATIVE_TTL = timedelta(days=1)
+MAPBOX_GEOCODE_WORKERS = 2
+MAPBOX_RATE_LIMIT = 10
+MAPBOX_MAP_ZOOM = 15
+MAPBOX_MAP_SIZE = (600, 400)
+MAPBOX_MAP_MAX_SIZE = 1280
+MAPBOX_MAP_CACHE_DIR = 'maps'
+MAPBOX_MAP_CACHE_MAX_BYTES = 100 * 1024 * 1024
+MAPBOX_MAP_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Outbound HTTP
+
+OUTBOUND_HTTP_POOL_SIZE = 10
+OUTBOUND_HTTP_FAILURE_THRESHOLD = 5
+OUTBOUND_HTTP_RESET_TIMEOUT = 30
+
+# Catalog
+
+CATALOG_COLUMNAR_INDEX = False
+CATALOG_COLUMNAR_INDEX_MAX_AGE = 300
+CATALOG_ASSIGNMENT_RETRIES = 10
+# least_loaded, round_robin, weighted or specialization
+CATALOG_ASSIGNMENT_STRATEGY = 'least_loaded'
+CATALOG_ASSIGNMENT_STATE_MAX_AGE = 300
+# Relative error of price and fee quantiles, run rebuild_statistics after changing
+CATALOG_SKETCH_ACCURACY = 0.01
+
+# Home
+
+# Threads recomputing stale cached page data, 0 recomputes inline
+HOME_CACHE_REVALIDATE_WORKERS = 2
@@ -0,0 +1,17 @@
+"""
+Settings for test runs:
+
+    python manage.py test --settings=estate_agency.test_settings
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+# A shared cache of their own that starts empty and is gone afterwards
+CACHES = {
+    **CACHES,
+    "shared": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "estate_agency_test",
+    },
+}
@@ -1,38 +1,397 @@
+import hashlib
 import logging
-from typing import Any, Callable
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+from django.conf import settings
 from django.core.cache import cache
-from django.db.models import QuerySet
-from django.http import HttpRequest
+from django.db import close_old_connections, connection
+from django.db.models import Count, Max, QuerySet
+from django.http import HttpRequest, HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, urlencode
 
 logger = logging.getLogger(__name__)
 
+
+def get_cache_version(cache_key: str) -> int:
+    """
+    Current version of a cached value; a bumped version retires every
+    key built from the previous one without deleting it
+    """
+    version_key = f"{cache_key}:version"
+    version = cache.get(version_key)
+    if version is None:
+        # A fresh version, never one an evicted key may have had before
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key, 0)
+    return version
+
+
+def invalidate_cache_version(cache_key: str) -> None:
+    cache.set(f"{cache_key}:version", time.time_ns(), None)
+    logger.debug(f"Cache version bumped for key: {cache_key}")
+
+
+class CacheStatistics:
+    """Per-key cache hits, stale hits, misses and recompute time of this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(
+            lambda: {"hits": 0, "stale_hits": 0, "misses": 0, "time": 0.0, "max_time": 0.0}
+        )
+
+    def record(self, cache_key: str, hit: bool = False, stale: bool = False, elapsed: float = 0.0) -> None:
+        with self.lock:
+            counters = self.counters[cache_key]
+            if stale:
+                counters["stale_hits"] += 1
+            elif hit:
+                counters["hits"] += 1
+            else:
+                counters["misses"] += 1
+                counters["time"] += elapsed
+                counters["max_time"] = max(counters["max_time"], elapsed)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {
+                key: {
+                    **counters,
+                    "mean_time": counters["time"] / counters["misses"] if counters["misses"] else 0.0,
+                }
+                for key, counters in self.counters.items()
+            }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+
+
+cache_stats = CacheStatistics()
+
+
+class RevalidationPool:
+    """
+    Background threads recomputing stale cache entries.
+    With workers=0 jobs run inline, which keeps tests and scripts synchronous.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="cache-revalidation"
+                )
+            return self._executor
+
+    def submit(self, job: Callable) -> None:
+        if not self.workers:
+            job()
+            return
+        self.executor.submit(self._run, job)
+
+    def _run(self, job: Callable) -> None:
+        close_old_connections()
+        try:
+            job()
+        except Exception as e:
+            logger.exception(f"Cache revalidation failed: {str(e)}")
+        finally:
+            connection.close()
+
+
+revalidation_pool = RevalidationPool(getattr(settings, "HOME_CACHE_REVALIDATE_WORKERS", 2))
+
+
 class CacheMixin:
-    """Mixin for caching view data"""
+    """
+    Mixin for caching view data. One request per key recomputes an expired
+    value while the others are served the previous one, and values are
+    refreshed early with a probability growing towards expiry (XFetch).
+    With the file-based shared cache that holds per process, so each
+    worker may still recompute a missing key once.
+    """
     cache_timeout = 300
+    # How long past cache_timeout an entry may still be served while it is recomputed
+    stale_timeout = 300
+    # Larger values refresh earlier; 0 disables early refresh
+    early_refresh_beta = 1.0
+    # Serve the stale value at once and recompute in the background
+    stale_while_revalidate = False
+    # Longest expected recomputation, the lock is dropped after it
+    lock_timeout = 30
+    # How long a request without any cached value waits for the recomputation
+    wait_timeout = 5.0
 
-    def get_cached_data(self, cache_key: str, data_func: Callable, timeout: int = None) -> Any:
+    def get_cached_data(
+        self, cache_key: str, data_func: Callable, timeout: int = None, versioned: bool = False
+    ) -> Any:
         """
-        Get data from cache or compute it if not present
+        Get data from cache or compute it if not present. A versioned key
+        is retired by invalidate_cache_version(cache_key).
         """
         if timeout is None:
             timeout = self.cache_timeout
+        key = self.get_versioned_key(cache_key) if versioned else cache_key
 
-        cached_data = cache.get(cache_key)
-        if cached_data is None:
-            cached_data = data_func()
-            cache.set(cache_key, cached_data, timeout)
-            logger.debug(f"Cache miss for key: {cache_key}")
-        else:
-            logger.debug(f"Cache hit for key: {cache_key}")
-        return cached_data
+        entry = cache.get(key)
+        if entry is not None:
+            value, expires, delta = entry
+            if not self.should_refresh(expires, delta):
+                cache_stats.record(cache_key, hit=True)
+                logger.debug(f"Cache hit for key: {key}")
+                return value
+
+            token = self.acquire_lock(key)
+            if token is None:
+                # Another request is recomputing it
+                cache_stats.record(cache_key, stale=True)
+                logger.debug(f"Stale cache hit for key: {key}")
+                return value
+            if self.stale_while_revalidate:
+                cache_stats.record(cache_key, stale=True)
+                revalidation_pool.submit(
+                    lambda: self.recompute(cache_key, key, data_func, timeout, token)
+                )
+                return value
+            return self.recompute(cache_key, key, data_func, timeout, token)
+
+        token = self.acquire_lock(key)
+        # The previous holder may have stored it just before releasing the lock
+        entry = cache.get(key) if token else self.wait_for_entry(key)
+        if entry is not None:
+            if token:
+                self.release_lock(key, token)
+            cache_stats.record(cache_key, hit=True)
+            return entry[0]
+        if token is None:
+            logger.warning(f"Gave up waiting for cache key: {key}")
+        return self.recompute(cache_key, key, data_func, timeout, token)
+
+    def should_refresh(self, expires: float, delta: float) -> bool:
+        """
+        True once expired, and before that with a probability that grows
+        with the recompute time delta as expiry approaches
+        """
+        # 1 - random() is never 0, so the logarithm is defined
+        early = delta * self.early_refresh_beta * -math.log(1 - random.random())
+        return time.time() + early >= expires
+
+    def recompute(self, cache_key: str, key: str, data_func: Callable, timeout: int, token: str = None) -> Any:
+        try:
+            started = time.perf_counter()
+            value = data_func()
+            delta = time.perf_counter() - started
+            cache.set(key, (value, time.time() + timeout, delta), timeout + self.stale_timeout)
+            cache_stats.record(cache_key, elapsed=delta)
+            logger.debug(f"Cache miss for key: {key}, recomputed in {delta:.3f}s")
+            return value
+        finally:
+            if token:
+                self.release_lock(key, token)
+
+    def acquire_lock(self, key: str) -> str:
+        """A token for the recomputation lock of key, or None while another request holds it"""
+        token = uuid.uuid4().hex
+        # Only as atomic as the shared cache's add(): memcached and redis
+        # hold it across processes, the file cache only within one
+        if cache.add(f"{key}:lock", token, self.lock_timeout):
+            return token
+        return None
+
+    def release_lock(self, key: str, token: str) -> None:
+        lock_key = f"{key}:lock"
+        # Only the holder may release; an expired lock may have a new holder
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+    def wait_for_entry(self, key: str):
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+            delay = min(delay * 2, 0.2)
+        return None
+
+    def get_versioned_key(self, cache_key: str) -> str:
+        """
+        Key of the current version of cache_key, see invalidate_cache_version
+        """
+        return f"{cache_key}:{get_cache_version(cache_key)}"
 
     def invalidate_cache(self, cache_key: str) -> None:
         """
-        Invalidate cache for given key
+        Invalidate cache for given key, whether get_cached_data stored it
+        plain or versioned
         """
         cache.delete(cache_key)
+        invalidate_cache_version(cache_key)
         logger.debug(f"Cache invalidated for key: {cache_key}")
 
+
+def get_model_fingerprint(model) -> Tuple[str, Optional[datetime]]:
+    """
+    Source of an ETag and the last modification time of a model's rows,
+    from one aggregate query: an edit moves the newest timestamp, a
+    deletion the count and an insertion both.
+    """
+    row = model._default_manager.aggregate(
+        count=Count("pk"), last_id=Max("pk"), last_modified=Max("updated_at")
+    )
+    source = f"{model._meta.label_lower}:{row['count']}:{row['last_id']}:{row['last_modified']}"
+    return source, row["last_modified"]
+
+
+class ConditionalGetMixin:
+    """
+    Mixin answering GET with 304 Not Modified while the rows of
+    conditional_models, whose updated_at gives the last modification, are unchanged.
+    Pages greet signed-in users by name, so their responses are private.
+    """
+    conditional_models = ()
+    cache_max_age = 60
+    private = False
+
+    def get_fingerprint(self) -> Tuple[str, Optional[datetime]]:
+        sources = []
+        last_modified = None
+        for model in self.conditional_models:
+            source, modified = get_model_fingerprint(model)
+            sources.append(source)
+            if modified is not None and (last_modified is None or modified > last_modified):
+                last_modified = modified
+        user = self.request.user
+        sources.append(f"user:{user.pk if user.is_authenticated else ''}")
+        etag = f'"{hashlib.sha256("|".join(sources).encode()).hexdigest()[:32]}"'
+        return etag, last_modified
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_fingerprint()
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+
+        response["ETag"] = etag
+        if timestamp:
+            response["Last-Modified"] = http_date(timestamp)
+        if self.private or request.user.is_authenticated:
+            patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+        else:
+            # A reverse proxy may serve anonymous visitors for max_age seconds
+            patch_cache_control(response, public=True, max_age=self.cache_max_age)
+        patch_vary_headers(response, ("Cookie",))
+        return response
+
+
+# Signed-in users are told apart by profile, as the navigation is
+ROLES = ("anonymous", "client", "employee", "user")
+
+
+def get_user_role(user) -> str:
+    """The role pages are cached for, one of ROLES"""
+    if user is None or not user.is_authenticated:
+        return "anonymous"
+    if hasattr(user, "employee"):
+        return "employee"
+    if hasattr(user, "client"):
+        return "client"
+    return "user"
+
+
+def get_tag_key(tag: str) -> str:
+    return f"page:tag:{tag}"
+
+
+def get_tags_version(tags) -> str:
+    """
+    Part of a cache key that changes whenever one of the tags is
+    invalidated; tags are model labels such as "home.news"
+    """
+    return ".".join(str(get_cache_version(get_tag_key(tag))) for tag in sorted(tags))
+
+
+def invalidate_tags(*tags: str) -> None:
+    """Retire every page and fragment cached under any of the tags"""
+    for tag in tags:
+        invalidate_cache_version(get_tag_key(tag))
+
+
+# Left in a cached page by {% nocache %} and rendered again for every request
+NOCACHE_MARKER = "<!--nocache:{}-->"
+NOCACHE_PATTERN = re.compile(r"<!--nocache:([\w./-]+)-->")
+
+
+class RolePageCacheMixin(CacheMixin):
+    """
+    Mixin caching the rendered page once per role and query string.
+    Parts that differ between users of a role, the greeting and CSRF
+    tokens, are wrapped in {% nocache %} and rendered on every request.
+    The page is dropped when one of page_cache_tags is invalidated.
+    """
+    page_cache_tags = ()
+    # Requests with other query parameters are not cached, so the number of keys stays bounded
+    page_cache_params = ("page",)
+    cache_timeout = 600
+
+    def get_page_cache_key(self, request) -> Optional[str]:
+        if any(param not in self.page_cache_params for param in request.GET):
+            return None
+        query = urlencode(sorted(request.GET.lists()), doseq=True)
+        location = hashlib.sha256(f"{request.path}?{query}".encode()).hexdigest()[:32]
+        role = get_user_role(request.user)
+        return f"page:{self.__class__.__name__}:{role}:{location}:{get_tags_version(self.page_cache_tags)}"
+
+    def get_context_data(self, **kwargs) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        context["page_cache_render"] = getattr(self, "page_cache_render", False)
+        return context
+
+    def render_page(self, request, *args, **kwargs) -> Optional[Tuple[str, str]]:
+        self.page_cache_render = True
+        response = super().get(request, *args, **kwargs)
+        if response.status_code != 200:
+            return None
+        response.render()
+        return response.content.decode(response.charset), response["Content-Type"]
+
+    def get(self, request, *args, **kwargs):
+        cache_key = self.get_page_cache_key(request)
+        if cache_key is None:
+            return super().get(request, *args, **kwargs)
+        page = self.get_cached_data(cache_key, lambda: self.render_page(request, *args, **kwargs))
+        if page is None:
+            self.page_cache_render = False
+            return super().get(request, *args, **kwargs)
+
+        content, content_type = page
+        content = NOCACHE_PATTERN.sub(
+            lambda match: render_to_string(match.group(1), request=request), content
+        )
+        response = HttpResponse(content, content_type=content_type)
+        patch_vary_headers(response, ("Cookie",))
+        return response
+
+
 class LoggingMixin:
     """Mixin for enhanced logging functionality"""
     
@@ -15,6 +15,7 @@ class News(models.Model):
     summary = models.TextField()
     image = models.ImageField(upload_to="news/", blank=True)
     created = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "News"
@@ -29,6 +30,7 @@ class FAQ(models.Model):
     question = models.CharField(max_length=100)
     answer = models.TextField()
     added_date = models.DateField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.question
@@ -49,6 +51,7 @@ class Contact(models.Model):
         ],
     )
     email = models.EmailField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -62,6 +65,7 @@ class Vacancy(models.Model):
     position = models.CharField(max_length=100)
     salary = models.IntegerField()
     description = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.position
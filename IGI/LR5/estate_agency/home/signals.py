@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from catalog.models import Property, PropertyService
+from .mixins import invalidate_cache_version, invalidate_tags
+from .models import FAQ, AboutCompany, Contact, News
+from .views import HomePageView
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+@receiver(post_save, sender=PropertyService)
+@receiver(post_delete, sender=PropertyService)
+def invalidate_homepage(sender, instance, **kwargs):
+    invalidate_cache_version(HomePageView.cache_key)
+
+
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+@receiver(post_save, sender=FAQ)
+@receiver(post_delete, sender=FAQ)
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+@receiver(post_save, sender=AboutCompany)
+@receiver(post_delete, sender=AboutCompany)
+def invalidate_page_tags(sender, instance, **kwargs):
+    invalidate_tags(sender._meta.label_lower)
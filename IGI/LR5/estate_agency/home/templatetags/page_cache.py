@@ -0,0 +1,80 @@
+import hashlib
+
+from django import template
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from ..mixins import NOCACHE_MARKER, NOCACHE_PATTERN, get_tags_version, get_user_role
+
+register = template.Library()
+
+FRAGMENT_TIMEOUT = 600
+
+
+@register.simple_tag(takes_context=True)
+def nocache(context, template_name):
+    """
+    Include a template that differs between users of a role. In a page
+    rendered for RolePageCacheMixin only a marker is left, and the
+    template is rendered with the request of every response.
+    """
+    marker = NOCACHE_MARKER.format(template_name)
+    if not NOCACHE_PATTERN.fullmatch(marker):
+        raise template.TemplateSyntaxError(f"nocache can't include {template_name!r}")
+    if context.get("page_cache_render"):
+        return mark_safe(marker)
+    return context.template.engine.get_template(template_name).render(context)
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, tags, timeout, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.tags = tags
+        self.timeout = timeout
+        self.vary_on = vary_on
+
+    def get_cache_key(self, context):
+        tags = self.tags.resolve(context).split() if self.tags else ()
+        vary_on = "|".join(str(var.resolve(context)) for var in self.vary_on)
+        digest = hashlib.sha256(vary_on.encode()).hexdigest()[:32]
+        role = get_user_role(context.get("user"))
+        return f"fragment:{self.name.resolve(context)}:{role}:{digest}:{get_tags_version(tags)}"
+
+    def render(self, context):
+        cache_key = self.get_cache_key(context)
+        content = cache.get(cache_key)
+        if content is None:
+            content = self.nodelist.render(context)
+            timeout = self.timeout.resolve(context) if self.timeout else FRAGMENT_TIMEOUT
+            cache.set(cache_key, content, int(timeout))
+        return content
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    Cache a block once per role and per value of the vary_on arguments
+    until one of the tags, model labels separated by spaces, is invalidated:
+
+        {% cachefragment "name" tags="home.news home.faq" timeout=600 page_obj.number %}
+            ...
+        {% endcachefragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"{bits[0]} tag requires a fragment name")
+    nodelist = parser.parse(("endcachefragment",))
+    parser.delete_first_token()
+
+    options = {"tags": None, "timeout": None}
+    vary_on = []
+    for bit in bits[2:]:
+        option, _, value = bit.partition("=")
+        if value and option in options:
+            options[option] = parser.compile_filter(value)
+        else:
+            vary_on.append(parser.compile_filter(bit))
+    return FragmentCacheNode(
+        nodelist, parser.compile_filter(bits[1]), options["tags"], options["timeout"], vary_on
+    )
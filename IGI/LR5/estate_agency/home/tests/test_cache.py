@@ -0,0 +1,351 @@
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from catalog.models import Property, PropertyService, ServiceType
+from ..mixins import CacheMixin, cache_stats, get_user_role, invalidate_tags, revalidation_pool
+from ..models import FAQ, AboutCompany, News
+from ..views import ContactListView, NewsListView, ServicesView, VacancyListView
+
+
+class HomePageCacheTest(TestCase):
+    """Test suite for the cached home page data"""
+
+    def setUp(self):
+        cache.clear()
+        self.service = PropertyService.objects.create(
+            title="Аренда", service_type=ServiceType.objects.create(title="Test Type"), service_fee=Decimal('100.00')
+        )
+        self.properties = [
+            Property.objects.create(
+                price=Decimal(price),
+                square_meters=Decimal('50.00'),
+                property_type=self.service,
+                details="Test property",
+                location=f"Test Location {price}",
+            )
+            for price in [1000, 2000]
+        ]
+
+    def get(self):
+        return self.client.get(reverse("home:home"))
+
+    def test_warm_hit_runs_no_queries(self):
+        """Test a cached home page renders evaluated data without touching the database"""
+        self.get()
+        with self.assertNumQueries(0):
+            response = self.get()
+        featured = response.context["featured_properties"]
+        self.assertIsInstance(featured, list)
+        self.assertEqual([prop["id"] for prop in featured], [prop.pk for prop in reversed(self.properties)])
+        self.assertEqual(response.context["services"], [
+            {"id": self.service.pk, "title": "Аренда", "property_count": 2}
+        ])
+        self.assertContains(response, "Test Location 2000")
+
+    def test_property_changes_invalidate(self):
+        """Test saving or deleting a property or service shows up on the next request"""
+        self.get()
+        prop = Property.objects.create(
+            price=Decimal('3000.00'),
+            square_meters=Decimal('50.00'),
+            property_type=self.service,
+            details="Test property",
+            location="New Location",
+        )
+        self.assertEqual(self.get().context["featured_properties"][0]["id"], prop.pk)
+
+        prop.delete()
+        self.assertEqual(self.get().context["services"][0]["property_count"], 2)
+
+        self.service.title = "Продажа"
+        self.service.save()
+        self.assertEqual(self.get().context["services"][0]["title"], "Продажа")
+
+
+class CacheMixinTest(TestCase):
+    """Test suite for stampede protection in CacheMixin"""
+
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+        self.view = CacheMixin()
+        self.calls = 0
+
+    def compute(self, value="fresh", delay=0.0):
+        def data_func():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return data_func
+
+    def expire(self, key, value="stale", delta=0.0):
+        cache.set(key, (value, time.time() - 1, delta))
+
+    def test_concurrent_misses_compute_once(self):
+        """Test concurrent requests for a missing key share one computation"""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.view.get_cached_data("key", self.compute(delay=0.2))
+            ))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["fresh"] * 8)
+        self.assertEqual(self.calls, 1)
+        stats = cache_stats.stats()["key"]
+        self.assertEqual((stats["misses"], stats["hits"]), (1, 7))
+        self.assertGreaterEqual(stats["max_time"], 0.2)
+
+    def test_waiters_get_stale_value(self):
+        """Test an expired value is served while another request recomputes it"""
+        self.expire("key")
+        cache.add("key:lock", "other", 30)
+        self.assertEqual(self.view.get_cached_data("key", self.compute()), "stale")
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(cache_stats.stats()["key"]["stale_hits"], 1)
+
+        cache.delete("key:lock")
+        self.assertEqual(self.view.get_cached_data("key", self.compute()), "fresh")
+        self.assertIsNone(cache.get("key:lock"))
+
+    def test_early_refresh(self):
+        """Test a slow value is refreshed before it expires and a fast one is not"""
+        cache.set("slow", ("old", time.time() + 60, 10 ** 9))
+        cache.set("fast", ("old", time.time() + 60, 0.001))
+        self.assertEqual(self.view.get_cached_data("slow", self.compute()), "fresh")
+        self.assertEqual(self.view.get_cached_data("fast", self.compute()), "old")
+
+        self.view.early_refresh_beta = 0
+        cache.set("slow", ("old", time.time() + 60, 10 ** 9))
+        self.assertEqual(self.view.get_cached_data("slow", self.compute()), "old")
+
+    def test_invalidate_cache(self):
+        """Test invalidation retires plain and versioned entries"""
+        for versioned in (False, True):
+            self.view.get_cached_data("key", self.compute("old"), versioned=versioned)
+            self.view.invalidate_cache("key")
+            self.assertEqual(self.view.get_cached_data("key", self.compute(), versioned=versioned), "fresh")
+
+    def test_stale_while_revalidate(self):
+        """Test the stale value is returned at once and replaced in the background"""
+        self.view.stale_while_revalidate = True
+        self.expire("key")
+        with mock.patch.object(revalidation_pool, "workers", 0):
+            self.assertEqual(self.view.get_cached_data("key", self.compute()), "stale")
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.view.get_cached_data("key", self.compute()), "fresh")
+        self.assertEqual(self.calls, 1)
+
+
+class ConditionalGetTest(TestCase):
+    """Test suite for ETag and Last-Modified on content pages"""
+
+    def setUp(self):
+        cache.clear()
+        self.news = News.objects.create(title="Test News", summary="Content")
+        self.faq = FAQ.objects.create(question="Test Q", answer="Test A")
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_unchanged_page_is_not_modified(self):
+        """Test a matching ETag or date gets 304 and the page is cacheable by proxies"""
+        url = reverse("home:news_list")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "public, max-age=300")
+
+        with self.assertNumQueries(1):
+            not_modified = self.revalidate(url, response)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+        not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_changes_give_new_etag(self):
+        """Test added, edited and deleted rows all change the ETag"""
+        url = reverse("home:faq")
+        response = self.client.get(url)
+
+        FAQ.objects.create(question="Second Q", answer="Second A")
+        changed = self.revalidate(url, response)
+        self.assertEqual(changed.status_code, 200)
+
+        # An edit leaves count and id as they were and moves updated_at
+        self.faq.answer = "New A"
+        self.faq.save()
+        edited = self.revalidate(url, changed)
+        self.assertEqual(edited.status_code, 200)
+        self.assertContains(edited, "New A")
+
+        self.faq.delete()
+        self.assertEqual(self.revalidate(url, edited).status_code, 200)
+
+    def test_empty_tables(self):
+        """Test pages over empty tables get an ETag and no Last-Modified"""
+        News.objects.all().delete()
+        FAQ.objects.all().delete()
+        for name in ("home:news_list", "home:faq", "home:review_list"):
+            with self.subTest(page=name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("ETag", response)
+                self.assertNotIn("Last-Modified", response)
+        self.assertEqual(self.client.get(reverse("home:news_detail", args=[self.news.pk])).status_code, 404)
+        # Not routed, and Contact has no list template
+        for view_class in (ContactListView, VacancyListView):
+            with self.subTest(view=view_class.__name__):
+                view = view_class()
+                view.request = mock.Mock(user=AnonymousUser())
+                self.assertIsNone(view.get_fingerprint()[1])
+
+    def test_etag_survives_cache_clear(self):
+        """Test an evicted or restarted cache leaves unchanged pages not modified"""
+        url = reverse("home:faq")
+        response = self.client.get(url)
+        cache.clear()
+        not_modified = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response["ETag"], HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_signed_in_pages_are_private(self):
+        """Test pages of a signed-in user are not shared with others"""
+        url = reverse("home:news_list")
+        anonymous = self.client.get(url)
+        request = RequestFactory().get(url)
+        request.user = mock.Mock(pk=1, is_authenticated=True)
+        response = NewsListView.as_view()(request)
+        self.assertNotEqual(response["ETag"], anonymous["ETag"])
+        self.assertIn("private", response["Cache-Control"])
+
+        request = RequestFactory().get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        request.user = mock.Mock(pk=1, is_authenticated=True)
+        self.assertEqual(NewsListView.as_view()(request).status_code, 304)
+
+
+class RolePageCacheTest(TestCase):
+    """Test suite for pages and fragments cached per role"""
+
+    def setUp(self):
+        cache.clear()
+        self.about = AboutCompany.objects.create(text="About us")
+        self.news = News.objects.create(title="Test News", summary="Content")
+
+    def signed_in(self, url, role="client", name="Anna"):
+        request = RequestFactory().get(url)
+        request.user = mock.Mock(pk=1, is_authenticated=True, first_name=name, profile=mock.Mock(id=1))
+        # Only the profile of the role is set
+        for profile in ("client", "employee"):
+            if profile != role:
+                delattr(request.user, profile)
+        return request
+
+    def test_roles(self):
+        """Test users are mapped to the role their pages are cached for"""
+        self.assertEqual(get_user_role(mock.Mock(is_authenticated=False)), "anonymous")
+        self.assertEqual(get_user_role(self.signed_in("/").user), "client")
+        self.assertEqual(get_user_role(self.signed_in("/", role="employee").user), "employee")
+        self.assertEqual(get_user_role(self.signed_in("/", role="user").user), "user")
+
+    def test_nav_per_role(self):
+        """Test the cached navigation links the dashboard of the user's profile only"""
+        url = reverse("home:services")
+        links = {
+            "anonymous": None,
+            "user": None,
+            "client": "Личный кабинет клиента",
+            "employee": "Личный кабинет сотрудника",
+        }
+        for role, link in links.items():
+            with self.subTest(role=role):
+                request = self.signed_in(url, role=role)
+                if role == "anonymous":
+                    request.user = AnonymousUser()
+                response = ServicesView.as_view()(request)
+                if link:
+                    self.assertContains(response, link)
+                    self.assertContains(response, "Личный кабинет", count=1)
+                else:
+                    self.assertNotContains(response, "Личный кабинет")
+
+    def test_warm_page_runs_no_queries(self):
+        """Test a cached page is served without the database until a tag changes"""
+        url = reverse("home:about")
+        self.assertContains(self.client.get(url), "About us")
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "About us")
+        self.assertIn("Cookie", response["Vary"])
+
+        self.about.text = "New text"
+        self.about.save()
+        self.assertContains(self.client.get(url), "New text")
+
+        News.objects.create(title="Second News", summary="Content")
+        self.assertContains(self.client.get(reverse("home:services")), "Second News")
+
+    def test_query_string(self):
+        """Test pages vary on the page number and other parameters are not cached"""
+        News.objects.bulk_create(News(title=f"News {i}", summary="Content") for i in range(3))
+        url = reverse("home:services")
+        self.client.get(url)
+        self.client.get(url, {"page": 2})
+        with self.assertNumQueries(0):
+            first, second = self.client.get(url), self.client.get(url, {"page": 2})
+        self.assertContains(first, "News 2")
+        self.assertContains(second, "Test News")
+        self.assertNotContains(second, "News 2")
+        with self.assertNumQueries(2):
+            self.client.get(url, {"utm_source": "mail"})
+
+    def test_roles_share_page_not_greeting(self):
+        """Test users of a role share the page while the greeting stays their own"""
+        url = reverse("home:services")
+        anonymous = self.client.get(url)
+        anna = ServicesView.as_view()(self.signed_in(url))
+        boris = ServicesView.as_view()(self.signed_in(url, name="Boris"))
+        self.assertContains(anonymous, "Вход")
+        self.assertNotContains(anonymous, "Личный кабинет")
+        self.assertContains(anna, "Привет")
+        self.assertContains(anna, "Anna")
+        self.assertContains(boris, "Boris")
+        self.assertNotContains(boris, "Anna")
+        self.assertContains(boris, "Личный кабинет клиента")
+        employee = ServicesView.as_view()(self.signed_in(url, role="employee"))
+        self.assertContains(employee, "Личный кабинет сотрудника")
+
+    def test_csrf_token_is_not_shared(self):
+        """Test every visitor of a cached form page gets a token of their own"""
+        url = reverse("home:contact")
+        first = self.client.get(url)
+        self.client.cookies.clear()
+        second = self.client.get(url)
+        self.assertContains(second, "csrfmiddlewaretoken")
+        self.assertNotEqual(
+            first.cookies["csrftoken"].value, second.cookies["csrftoken"].value
+        )
+
+    def test_fragment_tags(self):
+        """Test a fragment is kept per role and vary_on value until its tag is invalidated"""
+        template = Template(
+            '{% load page_cache %}{% cachefragment "test" tags="home.news" number %}{{ value }}{% endcachefragment %}'
+        )
+        render = lambda value, number=1: template.render(Context({"value": value, "number": number}))
+        self.assertEqual(render("first"), "first")
+        self.assertEqual(render("second"), "first")
+        self.assertEqual(render("second", number=2), "second")
+        invalidate_tags("home.news")
+        self.assertEqual(render("second"), "second")
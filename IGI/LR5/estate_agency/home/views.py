@@ -1,51 +1,54 @@
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView, DetailView
 from django.shortcuts import render
-from django.db.models import Count, Q, Prefetch
-from django.core.cache import cache
-from django.conf import settings
+from django.db.models import Count
 from django.contrib import messages
 
 from .forms import ReviewForm
 from .models import AboutCompany, FAQ, Vacancy, Contact, PromoCode, Review, News, Policy
-from catalog.models import Property, PropertyService, PropertyInquiry
-from .mixins import CacheMixin, LoggingMixin
+from catalog.models import Property, PropertyService
+from .mixins import CacheMixin, ConditionalGetMixin, LoggingMixin, RolePageCacheMixin
 
 logger = logging.getLogger(__name__)
 
-class BaseViewMixin:
-    """Base mixin for common view functionality"""
-    def get_cached_data(self, cache_key: str, data_func, timeout: int = 300) -> Any:
-        cached_data = cache.get(cache_key)
-        if cached_data is None:
-            cached_data = data_func()
-            cache.set(cache_key, cached_data, timeout)
-        return cached_data
-
 class HomePageView(CacheMixin, TemplateView):
     template_name = "home.html"
     cache_timeout = 300
+    # Bumped by home.signals whenever a property or service changes
+    cache_key = 'homepage_data'
 
     def get_context_data(self, **kwargs) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        
+
+        # Plain values only: a cached QuerySet would run its query again on every render
         def get_featured_data():
             return {
-                'featured_properties': Property.objects.select_related(
-                    'property_type'
-                ).prefetch_related(
-                    Prefetch('propertyinquiry_set', queryset=PropertyInquiry.objects.select_related('client'))
-                ).order_by('-id')[:6],
-                'services': PropertyService.objects.annotate(
-                    property_count=Count('property', filter=Q(property__isnull=False))
-                ).order_by('-property_count')[:4]
+                'featured_properties': [
+                    {
+                        'id': prop.pk,
+                        'location': prop.location,
+                        'price': prop.price,
+                        'square_meters': prop.square_meters,
+                        'service': str(prop.property_type) if prop.property_type else None,
+                        'photo_url': prop.get_photo_url(),
+                        'url': reverse('catalog:property_detail', args=[prop.pk]),
+                    }
+                    for prop in Property.objects.select_related(
+                        'property_type__service_type'
+                    ).order_by('-id')[:6]
+                ],
+                'services': list(
+                    PropertyService.objects.annotate(
+                        property_count=Count('property')
+                    ).order_by('-property_count', 'title').values('id', 'title', 'property_count')[:4]
+                ),
             }
-        
-        context.update(self.get_cached_data('homepage_data', get_featured_data))
+
+        context.update(self.get_cached_data(self.cache_key, get_featured_data, versioned=True))
         return context
 
 class DashboardView(LoggingMixin, LoginRequiredMixin, TemplateView):
@@ -96,8 +99,10 @@ class ContentListView(ListView):
     def get_queryset(self):
         return super().get_queryset()
 
-class NewsListView(ContentListView):
+class NewsListView(ConditionalGetMixin, ContentListView):
     model = News
+    conditional_models = [News]
+    cache_max_age = 300
     template_name = "news_list.html"
     context_object_name = 'news_list'
     paginate_by = 10
@@ -105,18 +110,26 @@ class NewsListView(ContentListView):
     def get_queryset(self):
         return super().get_queryset().order_by('-created')
 
-class NewsDetailView(DetailView):
+class NewsDetailView(ConditionalGetMixin, DetailView):
     model = News
+    conditional_models = [News]
+    cache_max_age = 300
     template_name = 'home/news_detail.html'
     context_object_name = 'news'
 
-class FAQView(ListView):
+class FAQView(ConditionalGetMixin, RolePageCacheMixin, ListView):
     model = FAQ
+    conditional_models = [FAQ]
+    page_cache_tags = ("home.faq",)
+    cache_max_age = 60 * 60
     template_name = "faq.html"
     context_object_name = "faq_list"
 
-class ContactListView(ContentListView):
+class ContactListView(ConditionalGetMixin, RolePageCacheMixin, ContentListView):
     model = Contact
+    conditional_models = [Contact]
+    page_cache_tags = ("home.contact",)
+    cache_max_age = 60 * 60
     template_name = "contact_list.html"
     paginate_by = None
 
@@ -125,8 +138,10 @@ class PolicyView(ContentListView):
     template_name = "policy.html"
     paginate_by = None
 
-class VacancyListView(ContentListView):
+class VacancyListView(ConditionalGetMixin, ContentListView):
     model = Vacancy
+    conditional_models = [Vacancy]
+    cache_max_age = 600
     template_name = "vacancy_list.html"
 
 class PromoCodeView(CacheMixin, ContentListView):
@@ -138,16 +153,18 @@ class PromoCodeView(CacheMixin, ContentListView):
         context = super().get_context_data(**kwargs)
         
         def get_promo_data():
+            # Evaluated here, a cached QuerySet would be queried again on every render
             return {
-                "active_promos": PromoCode.objects.filter(status=True),
-                "archived_promos": PromoCode.objects.filter(status=False)
+                "active_promos": list(PromoCode.objects.filter(status=True)),
+                "archived_promos": list(PromoCode.objects.filter(status=False))
             }
         
         context.update(self.get_cached_data('promo_data', get_promo_data))
         return context
 
-class ReviewListView(ContentListView):
+class ReviewListView(ConditionalGetMixin, ContentListView):
     model = Review
+    conditional_models = [Review]
     template_name = "review_list.html"
     context_object_name = 'reviews'
     paginate_by = 10
@@ -202,26 +219,34 @@ class DeleteReviewView(ReviewActionMixin, DeleteView):
     def get(self, request, *args, **kwargs):
         return self.post(request, *args, **kwargs)
 
-class AboutView(ListView):
+class AboutView(RolePageCacheMixin, ListView):
     model = News
     template_name = 'about.html'
     context_object_name = 'news_list'
     ordering = ['-created']
     paginate_by = 3
+    page_cache_tags = ("home.news", "home.aboutcompany")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["about_info"] = AboutCompany.objects.first()
+        return context
 
-class ContactView(ListView):
+class ContactView(RolePageCacheMixin, ListView):
     model = News
     template_name = 'contact.html'
     context_object_name = 'news_list'
     ordering = ['-created']
     paginate_by = 3
+    page_cache_tags = ("home.news",)
 
-class ServicesView(ListView):
+class ServicesView(RolePageCacheMixin, ListView):
     model = News
     template_name = 'services.html'
     context_object_name = 'news_list'
     ordering = ['-created']
     paginate_by = 3
+    page_cache_tags = ("home.news",)
 
 class ReviewCreateView(LoginRequiredMixin, CreateView):
     model = Review
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:45
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_active_inquiries(apps, schema_editor):
+    Employee = apps.get_model('users', 'Employee')
+    employees = Employee.objects.annotate(
+        active=Count('propertyinquiry', filter=Q(propertyinquiry__state__in=['pending', 'processing']))
+    ).filter(active__gt=0)
+    for employee in employees:
+        Employee.objects.filter(pk=employee.pk).update(active_inquiry_count=employee.active)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('catalog', '0008_staticmaptile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='active_inquiry_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['active_inquiry_count', 'id'], name='users_emplo_active__440c61_idx'),
+        ),
+        migrations.RunPython(count_active_inquiries, migrations.RunPython.noop),
+    ]
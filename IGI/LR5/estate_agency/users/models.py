@@ -104,6 +104,11 @@ class Employee(BaseProfile):
         blank=True,
         validators=[MinValueValidator(0), MaxValueValidator(5)]
     )
+    # Maintained by catalog signals on inquiry writes, see reconcile_inquiry_counts
+    active_inquiry_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["active_inquiry_count", "id"])]
     
     def get_experience_years(self) -> int:
         """Calculate years of experience"""
@@ -1,14 +1,21 @@
+import logging
+
 import pytz
 import requests
 
+from estate_agency.http_client import http_client
+
+logger = logging.getLogger(__name__)
+
 class TimezoneService:
     @staticmethod
     def get_timezone_from_ip(ip):
         try:
-            response = requests.get(f"http://ip-api.com/json/{ip}", timeout=3)
+            response = http_client.get(f"http://ip-api.com/json/{ip}", timeout=3)
             tz = response.json().get('timezone')
             return pytz.timezone(tz) if tz else pytz.timezone('UTC')
-        except:
+        except (requests.RequestException, ValueError, AttributeError, TypeError, pytz.UnknownTimeZoneError) as e:
+            logger.warning(f"Could not resolve timezone for {ip}: {str(e)}")
             return pytz.timezone('UTC')
 
     @staticmethod